@@ -5,13 +5,56 @@
 """
 
 import base64
+import gzip
+import hashlib
+import io
 import json
 import os
 import re
+import shlex
 import subprocess
 import sys
+import tarfile
+import threading
 import time
-from typing import Optional, Tuple
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from disk_category_map import (
+    load_disk_category_map,
+    save_disk_category_map,
+    record_disk_categories,
+    get_supported_disk_categories,
+    is_disk_category_error,
+    is_disk_category_rejected,
+)
+
+# 镜像清单格式版本（清单字段变化时递增，使旧镜像的版本哈希失效）
+MANIFEST_SCHEMA = 1
+
+# User Data 原始数据上限
+USER_DATA_LIMIT = 32 * 1024
+
+# 热点文件列表写入 User Data 后的大小上限（gzip + base64）
+# 基础脚本约 15KB，与构建上下文预算合计不超过 16KB，两者同时嵌入仍在 32KB 以内
+PREWARM_LIST_BUDGET = 8192
+
+# 多架构模式支持的架构
+SUPPORTED_ARCHES = ("amd64", "arm64")
+
+# 多架构模式下各架构子进程共用的日志输出锁
+LOG_LOCK = threading.Lock()
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(SCRIPTS_DIR))
+
+# 预热 Docker 构建缓存时写入 User Data 的构建上下文（项目 Dockerfile 及其 COPY 的配置）
+BUILD_CONTEXT_FILES = ("Dockerfile", "nginx.conf", "nginx.vh.default.conf")
+
+# 构建上下文写入 User Data 后的大小上限（tar + gzip + base64）
+BUILD_CONTEXT_BUDGET = 8192
 
 
 def error_exit(message: str) -> None:
@@ -28,8 +71,193 @@ def get_env_var(name: str, default: Optional[str] = None) -> str:
     return value
 
 
-def create_user_data_script(arch: str) -> str:
-    """创建 User Data 脚本，用于安装预装工具"""
+def load_prewarm_list(list_file: Optional[str]) -> str:
+    """读取 record-hot-files.py 记录的热点文件列表，按驻留字节数取前若干个路径，
+    返回不超过 PREWARM_LIST_BUDGET 的 gzip + base64 编码（列表不存在时返回空字符串）"""
+    if not list_file or not os.path.isfile(list_file):
+        return ""
+    with open(list_file, "r", encoding="utf-8") as f:
+        paths = [line.rstrip("\n").split("\t", 1)[-1] for line in f if line.strip()]
+
+    def encode(count: int) -> str:
+        # 按路径排序，预热时读取顺序更接近磁盘布局，也便于压缩
+        data = "\n".join(sorted(paths[:count])) + "\n"
+        return base64.b64encode(gzip.compress(data.encode("utf-8"))).decode("ascii")
+
+    # 二分查找预算内能容纳的最多文件数
+    low, high = 0, len(paths)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if len(encode(mid)) <= PREWARM_LIST_BUDGET:
+            low = mid
+        else:
+            high = mid - 1
+    if low == 0:
+        return ""
+    print(
+        f"Embedding {low}/{len(paths)} hot files into the prewarm list",
+        file=sys.stderr,
+    )
+    return encode(low)
+
+
+def load_build_context() -> str:
+    """将项目 Dockerfile 及配置打包为 tar + gzip + base64，超出 BUILD_CONTEXT_BUDGET
+    或文件缺失时返回空字符串（不预热构建缓存）
+
+    打包结果固定文件元数据和 gzip 时间戳，内容不变时编码不变，不影响版本哈希"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name in BUILD_CONTEXT_FILES:
+            path = os.path.join(REPO_ROOT, name)
+            if not os.path.isfile(path):
+                print(
+                    f"Warning: {name} not found, skipping Docker cache prewarm",
+                    file=sys.stderr,
+                )
+                return ""
+            with open(path, "rb") as f:
+                data = f.read()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+
+    encoded = base64.b64encode(gzip.compress(buffer.getvalue(), mtime=0)).decode(
+        "ascii"
+    )
+    if len(encoded) > BUILD_CONTEXT_BUDGET:
+        print(
+            f"Warning: Build context is {len(encoded)} bytes encoded "
+            f"(budget {BUILD_CONTEXT_BUDGET}), skipping Docker cache prewarm",
+            file=sys.stderr,
+        )
+        return ""
+    print(
+        f"Embedding build context ({len(encoded)} bytes encoded) "
+        "for Docker cache prewarm",
+        file=sys.stderr,
+    )
+    return encoded
+
+
+def get_latest_release_tag(repository: str) -> Optional[str]:
+    """查询 GitHub 仓库最新 release 的 tag，失败时返回 None"""
+    headers = {
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    request = urllib.request.Request(
+        f"https://api.github.com/repos/{repository}/releases/latest", headers=headers
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode("utf-8")).get("tag_name") or None
+    except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+        print(
+            f"Warning: Failed to query latest {repository} release: {e}",
+            file=sys.stderr,
+        )
+        return None
+
+
+def resolve_tool_versions() -> Dict[str, str]:
+    """
+    解析预装工具版本（环境变量优先，其次 GitHub 最新 release）
+
+    解析结果写入 User Data 并计入版本哈希，构建实例不再自行查询最新版本；
+    查询失败的工具值为空，由构建实例在运行时查询（此时版本不计入哈希）
+    """
+    aliyun_cli = os.environ.get("ALIYUN_CLI_VERSION") or (
+        get_latest_release_tag("aliyun/aliyun-cli") or ""
+    )
+    advisor = os.environ.get("ADVISOR_VERSION") or (
+        get_latest_release_tag("maskshell/spot-instance-advisor") or ""
+    )
+    return {
+        "aliyun_cli": aliyun_cli.lstrip("v"),
+        "advisor": advisor,
+        "runner": os.environ.get("RUNNER_VERSION", "2.311.0"),
+    }
+
+
+def build_image_manifest(
+    arch: str, base_image_info: dict, tool_versions: Dict[str, str], user_data: str
+) -> str:
+    """生成镜像清单（规范化 JSON），包含决定镜像内容的全部输入
+
+    user_data 应为不含热点文件列表的渲染结果：列表每次采样都会变化，只影响预热
+    而不影响镜像内容；查询失败的工具版本不计入清单"""
+    manifest = {
+        "schema": MANIFEST_SCHEMA,
+        "architecture": arch,
+        "base_image": {
+            "id": base_image_info["ImageId"],
+            "creation_time": base_image_info.get("CreationTime", ""),
+        },
+        "tool_versions": {
+            tool: version for tool, version in tool_versions.items() if version
+        },
+        "user_data_sha256": hashlib.sha256(user_data.encode("utf-8")).hexdigest(),
+    }
+    return json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+
+
+def format_tool_versions(tool_versions: Dict[str, str]) -> str:
+    """将已解析的工具版本格式化为镜像标签值（tool=version，逗号分隔）"""
+    return ",".join(
+        f"{tool}={version}"
+        for tool, version in sorted(tool_versions.items())
+        if version
+    )
+
+
+def find_matching_version_hash(
+    region_id: str, image_name: str, content_hash: str, tool_versions: Dict[str, str]
+) -> Optional[str]:
+    """
+    部分工具版本未解析时，查找内容哈希相同、已解析的工具版本一致的 -latest 镜像，
+    返回其版本哈希（未找到时返回 None）
+    """
+    for image in list_images_by_name(region_id, image_name):
+        # ImageName 为模糊匹配，重命名后的历史镜像不视为当前版本
+        if image.get("ImageName") != image_name:
+            continue
+        tags = {
+            tag.get("TagKey"): tag.get("TagValue", "")
+            for tag in image.get("Tags", {}).get("Tag", [])
+        }
+        if tags.get("ContentHash") != content_hash or not tags.get("VersionHash"):
+            continue
+        image_versions = dict(
+            item.split("=", 1)
+            for item in tags.get("ToolVersions", "").split(",")
+            if "=" in item
+        )
+        if all(
+            image_versions.get(tool) == version
+            for tool, version in tool_versions.items()
+            if version
+        ):
+            print(
+                f"Image {image.get('ImageId')} matches the resolved tool versions "
+                "and content",
+                file=sys.stderr,
+            )
+            return tags["VersionHash"]
+    return None
+
+
+def create_user_data_script(
+    arch: str,
+    prewarm_list_b64: str = "",
+    tool_versions: Optional[Dict[str, str]] = None,
+    build_context_b64: str = "",
+    build_args: Optional[List[str]] = None,
+) -> str:
+    """创建 User Data 脚本，用于安装预装工具（提供构建上下文时预热 Docker 构建缓存）"""
     # 检测架构
     if arch.lower() == "amd64":
         runner_arch = "x64"
@@ -41,8 +269,13 @@ def create_user_data_script(arch: str) -> str:
         error_exit(f"Unsupported architecture: {arch}")
 
     # 获取工具版本（从环境变量或使用最新）
-    runner_version = os.environ.get("RUNNER_VERSION", "2.311.0")
-    advisor_version = os.environ.get("ADVISOR_VERSION", "")
+    tool_versions = tool_versions or resolve_tool_versions()
+    runner_version = tool_versions["runner"]
+    advisor_version = tool_versions["advisor"]
+    aliyun_cli_version = tool_versions["aliyun_cli"]
+    build_arg_options = " ".join(
+        f"--build-arg {shlex.quote(arg)}" for arg in (build_args or [])
+    )
 
     script = f"""#!/bin/bash
 set -euo pipefail
@@ -55,19 +288,42 @@ echo "=== Image Build Script Started ==="
 echo "Timestamp: $(date -u +%Y-%m-%dT%H:%M:%SZ)"
 echo "Architecture: {arch}"
 
+# 构建状态文件（/run 为 tmpfs，不会进入镜像），编排脚本通过云助手读取
+# 失败时由 EXIT trap 写入退出码，成功时在构建完成后写入
+BUILD_STATUS_FILE=/run/image-build.status
+FAILED_LINE=""
+trap 'FAILED_LINE=${{LINENO}}' ERR
+trap 'rc=$?; if [[ $rc -ne 0 ]]; then printf "status=failed\\nexit_code=%d\\nline=%s\\n" "$rc" "${{FAILED_LINE}}" > "${{BUILD_STATUS_FILE}}"; fi' EXIT
+
+# 构建阶段计时，写入 /opt/image-build-report.json（随镜像保留，Runner 启动报告会引用）
+BUILD_START=$(date +%s)
+BUILD_PHASE_START=${{BUILD_START}}
+BUILD_PHASES=""
+mark_phase() {{
+  local now
+  now=$(date +%s)
+  BUILD_PHASES+=$(printf '{{"name": "%s", "duration": %d}},' "$1" "$((now - BUILD_PHASE_START))")
+  BUILD_PHASE_START=${{now}}
+}}
+
 # 更新系统
 echo "=== Updating system ==="
 apt-get update -y
 apt-get install -y curl wget git jq
+mark_phase system_update
 
 # 安装 Aliyun CLI
 echo "=== Installing Aliyun CLI ==="
-ALIYUN_CLI_VERSION=$(curl -s https://api.github.com/repos/aliyun/aliyun-cli/releases/latest | jq -r '.tag_name' | sed 's/^v//' || echo "3.0.0")
+ALIYUN_CLI_VERSION="{aliyun_cli_version}"
+if [[ -z "${{ALIYUN_CLI_VERSION}}" ]]; then
+  ALIYUN_CLI_VERSION=$(curl -s https://api.github.com/repos/aliyun/aliyun-cli/releases/latest | jq -r '.tag_name' | sed 's/^v//' || echo "3.0.0")
+fi
 echo "Using Aliyun CLI version: $ALIYUN_CLI_VERSION"
 curl -sSL https://aliyuncli.alicdn.com/aliyun-cli-linux-{advisor_arch}-${{ALIYUN_CLI_VERSION}}.tgz | tar -xz -C /tmp
 mv /tmp/aliyun /usr/local/bin/aliyun
 chmod +x /usr/local/bin/aliyun
 aliyun --version
+mark_phase aliyun_cli
 
 # 安装 spot-instance-advisor
 echo "=== Installing spot-instance-advisor ==="
@@ -83,6 +339,7 @@ ADVISOR_URL="https://github.com/maskshell/spot-instance-advisor/releases/downloa
 curl -L -f -o /usr/local/bin/spot-instance-advisor "${{ADVISOR_URL}}"
 chmod +x /usr/local/bin/spot-instance-advisor
 spot-instance-advisor --version || echo "Warning: Version check failed"
+mark_phase spot_instance_advisor
 
 # 安装 Docker Engine
 echo "=== Installing Docker Engine ==="
@@ -111,6 +368,7 @@ systemctl enable docker
 # 验证 Docker 安装
 docker --version
 docker info
+mark_phase docker
 
 # 配置 Docker Buildx（Docker 20.10+ 自带，但需要创建 builder 实例）
 echo "=== Configuring Docker Buildx ==="
@@ -121,6 +379,21 @@ docker buildx inspect --bootstrap || echo "Warning: Buildx builder setup failed"
 
 # 验证 Buildx
 docker buildx ls
+mark_phase buildx
+
+# 用项目 Dockerfile 构建一次（与 Runner 上的构建使用相同的 builder 和构建参数），
+# 基础镜像、apk 层和 BuildKit 缓存随镜像保留，新 Runner 上的首次构建直接命中缓存
+BUILD_CONTEXT_B64="{build_context_b64}"
+if [[ -n "${{BUILD_CONTEXT_B64}}" ]]; then
+  echo "=== Prewarming Docker build cache ==="
+  mkdir -p /tmp/openresty-build
+  echo "${{BUILD_CONTEXT_B64}}" | base64 -d | tar xz -C /tmp/openresty-build
+  docker buildx build --builder builder {build_arg_options} /tmp/openresty-build \\
+    || echo "Warning: Docker cache prewarm build failed"
+  docker buildx du --builder builder | tail -n 1 || true
+  rm -rf /tmp/openresty-build
+  mark_phase docker_prewarm
+fi
 
 # 安装 GitHub Actions Runner（预装但未配置）
 echo "=== Installing GitHub Actions Runner ==="
@@ -134,6 +407,56 @@ curl -o /tmp/runner.tar.gz -L --retry 5 --retry-all-errors --connect-timeout 10
 tar xzf /tmp/runner.tar.gz -C "${{RUNNER_DIR}}"
 rm /tmp/runner.tar.gz
 echo "Runner installed to ${{RUNNER_DIR}}"
+mark_phase runner_download
+
+# 预装 Runner 依赖（.NET 运行时依赖等），Runner 实例启动时无需再安装
+echo "=== Installing runner dependencies ==="
+"${{RUNNER_DIR}}/bin/installdependencies.sh"
+mark_phase runner_dependencies
+
+# 安装开机预热服务：从镜像快照创建的系统盘按需加载数据块，
+# Runner 注册期间在后台读取热点文件，构建开始时 I/O 不再等待加载
+echo "=== Installing disk prewarm service ==="
+mkdir -p /opt/prewarm
+PREWARM_LIST_B64="{prewarm_list_b64}"
+if [[ -n "${{PREWARM_LIST_B64}}" ]]; then
+  echo "${{PREWARM_LIST_B64}}" | base64 -d | gunzip > /opt/prewarm/hot-files.txt
+  echo "Prewarm list: $(wc -l < /opt/prewarm/hot-files.txt) files"
+fi
+cat > /usr/local/bin/prewarm-disk.sh << 'PREWARM_EOF'
+#!/bin/bash
+# 后台读取热点文件（由参考构建记录）；没有列表时读取 Runner、Docker 和 BuildKit 目录
+LIST=/opt/prewarm/hot-files.txt
+START=$(date +%s)
+if [[ -s "${{LIST}}" ]]; then
+  SOURCE="${{LIST}}"
+  BYTES=$(xargs -d '\\n' -r -P 8 -n 64 cat -- < "${{LIST}}" 2>/dev/null | wc -c)
+else
+  SOURCE="default directories"
+  BYTES=$(find /opt/actions-runner /usr/bin/docker* /usr/libexec/docker /var/lib/docker \\
+    -xdev -type f -print0 2>/dev/null | xargs -0 -r -P 8 -n 64 cat -- 2>/dev/null | wc -c)
+fi
+echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] Prewarmed ${{BYTES}} bytes from ${{SOURCE}} in $(( $(date +%s) - START ))s" >> /var/log/prewarm.log
+PREWARM_EOF
+chmod +x /usr/local/bin/prewarm-disk.sh
+cat > /etc/systemd/system/prewarm-disk.service << 'PREWARM_SERVICE_EOF'
+[Unit]
+Description=Prewarm lazily loaded system disk blocks
+After=local-fs.target
+
+[Service]
+Type=simple
+ExecStart=/usr/local/bin/prewarm-disk.sh
+Nice=10
+IOSchedulingClass=best-effort
+IOSchedulingPriority=7
+
+[Install]
+WantedBy=multi-user.target
+PREWARM_SERVICE_EOF
+# 只在镜像启动的实例上运行，构建实例不启动
+systemctl enable prewarm-disk.service
+mark_phase prewarm_service
 
 # 生成版本信息文件
 echo "=== Generating version info ==="
@@ -141,7 +464,8 @@ VERSION_FILE="/opt/image-version.json"
 # 获取 Docker 和 Buildx 版本
 DOCKER_VERSION=$(docker --version | sed 's/.*version //' | sed 's/,.*//' || echo "unknown")
 BUILDX_VERSION=$(docker buildx version | sed 's/.*v//' || echo "unknown")
-cat > "${{VERSION_FILE}}" << 'VERSION_EOF'
+# 不加引号的 heredoc：展开版本变量（Runner 实例按 runner_version 判断能否跳过安装）
+cat > "${{VERSION_FILE}}" << VERSION_EOF
 {{
   "base_image": "BASE_IMAGE_ID_PLACEHOLDER",
   "base_image_name": "BASE_IMAGE_NAME_PLACEHOLDER",
@@ -149,6 +473,7 @@ cat > "${{VERSION_FILE}}" << 'VERSION_EOF'
   "aliyun_cli_version": "${{ALIYUN_CLI_VERSION}}",
   "advisor_version": "${{ADVISOR_VERSION}}",
   "runner_version": "${{RUNNER_VERSION}}",
+  "runner_dependencies": "installed",
   "docker_version": "${{DOCKER_VERSION}}",
   "buildx_version": "${{BUILDX_VERSION}}",
   "build_timestamp": "$(date -u +%Y-%m-%dT%H:%M:%SZ)",
@@ -161,6 +486,17 @@ sed -i "s|BASE_IMAGE_NAME_PLACEHOLDER|${{BASE_IMAGE_NAME}}|g" "${{VERSION_FILE}}
 sed -i "s|BASE_IMAGE_CREATION_TIME_PLACEHOLDER|${{BASE_IMAGE_CREATION_TIME}}|g" "${{VERSION_FILE}}"
 cat "${{VERSION_FILE}}"
 
+# 写入构建阶段计时报告
+cat > /opt/image-build-report.json << BUILD_REPORT_EOF
+{{
+  "architecture": "{arch}",
+  "build_timestamp": "$(date -u +%Y-%m-%dT%H:%M:%SZ)",
+  "total_duration": $(( $(date +%s) - BUILD_START )),
+  "phases": [${{BUILD_PHASES%,}}]
+}}
+BUILD_REPORT_EOF
+cat /opt/image-build-report.json
+
 # 清理临时文件和日志
 echo "=== Cleaning up temporary files and logs ==="
 
@@ -219,26 +555,33 @@ echo 3 > /proc/sys/vm/drop_caches 2>/dev/null || true
 
 echo "Cleanup completed"
 
-# 创建镜像构建完成标志文件（用于自毁脚本检测）
+# 创建镜像构建完成标志文件（随镜像保留）
 touch /opt/image-build-complete.flag
 echo "Image build completed, ready for image creation" > /opt/image-build-complete.flag
 
 echo "=== Image Build Script Completed ==="
 echo "Timestamp: $(date -u +%Y-%m-%dT%H:%M:%SZ)"
+sync
+printf "status=success\\nexit_code=0\\n" > "${{BUILD_STATUS_FILE}}"
 
-# 安装并配置自毁脚本（等待镜像创建完成后自动删除实例）
+# 安装并配置自毁脚本（镜像快照完成后立即删除实例）
 echo "=== Installing self-destruct mechanism ==="
 
 # 创建自毁脚本
 cat > /usr/local/bin/self-destruct.sh << 'SELF_DESTRUCT_EOF'
 #!/bin/bash
 
-# 实例自毁脚本
-# 在镜像创建完成后自动删除 ECS 实例
-# 使用实例角色（RamRoleName）获取权限进行认证
+# 实例自毁脚本（镜像构建实例）
+# 轮询本实例的快照（由 CreateImage 创建），快照完成后立即删除 ECS 实例
+# 使用实例角色（RamRoleName）逐条命令认证，不写入 aliyun 配置文件（会进入镜像）
 
 set -euo pipefail
 
+# 只在构建实例的本次启动中运行（状态文件位于 tmpfs，不会进入镜像）
+if [[ ! -f /run/image-build.status ]]; then
+    exit 0
+fi
+
 # 日志文件
 LOG_FILE="/var/log/self-destruct.log"
 
@@ -249,89 +592,66 @@ log() {{
 
 log "=== Instance Self-Destruct Script Started ==="
 
-# 等待镜像构建完成标志文件（最多等待 2 小时）
-MAX_WAIT=7200  # 2 小时
-WAIT_INTERVAL=60  # 每分钟检查一次
-ELAPSED=0
-
-log "Waiting for image build to complete..."
-while [[ ! -f /opt/image-build-complete.flag ]] && [[ ${{ELAPSED}} -lt ${{MAX_WAIT}} ]]; do
-    sleep ${{WAIT_INTERVAL}}
-    ELAPSED=$((ELAPSED + WAIT_INTERVAL))
-    log "Still waiting for image build completion... (${{ELAPSED}}s / ${{MAX_WAIT}}s)"
-done
-
-if [[ ! -f /opt/image-build-complete.flag ]]; then
-    log "Warning: Image build completion flag not found after ${{MAX_WAIT}}s, proceeding with self-destruct anyway"
-else
-    log "Image build completion flag found, proceeding with self-destruct"
-fi
-
-# 额外等待一段时间，确保镜像创建完成（从外部脚本触发镜像创建）
-log "Waiting additional 5 minutes for image creation to complete..."
-sleep 300
-
-# 获取实例 ID（通过阿里云元数据服务）
+# 获取实例 ID、地域和实例角色（通过阿里云元数据服务）
 METADATA_URL="http://100.100.100.200/latest/meta-data"
-INSTANCE_ID=$(curl -s --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/instance-id" || echo "")
-REGION_ID=$(curl -s --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/region-id" || echo "")
+INSTANCE_ID=$(curl -sf --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/instance-id" || echo "")
+REGION_ID=$(curl -sf --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/region-id" || echo "")
+RAM_ROLE_NAME=$(curl -sf --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/ram/security-credentials/" || echo "")
 
-if [[ -z "${{INSTANCE_ID}}" ]]; then
-    log "Error: Failed to get instance ID from metadata service"
+if [[ -z "${{INSTANCE_ID}}" || -z "${{REGION_ID}}" ]]; then
+    log "Error: Failed to get instance ID or region ID from metadata service"
     exit 1
 fi
-
-if [[ -z "${{REGION_ID}}" ]]; then
-    log "Error: Failed to get region ID from metadata service"
-    exit 1
-fi
-
-log "Instance ID: ${{INSTANCE_ID}}"
-log "Region ID: ${{REGION_ID}}"
-
-# 检查 Aliyun CLI 是否已安装
-if ! command -v aliyun &> /dev/null; then
-    log "Error: Aliyun CLI is not installed"
-    exit 1
-fi
-
-# 配置 Aliyun CLI 使用实例角色认证
-# 获取实例角色名称（从元数据服务）
-RAM_ROLE_NAME=$(curl -s --connect-timeout 5 --max-time 10 "${{METADATA_URL}}/ram/security-credentials/" || echo "")
-
 if [[ -z "${{RAM_ROLE_NAME}}" ]]; then
     log "Error: Failed to get RAM role name from metadata service"
     log "Please ensure the instance has a RAM role attached"
     exit 1
 fi
-
-log "RAM Role Name: ${{RAM_ROLE_NAME}}"
-log "Configuring Aliyun CLI to use instance role authentication"
-
-# 配置 aliyun cli 使用实例角色认证
-# 使用非交互式方式配置
-aliyun configure set \
-    --mode EcsRamRole \
-    --ram-role-name "${{RAM_ROLE_NAME}}" \
-    --region "${{REGION_ID}}" 2>&1 | tee -a "${{LOG_FILE}}" || {{
-    log "Error: Failed to configure Aliyun CLI"
-    exit 1
-}}
-
-log "Aliyun CLI configured successfully"
-
-# 等待一段时间，确保镜像创建完成
-log "Waiting 10 seconds before self-destruct..."
-sleep 10
+log "Instance ID: ${{INSTANCE_ID}}, Region ID: ${{REGION_ID}}, RAM Role: ${{RAM_ROLE_NAME}}"
+
+AUTH_ARGS=(--mode EcsRamRole --ram-role-name "${{RAM_ROLE_NAME}}" --region "${{REGION_ID}}")
+
+# 等待本实例的快照全部完成（最多 2 小时），快照失败或超时也释放实例
+MAX_WAIT=7200
+WAIT_INTERVAL=10
+START=$(date +%s)
+while true; do
+    ELAPSED=$(( $(date +%s) - START ))
+    if (( ELAPSED >= MAX_WAIT )); then
+        log "Warning: Image snapshots not accomplished after ${{MAX_WAIT}}s, proceeding with self-destruct anyway"
+        break
+    fi
+
+    if SNAPSHOTS=$(aliyun ecs DescribeSnapshots \\
+        --RegionId "${{REGION_ID}}" \\
+        --InstanceId "${{INSTANCE_ID}}" \\
+        --PageSize 100 \\
+        "${{AUTH_ARGS[@]}}" 2>> "${{LOG_FILE}}"); then
+        TOTAL=$(jq '.Snapshots.Snapshot | length' <<< "${{SNAPSHOTS}}" || echo 0)
+        PENDING=$(jq '[.Snapshots.Snapshot[] | select(.Status != "accomplished")] | length' <<< "${{SNAPSHOTS}}" || echo 0)
+        FAILED=$(jq '[.Snapshots.Snapshot[] | select(.Status == "failed")] | length' <<< "${{SNAPSHOTS}}" || echo 0)
+        PROGRESS=$(jq -r '[.Snapshots.Snapshot[].Progress] | join(",")' <<< "${{SNAPSHOTS}}" || echo "")
+        if [[ "${{TOTAL}}" -gt 0 && "${{PENDING}}" -eq 0 ]]; then
+            log "Image snapshots accomplished after ${{ELAPSED}}s"
+            break
+        fi
+        if [[ "${{FAILED}}" -gt 0 ]]; then
+            log "Warning: Image snapshot failed, proceeding with self-destruct"
+            break
+        fi
+        log "Waiting for image snapshots (${{TOTAL}} found, progress: ${{PROGRESS:-none}})"
+    fi
+    sleep "${{WAIT_INTERVAL}}"
+done
 
 # 删除实例
 log "Deleting instance: ${{INSTANCE_ID}}"
-RESPONSE=$(aliyun ecs DeleteInstance \
-    --RegionId "${{REGION_ID}}" \
-    --InstanceId "${{INSTANCE_ID}}" \
-    --Force true 2>&1)
-
-EXIT_CODE=$?
+EXIT_CODE=0
+RESPONSE=$(aliyun ecs DeleteInstance \\
+    --RegionId "${{REGION_ID}}" \\
+    --InstanceId "${{INSTANCE_ID}}" \\
+    --Force true \\
+    "${{AUTH_ARGS[@]}}" 2>&1) || EXIT_CODE=$?
 
 if [[ ${{EXIT_CODE}} -ne 0 ]]; then
     log "Error: Failed to delete instance (exit code: ${{EXIT_CODE}})"
@@ -346,6 +666,7 @@ SELF_DESTRUCT_EOF
 chmod +x /usr/local/bin/self-destruct.sh
 
 # 创建 systemd service，在镜像构建完成后执行自毁脚本
+# 只启动不启用：服务文件会进入镜像，不能在 Runner 实例开机时运行
 echo "=== Creating self-destruct systemd service ==="
 cat > /etc/systemd/system/self-destruct.service << 'SERVICE_EOF'
 [Unit]
@@ -355,22 +676,17 @@ Wants=network-online.target
 
 [Service]
 Type=oneshot
-# 等待镜像构建完成标志文件后执行自毁脚本
-ExecStart=/bin/bash -c 'while [[ ! -f /opt/image-build-complete.flag ]]; do sleep 60; done; sleep 300; /usr/local/bin/self-destruct.sh'
+ExecStart=/usr/local/bin/self-destruct.sh
 StandardOutput=journal
 StandardError=journal
-
-[Install]
-WantedBy=multi-user.target
 SERVICE_EOF
 
-# 启用并启动服务
 systemctl daemon-reload
-systemctl enable self-destruct.service
-systemctl start self-destruct.service
+# oneshot 服务会一直等到自毁，不阻塞 User Data
+systemctl start --no-block self-destruct.service
 
-echo "Self-destruct service created, enabled and started"
-echo "Instance will be automatically deleted after image creation completes"
+echo "Self-destruct service started"
+echo "Instance will be automatically deleted once the image snapshots are accomplished"
 """
 
     return script
@@ -671,75 +987,6 @@ def get_image_size(region_id: str, image_id: str) -> Optional[int]:
     return None
 
 
-def get_supported_disk_category(
-    region_id: str, instance_type: str, zone_id: Optional[str] = None
-) -> str:
-    """获取实例类型支持的系统盘类型（降级策略）"""
-    # 磁盘类型优先级：cloud_essd -> cloud_ssd -> cloud_efficiency
-    disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
-
-    # 如果没有指定可用区，尝试查询（可选）
-    if not zone_id:
-        # 先尝试查询实例类型支持的磁盘类型
-        try:
-            cmd = [
-                "aliyun",
-                "ecs",
-                "DescribeAvailableResource",
-                "--RegionId",
-                region_id,
-                "--InstanceType",
-                instance_type,
-                "--DestinationResource",
-                "SystemDisk",
-            ]
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, check=True, timeout=30
-            )
-            data = json.loads(result.stdout)
-
-            # 解析支持的磁盘类型
-            if (
-                "AvailableZones" in data
-                and "AvailableZone" in data["AvailableZones"]
-                and len(data["AvailableZones"]["AvailableZone"]) > 0
-            ):
-                zone = data["AvailableZones"]["AvailableZone"][0]
-                if (
-                    "AvailableResources" in zone
-                    and "AvailableResource" in zone["AvailableResources"]
-                    and len(zone["AvailableResources"]["AvailableResource"]) > 0
-                ):
-                    resource = zone["AvailableResources"]["AvailableResource"][0]
-                    if (
-                        "SupportedResources" in resource
-                        and "SupportedResource" in resource["SupportedResources"]
-                    ):
-                        supported = resource["SupportedResources"]["SupportedResource"]
-                        supported_categories = [
-                            r.get("Value", "") for r in supported if r.get("Value", "")
-                        ]
-
-                        # 按优先级选择第一个支持的磁盘类型
-                        for category in disk_categories:
-                            if category in supported_categories:
-                                print(
-                                    f"Instance type {instance_type} supports disk category: {category}",
-                                    file=sys.stderr,
-                                )
-                                return category
-
-        except (subprocess.SubprocessError, json.JSONDecodeError, KeyError) as e:
-            print(
-                f"Warning: Failed to query supported disk categories: {e}",
-                file=sys.stderr,
-            )
-
-    # 如果查询失败，使用降级策略：尝试创建实例，如果失败则降级
-    # 这里先返回 cloud_essd，如果创建失败，调用方可以重试其他类型
-    return "cloud_essd"
-
-
 def create_instance(
     region_id: str,
     image_id: str,
@@ -759,7 +1006,8 @@ def create_instance(
     """创建 ECS Spot 实例"""
     # 如果没有指定磁盘类型，自动检测
     if not system_disk_category:
-        system_disk_category = get_supported_disk_category(region_id, instance_type)
+        categories = get_supported_disk_categories(region_id, instance_type)
+        system_disk_category = categories[0]
 
     # 查询镜像大小，动态计算系统盘大小
     # 如果已经提供了镜像大小（例如从 DescribeImageFromFamily 获取），直接使用
@@ -879,67 +1127,317 @@ def extract_instance_id(response: str) -> Optional[str]:
     return None
 
 
+def adaptive_wait(
+    label: str,
+    resource_ids: List[str],
+    describe: Callable[[List[str]], Optional[Dict[str, dict]]],
+    evaluate: Callable[[dict], Tuple[str, Optional[float]]],
+    timeout: int,
+    min_interval: float = 2,
+    max_interval: float = 30,
+) -> Dict[str, str]:
+    """
+    通用等待引擎：一次 Describe 调用批量查询所有未就绪的资源
+
+    evaluate 返回 (状态, 进度百分比)，状态为 ready / failed / pending；
+    无进度信息时查询间隔从 min_interval 按 1.5 倍拉长到 max_interval，
+    有进度信息时按进度速率预测剩余时间，在预测完成前后查询
+    返回每个资源的最终状态（超时未就绪为 pending）
+    """
+    states = {resource_id: "pending" for resource_id in resource_ids}
+    # 进度采样：资源 ID -> (首次采样时间, 首次进度)
+    first_progress: Dict[str, Tuple[float, float]] = {}
+    interval = min_interval
+    polls = 0
+    start_time = time.time()
+
+    while True:
+        waiting = [rid for rid, state in states.items() if state == "pending"]
+        if not waiting:
+            break
+
+        polls += 1
+        data = describe(waiting)
+        now = time.time()
+        predictions = []
+        finishing = False
+        for resource_id in waiting:
+            resource = (data or {}).get(resource_id)
+            if resource is None:
+                continue
+            state, progress = evaluate(resource)
+            states[resource_id] = state
+            if state != "pending" or progress is None:
+                continue
+
+            print(f"{label} {resource_id} progress: {progress:.0f}%", file=sys.stderr)
+            # 进度已满但状态尚未切换，很快就会就绪
+            if progress >= 100:
+                finishing = True
+                continue
+            if resource_id not in first_progress:
+                first_progress[resource_id] = (now, progress)
+                continue
+            sample_time, sample_progress = first_progress[resource_id]
+            if progress > sample_progress and progress < 100:
+                rate = (progress - sample_progress) / (now - sample_time)
+                predictions.append((100 - progress) / rate)
+
+        if all(state != "pending" for state in states.values()):
+            break
+
+        elapsed = now - start_time
+        if elapsed >= timeout:
+            print(
+                f"Timeout waiting for {label.lower()} after {elapsed:.0f}s "
+                f"({polls} polls)",
+                file=sys.stderr,
+            )
+            return states
+
+        if finishing:
+            interval = min_interval
+        elif predictions:
+            # 在预测完成时间的一半处再查询，逐步逼近完成时刻
+            interval = min(max(min(predictions) / 2, min_interval), max_interval)
+        else:
+            interval = min(interval * 1.5, max_interval)
+        time.sleep(min(interval, max(0, timeout - elapsed)))
+
+    print(
+        f"{label} wait finished after {time.time() - start_time:.0f}s ({polls} polls)",
+        file=sys.stderr,
+    )
+    return states
+
+
+def describe_instances(region_id: str, instance_ids: List[str]) -> Optional[dict]:
+    """批量查询实例，返回 实例 ID -> 实例信息"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeInstances",
+        "--RegionId",
+        region_id,
+        "--InstanceIds",
+        json.dumps(instance_ids),
+        "--PageSize",
+        "100",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=True, timeout=30
+        )
+        data = json.loads(result.stdout)
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        print(f"Error checking instance status: {e}", file=sys.stderr)
+        return None
+
+    return {
+        instance.get("InstanceId"): instance
+        for instance in data.get("Instances", {}).get("Instance", [])
+    }
+
+
+def evaluate_instance(instance: dict) -> Tuple[str, Optional[float]]:
+    """实例是否就绪（Running 且不处于系统维护重启）"""
+    status = instance.get("Status", "")
+    print(f"Instance {instance.get('InstanceId')} status: {status}", file=sys.stderr)
+    if status == "Running":
+        system_status = instance.get("SystemEvent", {}).get("EventType", "")
+        if system_status != "SystemMaintenance.Reboot":
+            return "ready", None
+    return "pending", None
+
+
 def wait_for_instance_ready(
-    region_id: str, instance_id: str, timeout: int = 600
+    region_id: str, instance_ids: List[str], timeout: int = 600
 ) -> bool:
     """等待实例就绪"""
-    print(f"Waiting for instance {instance_id} to be ready...", file=sys.stderr)
-    start_time = time.time()
+    print(
+        f"Waiting for instances {', '.join(instance_ids)} to be ready...",
+        file=sys.stderr,
+    )
+    states = adaptive_wait(
+        "Instance",
+        instance_ids,
+        lambda ids: describe_instances(region_id, ids),
+        evaluate_instance,
+        timeout,
+        min_interval=2,
+        max_interval=15,
+    )
+    if all(state == "ready" for state in states.values()):
+        print("Instance is ready", file=sys.stderr)
+        return True
+    return False
 
-    while time.time() - start_time < timeout:
-        cmd = [
-            "aliyun",
-            "ecs",
-            "DescribeInstances",
-            "--RegionId",
-            region_id,
-            "--InstanceIds",
-            json.dumps([instance_id]),
-        ]
 
+def run_build_status_probe(
+    region_id: str, instance_id: str, timeout: int, dispatch_timeout: int = 180
+) -> Optional[str]:
+    """
+    通过云助手下发等待构建状态文件的命令，返回 InvokeId
+    命令在实例内每 5 秒检查一次状态文件，结束后输出状态与构建日志尾部
+    """
+    probe = (
+        f"for i in $(seq 1 {timeout // 5}); do "
+        "[[ -f /run/image-build.status ]] && break; sleep 5; done\n"
+        "cat /run/image-build.status 2>/dev/null || echo status=timeout\n"
+        "echo '--- image-build.log ---'\n"
+        "tail -n 40 /var/log/image-build.log 2>/dev/null\n"
+    )
+    cmd = [
+        "aliyun",
+        "ecs",
+        "RunCommand",
+        "--RegionId",
+        region_id,
+        "--Type",
+        "RunShellScript",
+        "--CommandContent",
+        probe,
+        "--InstanceId.1",
+        instance_id,
+        "--Timeout",
+        str(timeout + 60),
+        "--Name",
+        "image-build-status",
+    ]
+
+    # 实例刚启动时云助手可能尚未上线，短暂重试
+    start_time = time.time()
+    while time.time() - start_time < dispatch_timeout:
         try:
             result = subprocess.run(
-                cmd, capture_output=True, text=True, check=True, timeout=30
+                cmd, capture_output=True, text=True, check=False, timeout=30
             )
-            data = json.loads(result.stdout)
-
-            if (
-                "Instances" in data
-                and "Instance" in data["Instances"]
-                and len(data["Instances"]["Instance"]) > 0
-            ):
-                instance = data["Instances"]["Instance"][0]
-                status = instance.get("Status", "")
-                print(f"Instance status: {status}", file=sys.stderr)
-
-                if status == "Running":
-                    # 检查系统状态
-                    system_status = instance.get("SystemEvent", {}).get("EventType", "")
-                    if system_status != "SystemMaintenance.Reboot":
-                        print("Instance is ready", file=sys.stderr)
-                        return True
-
-            time.sleep(10)
-        except (subprocess.SubprocessError, json.JSONDecodeError, KeyError) as e:
-            print(f"Error checking instance status: {e}", file=sys.stderr)
-            time.sleep(10)
-
-    print("Timeout waiting for instance to be ready", file=sys.stderr)
-    return False
+            if result.returncode == 0:
+                invoke_id = json.loads(result.stdout).get("InvokeId")
+                if invoke_id:
+                    return invoke_id
+            print(
+                f"RunCommand not accepted yet: {(result.stdout + result.stderr)[:200]}",
+                file=sys.stderr,
+            )
+        except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+            print(f"RunCommand failed: {e}", file=sys.stderr)
+        time.sleep(10)
+    return None
+
+
+def describe_invocation_results(
+    region_id: str, invoke_id: str, instance_ids: List[str]
+) -> Optional[dict]:
+    """查询云助手命令执行结果，返回 实例 ID -> 执行结果"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeInvocationResults",
+        "--RegionId",
+        region_id,
+        "--InvokeId",
+        invoke_id,
+        "--ContentEncoding",
+        "PlainText",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=True, timeout=30
+        )
+        data = json.loads(result.stdout)
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        print(f"Error checking invocation result: {e}", file=sys.stderr)
+        return None
+
+    results = (
+        data.get("Invocation", {})
+        .get("InvocationResults", {})
+        .get("InvocationResult", [])
+    )
+    return {
+        item.get("InstanceId"): item
+        for item in results
+        if item.get("InstanceId") in instance_ids
+    }
+
+
+def evaluate_invocation(result: dict) -> Tuple[str, Optional[float]]:
+    """命令是否已结束（不区分成功失败，由输出中的构建状态判断）"""
+    if result.get("InvokeRecordStatus") in ("Finished", "Failed", "Stopped"):
+        return "ready", None
+    return "pending", None
+
+
+def parse_build_status(output: str) -> dict:
+    """解析状态文件（key=value 行，遇到日志分隔行结束）"""
+    status = {}
+    for line in output.splitlines():
+        if line.startswith("--- "):
+            break
+        key, sep, value = line.partition("=")
+        if sep:
+            status[key.strip()] = value.strip()
+    return status
 
 
 def wait_for_user_data_complete(
     region_id: str, instance_id: str, timeout: int = 1800
 ) -> bool:
-    """等待 User Data 脚本执行完成"""
+    """
+    等待 User Data 脚本执行完成
+    User Data 结束时写入 /run/image-build.status（成功或 EXIT trap 记录的退出码），
+    通过云助手读取状态与日志尾部；云助手不可用时退回固定等待
+    """
     print("Waiting for User Data script to complete...", file=sys.stderr)
     start_time = time.time()
 
-    # 通过检查实例标签或元数据来判断（简化版本：等待固定时间后检查）
-    # 实际应该通过 SSH 或实例元数据服务检查
-    time.sleep(300)  # 等待 5 分钟，让脚本有时间执行
+    invoke_id = run_build_status_probe(region_id, instance_id, timeout)
+    if not invoke_id:
+        print(
+            "Warning: Cloud Assistant unavailable, falling back to a fixed 300s wait",
+            file=sys.stderr,
+        )
+        time.sleep(300)
+        print("User Data script should be complete", file=sys.stderr)
+        return True
+
+    print(f"Build status probe dispatched (InvokeId: {invoke_id})", file=sys.stderr)
+    results: Dict[str, dict] = {}
+
+    def describe(ids: List[str]) -> Optional[dict]:
+        data = describe_invocation_results(region_id, invoke_id, ids)
+        if data:
+            results.update(data)
+        return data
+
+    states = adaptive_wait(
+        "Build status probe",
+        [instance_id],
+        describe,
+        evaluate_invocation,
+        timeout + 120,
+        min_interval=5,
+        max_interval=10,
+    )
+    if states.get(instance_id) != "ready":
+        return False
+
+    output = results[instance_id].get("Output", "")
+    status = parse_build_status(output)
+    print(output, file=sys.stderr)
+    if status.get("status") != "success":
+        print(
+            f"User Data script did not succeed: status={status.get('status')}, "
+            f"exit_code={status.get('exit_code')}, line={status.get('line')}",
+            file=sys.stderr,
+        )
+        return False
 
-    print("User Data script should be complete", file=sys.stderr)
+    print(
+        f"User Data script completed after {time.time() - start_time:.0f}s",
+        file=sys.stderr,
+    )
     return True
 
 
@@ -949,21 +1447,34 @@ def create_image(
     image_name: str,
     description: str,
     tags: Optional[dict] = None,
+    snapshot_id: Optional[str] = None,
+    arch: str = "amd64",
 ) -> Tuple[int, str]:
-    """创建自定义镜像"""
+    """创建自定义镜像（指定 snapshot_id 时从系统盘快照创建，不依赖实例）"""
     cmd = [
         "aliyun",
         "ecs",
         "CreateImage",
         "--RegionId",
         region_id,
-        "--InstanceId",
-        instance_id,
         "--ImageName",
         image_name,
         "--Description",
         description,
     ]
+    if snapshot_id:
+        cmd.extend(
+            [
+                "--SnapshotId",
+                snapshot_id,
+                "--Architecture",
+                "arm64" if arch.lower() == "arm64" else "x86_64",
+                "--Platform",
+                "Ubuntu",
+            ]
+        )
+    else:
+        cmd.extend(["--InstanceId", instance_id])
 
     if tags:
         tag_index = 1
@@ -995,102 +1506,257 @@ def extract_image_id(response: str) -> Optional[str]:
     if match:
         return match.group(0)
 
-    return None
+    return None
+
+
+def describe_images(region_id: str, image_ids: List[str]) -> Optional[dict]:
+    """批量查询镜像（逗号分隔的 ImageId），返回 镜像 ID -> 镜像信息"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeImages",
+        "--RegionId",
+        region_id,
+        "--ImageId",
+        ",".join(image_ids),
+        # 默认只返回 Available 的镜像，创建中的镜像需要显式指定状态
+        "--Status",
+        "Creating,Waiting,Available,UnAvailable,CreateFailed",
+        "--PageSize",
+        "100",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=30
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: DescribeImages failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: DescribeImages failed with exit code {result.returncode}: "
+            f"{result.stderr[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        data = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+
+    return {
+        image.get("ImageId"): image for image in data.get("Images", {}).get("Image", [])
+    }
+
+
+def evaluate_image(image: dict) -> Tuple[str, Optional[float]]:
+    """镜像状态与创建进度（Progress 形如 "85%"）"""
+    status = image.get("Status", "")
+    if status == "Available":
+        print(f"Image {image.get('ImageId')} is ready", file=sys.stderr)
+        return "ready", None
+    if status == "CreateFailed":
+        return "failed", None
+
+    try:
+        progress = float(str(image.get("Progress", "")).rstrip("%"))
+    except ValueError:
+        progress = None
+    if progress is None:
+        print(f"Image {image.get('ImageId')} status: {status}", file=sys.stderr)
+    return "pending", progress
+
+
+def wait_for_image_ready(
+    region_id: str, image_ids: List[str], timeout: int = 3600
+) -> bool:
+    """等待镜像创建完成"""
+    print(f"Waiting for images {', '.join(image_ids)} to be ready...", file=sys.stderr)
+    states = adaptive_wait(
+        "Image",
+        image_ids,
+        lambda ids: describe_images(region_id, ids),
+        evaluate_image,
+        timeout,
+        min_interval=5,
+        max_interval=120,
+    )
+    failed = [image_id for image_id, state in states.items() if state == "failed"]
+    if failed:
+        error_exit(f"Image creation failed: {', '.join(failed)}")
+    return all(state == "ready" for state in states.values())
+
+
+def evaluate_stopped(instance: dict) -> Tuple[str, Optional[float]]:
+    """实例是否已停止"""
+    status = instance.get("Status", "")
+    print(f"Instance {instance.get('InstanceId')} status: {status}", file=sys.stderr)
+    return ("ready" if status == "Stopped" else "pending"), None
+
+
+def stop_instance(region_id: str, instance_id: str, timeout: int = 600) -> bool:
+    """停止实例（停机不收费模式）并等待停止完成，保证系统盘快照的一致性"""
+    print(f"Stopping instance {instance_id}...", file=sys.stderr)
+    cmd = [
+        "aliyun",
+        "ecs",
+        "StopInstance",
+        "--RegionId",
+        region_id,
+        "--InstanceId",
+        instance_id,
+        "--StoppedMode",
+        "StopCharging",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=60
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Error stopping instance: {e}", file=sys.stderr)
+        return False
+    if result.returncode != 0:
+        print(f"Failed to stop instance: {result.stderr[:300]}", file=sys.stderr)
+        return False
+
+    states = adaptive_wait(
+        "Instance",
+        [instance_id],
+        lambda ids: describe_instances(region_id, ids),
+        evaluate_stopped,
+        timeout,
+        min_interval=2,
+        max_interval=15,
+    )
+    return states[instance_id] == "ready"
+
+
+def get_system_disk_id(region_id: str, instance_id: str) -> Optional[str]:
+    """查询实例的系统盘 ID"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeDisks",
+        "--RegionId",
+        region_id,
+        "--InstanceId",
+        instance_id,
+        "--DiskType",
+        "system",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=True, timeout=30
+        )
+        disks = json.loads(result.stdout).get("Disks", {}).get("Disk", [])
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        print(f"Error querying system disk: {e}", file=sys.stderr)
+        return None
+    return disks[0].get("DiskId") if disks else None
+
 
+def create_snapshot(
+    region_id: str, disk_id: str, snapshot_name: str, tags: Optional[dict] = None
+) -> Optional[str]:
+    """为云盘创建快照，返回快照 ID"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "CreateSnapshot",
+        "--RegionId",
+        region_id,
+        "--DiskId",
+        disk_id,
+        "--SnapshotName",
+        snapshot_name,
+    ]
+    for index, (key, value) in enumerate((tags or {}).items(), 1):
+        cmd.extend([f"--Tag.{index}.Key", key, f"--Tag.{index}.Value", value])
 
-def wait_for_image_ready(region_id: str, image_id: str, timeout: int = 3600) -> bool:
-    """等待镜像创建完成"""
-    print(f"Waiting for image {image_id} to be ready...", file=sys.stderr)
-    start_time = time.time()
-    check_interval = 30
-    consecutive_errors = 0
-    max_consecutive_errors = 5
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=60
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Error creating snapshot: {e}", file=sys.stderr)
+        return None
+    if result.returncode != 0:
+        print(f"Failed to create snapshot: {result.stderr[:300]}", file=sys.stderr)
+        return None
+    try:
+        return json.loads(result.stdout).get("SnapshotId")
+    except json.JSONDecodeError:
+        match = re.search(r"s-[a-z0-9]+", result.stdout)
+        return match.group(0) if match else None
 
-    while time.time() - start_time < timeout:
-        # 尝试两种参数格式：直接字符串，或者 JSON 数组（虽然参数名是单数，但可能支持数组格式）
-        success = False
-        last_result = None
-        for image_id_param in [image_id, json.dumps([image_id])]:
-            cmd = [
-                "aliyun",
-                "ecs",
-                "DescribeImages",
-                "--RegionId",
-                region_id,
-                "--ImageId",
-                image_id_param,
-            ]
 
-            try:
-                result = subprocess.run(
-                    cmd, capture_output=True, text=True, check=False, timeout=30
-                )
-                last_result = result
-
-                # 即使返回码非零，也尝试解析输出（有时数据在 stdout）
-                if result.stdout:
-                    try:
-                        data = json.loads(result.stdout)
-
-                        if (
-                            "Images" in data
-                            and "Image" in data["Images"]
-                            and len(data["Images"]["Image"]) > 0
-                        ):
-                            image = data["Images"]["Image"][0]
-                            status = image.get("Status", "")
-                            print(f"Image status: {status}", file=sys.stderr)
-
-                            if status == "Available":
-                                print("Image is ready", file=sys.stderr)
-                                return True
-                            elif status == "CreateFailed":
-                                error_exit("Image creation failed")
-
-                            # 成功解析到镜像信息
-                            success = True
-                            consecutive_errors = 0
-                            break
-                    except json.JSONDecodeError:
-                        # JSON 解析失败，继续尝试下一种格式
-                        continue
-
-                # 如果返回码为 0 但没有数据，可能是镜像还不存在，继续等待
-                if result.returncode == 0:
-                    success = True
-                    consecutive_errors = 0
-                    break
+def describe_snapshots(region_id: str, snapshot_ids: List[str]) -> Optional[dict]:
+    """批量查询快照，返回 快照 ID -> 快照信息"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeSnapshots",
+        "--RegionId",
+        region_id,
+        "--SnapshotIds",
+        json.dumps(snapshot_ids),
+        "--PageSize",
+        "100",
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=True, timeout=30
+        )
+        data = json.loads(result.stdout)
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        print(f"Warning: DescribeSnapshots failed: {e}", file=sys.stderr)
+        return None
 
-            except subprocess.TimeoutExpired:
-                print("Command timeout, retrying...", file=sys.stderr)
-                break
-            except Exception as e:
-                print(f"Unexpected error: {e}", file=sys.stderr)
-                break
+    return {
+        snapshot.get("SnapshotId"): snapshot
+        for snapshot in data.get("Snapshots", {}).get("Snapshot", [])
+    }
 
-        # 如果所有格式都失败，记录错误但继续等待
-        if not success:
-            consecutive_errors += 1
-            if last_result and last_result.returncode != 0:
-                print(
-                    f"Command failed with exit code {last_result.returncode}",
-                    file=sys.stderr,
-                )
-                if last_result.stderr:
-                    print(f"Error output: {last_result.stderr}", file=sys.stderr)
 
-            # 如果连续多次错误，输出警告但继续等待
-            if consecutive_errors >= max_consecutive_errors:
-                print(
-                    f"Warning: {consecutive_errors} consecutive errors, but continuing to wait...",
-                    file=sys.stderr,
-                )
-                consecutive_errors = 0  # 重置计数，避免无限警告
+def evaluate_snapshot(snapshot: dict) -> Tuple[str, Optional[float]]:
+    """快照状态与进度（Progress 形如 "85%"）"""
+    status = snapshot.get("Status", "")
+    if status == "accomplished":
+        print(f"Snapshot {snapshot.get('SnapshotId')} is accomplished", file=sys.stderr)
+        return "ready", None
+    if status == "failed":
+        return "failed", None
+
+    try:
+        progress = float(str(snapshot.get("Progress", "")).rstrip("%"))
+    except ValueError:
+        progress = None
+    if progress is None:
+        print(
+            f"Snapshot {snapshot.get('SnapshotId')} status: {status}", file=sys.stderr
+        )
+    return "pending", progress
 
-        time.sleep(check_interval)
 
-    print("Timeout waiting for image to be ready", file=sys.stderr)
-    return False
+def wait_for_snapshot_ready(
+    region_id: str, snapshot_ids: List[str], timeout: int = 3600
+) -> bool:
+    """等待快照创建完成"""
+    states = adaptive_wait(
+        "Snapshot",
+        snapshot_ids,
+        lambda ids: describe_snapshots(region_id, ids),
+        evaluate_snapshot,
+        timeout,
+        min_interval=5,
+        max_interval=60,
+    )
+    failed = [sid for sid, state in states.items() if state == "failed"]
+    if failed:
+        error_exit(f"Snapshot creation failed: {', '.join(failed)}")
+    return all(state == "ready" for state in states.values())
 
 
 def delete_instance(region_id: str, instance_id: str) -> bool:
@@ -1123,10 +1789,26 @@ def delete_instance(region_id: str, instance_id: str) -> bool:
         return False
 
 
+def wait_for_self_release(region_id: str, instance_id: str, timeout: int) -> bool:
+    """等待镜像构建实例在快照完成后自行释放"""
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        instances = describe_instances(region_id, [instance_id])
+        if instances is not None and instance_id not in instances:
+            print(
+                f"Instance {instance_id} released itself "
+                f"({time.time() - start_time:.0f}s after the image was ready)",
+                file=sys.stderr,
+            )
+            return True
+        time.sleep(5)
+    return False
+
+
 def check_existing_image(
-    region_id: str, image_name_prefix: str, version_hash: str
+    region_id: str, image_name: str, version_hash: str
 ) -> Optional[str]:
-    """检查是否已存在相同版本的自定义镜像"""
+    """检查当前的 -latest 镜像是否与本次构建的版本哈希相同"""
     cmd = [
         "aliyun",
         "ecs",
@@ -1136,7 +1818,9 @@ def check_existing_image(
         "--ImageOwnerAlias",
         "self",
         "--ImageName",
-        image_name_prefix,
+        image_name,
+        "--PageSize",
+        "100",
     ]
 
     try:
@@ -1152,6 +1836,9 @@ def check_existing_image(
         ):
             # 检查是否有匹配版本哈希的镜像
             for image in data["Images"]["Image"]:
+                # ImageName 为模糊匹配，重命名后的历史镜像不视为当前版本
+                if image.get("ImageName") != image_name:
+                    continue
                 tags = image.get("Tags", {}).get("Tag", [])
                 for tag in tags:
                     if (
@@ -1517,8 +2204,400 @@ def cleanup_old_images(
         delete_image(region_id, image_id)
 
 
+def copy_image(
+    region_id: str,
+    image_id: str,
+    destination_region_id: str,
+    image_name: str,
+    description: str,
+    tags: Optional[dict] = None,
+) -> Optional[str]:
+    """将镜像复制到目标地域，返回目标地域的镜像 ID"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "CopyImage",
+        "--RegionId",
+        region_id,
+        "--ImageId",
+        image_id,
+        "--DestinationRegionId",
+        destination_region_id,
+        "--DestinationImageName",
+        image_name,
+        "--DestinationDescription",
+        description,
+    ]
+    if tags:
+        for tag_index, (key, value) in enumerate(tags.items(), 1):
+            cmd.extend([f"--Tag.{tag_index}.Key", key])
+            cmd.extend([f"--Tag.{tag_index}.Value", value])
+
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=60
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(
+            f"Warning: CopyImage to {destination_region_id} failed: {e}",
+            file=sys.stderr,
+        )
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: CopyImage to {destination_region_id} failed: "
+            f"{(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+    return extract_image_id(result.stdout)
+
+
+def replicate_image(
+    region_id: str,
+    image_id: str,
+    image_name: str,
+    description: str,
+    tags: dict,
+    destination_regions: List[str],
+    keep_count: int,
+) -> Tuple[Dict[str, str], List[str]]:
+    """
+    将 -latest 镜像并发复制到其他地域，并在各地域执行相同的重命名与保留规则
+
+    目标地域已有相同版本哈希的 -latest 镜像时跳过复制（重跑或构建被跳过时补齐新增地域）；
+    复制中的镜像由一个批量轮询统一等待（每轮每个地域一次 DescribeImages）
+    返回 (地域 -> 镜像 ID, 失败的地域)
+    """
+    version_hash = tags.get("VersionHash", "")
+    replicated: Dict[str, str] = {}
+    copying: Dict[str, str] = {}
+    failed: List[str] = []
+
+    def start_copy(destination: str) -> Tuple[str, Optional[str], bool]:
+        existing = check_existing_image(destination, image_name, version_hash)
+        if existing:
+            return destination, existing, False
+        # 先重命名目标地域的旧 -latest 镜像，为新镜像腾出名称
+        cleanup_old_images(
+            destination,
+            image_name,
+            keep_count,
+            exclude_image_id=None,
+            rename_only=True,
+        )
+        return (
+            destination,
+            copy_image(region_id, image_id, destination, image_name, description, tags),
+            True,
+        )
+
+    with ThreadPoolExecutor(max_workers=len(destination_regions)) as executor:
+        for destination, copy_id, started in executor.map(
+            start_copy, destination_regions
+        ):
+            if not copy_id:
+                failed.append(destination)
+            elif started:
+                print(
+                    f"Copying {image_id} to {destination}: {copy_id}", file=sys.stderr
+                )
+                copying[destination] = copy_id
+            else:
+                replicated[destination] = copy_id
+
+    if copying:
+        # 资源键为 "<地域>/<镜像 ID>"，同一轮轮询中按地域分组查询
+        def describe_copies(keys: List[str]) -> Dict[str, dict]:
+            by_region: Dict[str, List[str]] = {}
+            for key in keys:
+                destination, _, copy_id = key.partition("/")
+                by_region.setdefault(destination, []).append(copy_id)
+            results: Dict[str, dict] = {}
+            for destination, copy_ids in by_region.items():
+                images = describe_images(destination, copy_ids) or {}
+                for copy_id, image in images.items():
+                    results[f"{destination}/{copy_id}"] = image
+            return results
+
+        states = adaptive_wait(
+            "Image copy",
+            [f"{destination}/{copy_id}" for destination, copy_id in copying.items()],
+            describe_copies,
+            evaluate_image,
+            timeout=int(os.environ.get("REPLICATE_TIMEOUT", "3600")),
+            min_interval=10,
+            max_interval=120,
+        )
+        for key, state in states.items():
+            destination, _, copy_id = key.partition("/")
+            if state != "ready":
+                print(
+                    f"Warning: Image copy to {destination} ({copy_id}) is {state}",
+                    file=sys.stderr,
+                )
+                failed.append(destination)
+                continue
+            replicated[destination] = copy_id
+            cleanup_old_images(
+                destination, image_name, keep_count, exclude_image_id=copy_id
+            )
+
+    return replicated, failed
+
+
+def replicate_latest_image(
+    region_id: str,
+    image_id: str,
+    image_name: str,
+    description: str,
+    tags: dict,
+    keep_count: int,
+) -> None:
+    """按 REPLICATE_REGIONS 复制 -latest 镜像并输出结果，任一地域失败时退出"""
+    destination_regions = [
+        region.strip()
+        for region in os.environ.get("REPLICATE_REGIONS", "").split(",")
+        if region.strip() and region.strip() != region_id
+    ]
+    if not destination_regions:
+        return
+
+    start_time = time.time()
+    replicated, failed = replicate_image(
+        region_id,
+        image_id,
+        image_name,
+        description,
+        tags,
+        destination_regions,
+        keep_count,
+    )
+    print(
+        f"Replicated {image_name} to {len(replicated)}/{len(destination_regions)} "
+        f"regions in {time.time() - start_time:.0f}s",
+        file=sys.stderr,
+    )
+    print(
+        "REPLICATED_IMAGE_IDS="
+        + ",".join(f"{region}:{rid}" for region, rid in sorted(replicated.items())),
+        file=sys.stdout,
+    )
+    if failed:
+        error_exit(f"Failed to replicate {image_name} to: {', '.join(failed)}")
+
+
+def log_arch(arch: str, message: str) -> None:
+    """输出带架构前缀的日志"""
+    with LOG_LOCK:
+        print(f"[{arch}] {message}", file=sys.stderr, flush=True)
+
+
+def parse_output(output: str) -> Dict[str, str]:
+    """解析脚本输出的 KEY=VALUE 行"""
+    result = {}
+    for line in output.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key.strip():
+            result[key.strip()] = value.strip()
+    return result
+
+
+def run_arch_script(arch: str, script: str, env: Dict[str, str]) -> Dict[str, str]:
+    """运行同目录下的 Python 脚本，实时输出带架构前缀的标准错误，返回解析后的输出"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPTS_DIR, script)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env={**os.environ, **env, "ARCH": arch},
+    )
+    stdout_chunks: List[str] = []
+    reader = threading.Thread(
+        target=lambda: stdout_chunks.append(process.stdout.read()), daemon=True
+    )
+    reader.start()
+    for line in process.stderr:
+        log_arch(arch, line.rstrip("\n"))
+    process.wait()
+    reader.join()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{script} exited with {process.returncode}")
+    return parse_output("".join(stdout_chunks))
+
+
+def merge_disk_category_maps(map_file: Optional[str], arch_files: List[str]) -> None:
+    """合并各架构子进程更新的系统盘类型支持表（同一条目取更新时间较新的记录）"""
+    if not map_file:
+        return
+    merged = load_disk_category_map(map_file)
+    for arch_file in arch_files:
+        for key, entry in load_disk_category_map(arch_file).items():
+            if entry.get("updated_at", "") >= merged.get(key, {}).get("updated_at", ""):
+                merged[key] = entry
+        try:
+            os.remove(arch_file)
+        except OSError:
+            pass
+    save_disk_category_map(map_file, merged)
+
+
+def build_arch(
+    arch: str, shared_env: Dict[str, str], disk_map: dict, map_file: Optional[str]
+) -> Dict[str, str]:
+    """
+    构建单个架构的镜像：查询基础镜像、选择实例规格、规划启动，再以子进程运行单架构构建
+
+    返回单架构构建的输出（IMAGE_ID、IMAGE_NAME、SKIP_BUILD）
+    """
+    start_time = time.time()
+    base_image = run_arch_script(arch, "query-ubuntu-image.py", {})
+    selection = run_arch_script(arch, "select-instance.py", {})
+    run_arch_script(
+        arch,
+        "plan-launch.py",
+        {"CANDIDATES_FILE": selection.get("CANDIDATES_FILE", "")},
+    )
+
+    # 每个架构写入独立的支持表副本，全部完成后再合并，避免并发写同一文件
+    arch_map_file = f"{map_file}.{arch}" if map_file else ""
+    save_disk_category_map(arch_map_file, disk_map)
+
+    outputs = run_arch_script(
+        arch,
+        os.path.basename(__file__),
+        {
+            **shared_env,
+            "ARCHES": "",
+            "BASE_IMAGE_ID": base_image.get("IMAGE_ID", ""),
+            "BASE_IMAGE_NAME": base_image.get("IMAGE_NAME", ""),
+            "BASE_IMAGE_CREATION_TIME": base_image.get("CREATION_TIME", ""),
+            "INSTANCE_TYPE": selection.get("INSTANCE_TYPE", ""),
+            "ALIYUN_VSWITCH_ID": selection.get("VSWITCH_ID", ""),
+            "SPOT_PRICE_LIMIT": selection.get("SPOT_PRICE_LIMIT", ""),
+            "CANDIDATES_FILE": selection.get("CANDIDATES_FILE", ""),
+            "ZONE_ID": selection.get("ZONE_ID", ""),
+            "DISK_CATEGORY_MAP_FILE": arch_map_file,
+            "PREWARM_LIST_FILE": os.environ.get(
+                f"PREWARM_LIST_FILE_{arch.upper()}", ""
+            ),
+            # 保留数量的清理由多架构编排统一执行
+            "SKIP_FINAL_CLEANUP": "true",
+        },
+    )
+    log_arch(arch, f"Finished in {time.time() - start_time:.0f}s")
+    return outputs
+
+
+def main_multi_arch(arches: List[str]) -> None:
+    """
+    多架构模式：在同一进程中并发构建多个架构的镜像
+
+    工具版本、Aliyun CLI 检查和系统盘类型支持表只处理一次，spot-instance-advisor
+    由 workflow 下载一次后共用；各架构的查询、选型和构建以子进程并发执行，
+    日志带架构前缀。全部结束后统一执行保留数量清理，总耗时取决于较慢的架构
+
+    输出：
+        IMAGE_ID_<ARCH>=<镜像 ID>
+        IMAGE_NAME_<ARCH>=<镜像名称>
+        SKIP_BUILD_<ARCH>=true|false
+        REPLICATED_IMAGE_IDS_<ARCH>=<地域>:<镜像 ID>,...（设置 REPLICATE_REGIONS 时）
+        SKIP_BUILD=true|false（所有架构都跳过时为 true）
+    """
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    image_name_prefix = get_env_var("IMAGE_NAME_PREFIX")
+    disk_category_map_file = os.environ.get("DISK_CATEGORY_MAP_FILE")
+    keep_count = int(os.environ.get("KEEP_IMAGE_COUNT", "5"))
+
+    for arch in arches:
+        if arch not in SUPPORTED_ARCHES:
+            error_exit(f"ARCHES must only contain 'amd64' or 'arm64', got: {arch}")
+    if len(set(arches)) != len(arches):
+        error_exit(f"ARCHES contains duplicates: {','.join(arches)}")
+
+    try:
+        subprocess.run(["aliyun", "--version"], capture_output=True, check=True)
+    except (subprocess.SubprocessError, FileNotFoundError):
+        error_exit(
+            "Aliyun CLI is not installed or not in PATH. "
+            "Please ensure aliyun-cli-setup-action is used in the workflow"
+        )
+
+    # 工具版本只查询一次，各架构的 User Data 与版本哈希使用相同的版本
+    tool_versions = resolve_tool_versions()
+    shared_env = {
+        "ALIYUN_CLI_VERSION": tool_versions["aliyun_cli"],
+        "ADVISOR_VERSION": tool_versions["advisor"],
+        "RUNNER_VERSION": tool_versions["runner"],
+    }
+    disk_map = load_disk_category_map(disk_category_map_file)
+
+    start_time = time.time()
+    results: Dict[str, Dict[str, str]] = {}
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=len(arches)) as executor:
+        futures = {
+            arch: executor.submit(
+                build_arch, arch, shared_env, disk_map, disk_category_map_file
+            )
+            for arch in arches
+        }
+        for arch, future in futures.items():
+            try:
+                results[arch] = future.result()
+            except RuntimeError as e:
+                log_arch(arch, f"Error: {e}")
+                failed.append(arch)
+
+    if disk_category_map_file:
+        merge_disk_category_maps(
+            disk_category_map_file,
+            [f"{disk_category_map_file}.{arch}" for arch in arches],
+        )
+
+    # 统一的保留数量清理（排除本次新建的镜像，它应该保持 -latest 名称）
+    for arch, outputs in results.items():
+        if outputs.get("SKIP_BUILD") == "false" and outputs.get("IMAGE_ID"):
+            log_arch(arch, f"Final cleanup of old images (keeping {keep_count} latest)")
+            cleanup_old_images(
+                region_id,
+                f"{image_name_prefix}-{arch}-latest",
+                keep_count,
+                exclude_image_id=outputs["IMAGE_ID"],
+            )
+
+    for arch, outputs in results.items():
+        for key in ("IMAGE_ID", "IMAGE_NAME", "SKIP_BUILD", "REPLICATED_IMAGE_IDS"):
+            if outputs.get(key):
+                print(f"{key}_{arch.upper()}={outputs[key]}", file=sys.stdout)
+    all_skipped = not failed and all(
+        outputs.get("SKIP_BUILD") == "true" for outputs in results.values()
+    )
+    print(f"SKIP_BUILD={'true' if all_skipped else 'false'}", file=sys.stdout)
+
+    print(
+        f"Multi-arch build finished in {time.time() - start_time:.0f}s: "
+        f"{len(results)} succeeded, {len(failed)} failed",
+        file=sys.stderr,
+    )
+    if failed:
+        error_exit(f"Image build failed for: {', '.join(failed)}")
+
+
 def main():
     """主函数"""
+    # 多架构模式：ARCHES=amd64,arm64 时在同一进程中并发构建
+    arches = [
+        arch.strip().lower()
+        for arch in os.environ.get("ARCHES", "").split(",")
+        if arch.strip()
+    ]
+    if arches:
+        main_multi_arch(arches)
+        return
+
     # 从环境变量获取参数
     region_id = get_env_var("ALIYUN_REGION_ID")
     vpc_id = get_env_var("ALIYUN_VPC_ID")
@@ -1528,13 +2607,25 @@ def main():
     image_name_prefix = get_env_var("IMAGE_NAME_PREFIX")
     arch = os.environ.get("ARCH", "amd64")
     key_pair_name = os.environ.get("ALIYUN_KEY_PAIR_NAME")
-    ram_role_name = os.environ.get("ALIYUN_RAM_ROLE_NAME")
+    # 与 Runner 实例共用自毁角色（构建实例在镜像快照完成后自行释放）
+    ram_role_name = os.environ.get("ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME") or (
+        os.environ.get("ALIYUN_RAM_ROLE_NAME")
+    )
     spot_price_limit = os.environ.get("SPOT_PRICE_LIMIT")
     candidates_file = os.environ.get("CANDIDATES_FILE")
+    zone_id = os.environ.get("ZONE_ID")
+    disk_category_map_file = os.environ.get("DISK_CATEGORY_MAP_FILE")
+    # instance：从运行中的实例创建镜像；snapshot：停机快照后释放实例，再从快照创建镜像
+    image_create_mode = os.environ.get("IMAGE_CREATE_MODE", "instance").lower()
 
     # 验证架构参数
     if arch.lower() not in ("amd64", "arm64"):
         error_exit(f"ARCH must be either 'amd64' or 'arm64', got: {arch}")
+    if image_create_mode not in ("instance", "snapshot"):
+        error_exit(
+            "IMAGE_CREATE_MODE must be 'instance' or 'snapshot', "
+            f"got: {image_create_mode}"
+        )
 
     # 使用统一函数获取基础镜像信息
     base_image_info = get_base_image_info(region_id, arch)
@@ -1557,18 +2648,100 @@ def main():
             "Please ensure aliyun-cli-setup-action is used in the workflow"
         )
 
+    # 解析工具版本并渲染 User Data，版本哈希基于渲染结果计算
+    tool_versions = resolve_tool_versions()
+    # 预热 Docker 构建缓存（构建参数应与 Runner 上的构建一致，否则缓存无法命中；
+    # Runner 上的构建不传 RESTY_J，并复用镜像中的 builder）
+    build_context_b64 = ""
+    if os.environ.get("DOCKER_PREWARM", "false").lower() == "true":
+        build_context_b64 = load_build_context()
+
+    def render(
+        prewarm_list_b64: str,
+        build_context_b64: str,
+        versions: Optional[Dict[str, str]] = None,
+    ) -> str:
+        script = create_user_data_script(
+            arch,
+            prewarm_list_b64,
+            versions or tool_versions,
+            build_context_b64,
+            os.environ.get("DOCKER_PREWARM_BUILD_ARGS", "").split(),
+        )
+        # 替换版本信息变量（在脚本中通过环境变量传递）
+        script = script.replace("${BASE_IMAGE_ID}", image_id)
+        script = script.replace("${BASE_IMAGE_NAME}", image_name)
+        return script.replace("${BASE_IMAGE_CREATION_TIME}", image_creation_time)
+
+    prewarm_list_b64 = load_prewarm_list(os.environ.get("PREWARM_LIST_FILE"))
+    user_data_script = render(prewarm_list_b64, build_context_b64)
+    # 超出上限时依次放弃 Docker 缓存预热和热点文件预热，只影响预热效果
+    if len(user_data_script.encode("utf-8")) > USER_DATA_LIMIT and build_context_b64:
+        print(
+            f"Warning: User Data is {len(user_data_script.encode('utf-8'))} bytes, "
+            "skipping Docker cache prewarm",
+            file=sys.stderr,
+        )
+        build_context_b64 = ""
+        user_data_script = render(prewarm_list_b64, build_context_b64)
+    if len(user_data_script.encode("utf-8")) > USER_DATA_LIMIT and prewarm_list_b64:
+        print(
+            f"Warning: User Data is {len(user_data_script.encode('utf-8'))} bytes, "
+            "skipping hot file prewarm",
+            file=sys.stderr,
+        )
+        prewarm_list_b64 = ""
+        user_data_script = render(prewarm_list_b64, build_context_b64)
+    if len(user_data_script.encode("utf-8")) > USER_DATA_LIMIT:
+        error_exit(
+            f"User Data is {len(user_data_script.encode('utf-8'))} bytes, "
+            "exceeding the 32KB limit"
+        )
+
     # 生成版本哈希（用于镜像标签，无论是否强制构建都需要）
-    version_hash = f"{image_id}_{image_creation_time}"
+    # 基础镜像、工具版本或 User Data 任一变化都会得到新的哈希（热点文件列表除外）
+    manifest = build_image_manifest(
+        arch, base_image_info, tool_versions, render("", build_context_b64)
+    )
+    version_hash = hashlib.sha256(manifest.encode("utf-8")).hexdigest()
+    print(f"Image manifest: {manifest}", file=sys.stderr)
+
+    # 内容哈希：工具版本替换为占位值，只反映基础镜像和 User Data 的其余部分；
+    # 与 ToolVersions 标签一起，用于工具版本查询失败时只比较已解析的部分
+    content_manifest = build_image_manifest(
+        arch,
+        base_image_info,
+        {},
+        render("", build_context_b64, {tool: f"<{tool}>" for tool in tool_versions}),
+    )
+    content_hash = hashlib.sha256(content_manifest.encode("utf-8")).hexdigest()
 
     # 检查是否强制构建（跳过版本检查）
     force_build = os.environ.get("FORCE_BUILD", "false").lower() == "true"
 
+    # 工具版本查询失败时，内容哈希相同且已解析的工具版本一致的 -latest 镜像视为同一版本
+    unresolved = [tool for tool, version in tool_versions.items() if not version]
+    if unresolved and not force_build:
+        print(
+            f"Warning: Unresolved tool versions: {', '.join(unresolved)}",
+            file=sys.stderr,
+        )
+        matched_hash = find_matching_version_hash(
+            region_id,
+            f"{image_name_prefix}-{arch}-latest",
+            content_hash,
+            tool_versions,
+        )
+        if matched_hash:
+            version_hash = matched_hash
+    print(f"Version hash: {version_hash}", file=sys.stderr)
+
     if force_build:
         print("Force build enabled, skipping version check", file=sys.stderr)
     else:
         # 检查是否已存在相同版本的镜像
         existing_image_id = check_existing_image(
-            region_id, image_name_prefix, version_hash
+            region_id, f"{image_name_prefix}-{arch}-latest", version_hash
         )
         if existing_image_id:
             print(f"IMAGE_ID={existing_image_id}", file=sys.stdout)
@@ -1577,17 +2750,24 @@ def main():
                 "Image with matching version already exists, skipping build",
                 file=sys.stderr,
             )
+            # 构建跳过时仍补齐尚未复制的地域（例如新增的目标地域）
+            replicate_latest_image(
+                region_id,
+                existing_image_id,
+                f"{image_name_prefix}-{arch}-latest",
+                f"Custom Ubuntu 24 image for {arch} with pre-installed tools "
+                f"(base: {image_id})",
+                {
+                    "VersionHash": version_hash,
+                    "ContentHash": content_hash,
+                    "BaseImageId": image_id,
+                    "Architecture": arch,
+                    "Latest": "true",
+                },
+                int(os.environ.get("KEEP_IMAGE_COUNT", "5")),
+            )
             return
 
-    # 创建 User Data 脚本
-    user_data_script = create_user_data_script(arch)
-    # 替换版本信息变量（在脚本中通过环境变量传递）
-    user_data_script = user_data_script.replace("${BASE_IMAGE_ID}", image_id)
-    user_data_script = user_data_script.replace("${BASE_IMAGE_NAME}", image_name)
-    user_data_script = user_data_script.replace(
-        "${BASE_IMAGE_CREATION_TIME}", image_creation_time
-    )
-
     # 编码 User Data
     user_data_b64 = base64.b64encode(user_data_script.encode("utf-8")).decode("ascii")
 
@@ -1599,6 +2779,12 @@ def main():
     instance_tags = {
         "GITHUB_RUNNER_TYPE": "aliyun-ecs-spot",
     }
+    # 记录所属的 workflow 运行，供孤儿实例清理交叉核对
+    if os.environ.get("GITHUB_RUN_ID"):
+        instance_tags["GithubRunId"] = os.environ["GITHUB_RUN_ID"]
+
+    # 读取持久化的系统盘类型支持表
+    disk_map = load_disk_category_map(disk_category_map_file)
 
     # 创建临时实例（支持重试机制）
     instance_id = None
@@ -1646,8 +2832,10 @@ def main():
                 "SpotWithPriceLimit" if cand_spot_price_limit else "SpotAsPriceGo"
             )
 
-            # 创建实例（支持磁盘类型降级）
-            disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+            # 创建实例（按支持表选择磁盘类型，必要时降级）
+            disk_categories = get_supported_disk_categories(
+                region_id, cand_instance_type, cand_zone_id, disk_map
+            )
             instance_created = False
             last_error = None
 
@@ -1681,6 +2869,12 @@ def main():
                             f"Instance created successfully with disk category: {disk_category}",
                             file=sys.stderr,
                         )
+                        record_disk_categories(
+                            disk_map,
+                            cand_instance_type,
+                            cand_zone_id,
+                            supported=[disk_category],
+                        )
                         instance_id = candidate_instance_id
                         instance_created = True
                         break
@@ -1694,14 +2888,18 @@ def main():
                 else:
                     # 记录错误信息，继续尝试下一个磁盘类型
                     last_error = response
-                    if (
-                        "InvalidSystemDiskCategory" in response
-                        or "not support" in response.lower()
-                    ):
+                    if is_disk_category_error(response):
                         print(
                             f"Disk category {disk_category} not supported, trying next...",
                             file=sys.stderr,
                         )
+                        if is_disk_category_rejected(response):
+                            record_disk_categories(
+                                disk_map,
+                                cand_instance_type,
+                                cand_zone_id,
+                                unsupported=[disk_category],
+                            )
                     else:
                         # 其他错误，也继续尝试下一个磁盘类型（可能是临时错误）
                         print(
@@ -1729,6 +2927,7 @@ def main():
                     )
                     print(f"Last error preview: {error_preview}", file=sys.stderr)
 
+        save_disk_category_map(disk_category_map_file, disk_map)
         if not instance_id:
             error_exit(
                 f"Failed to create Spot instance after {candidate_count} attempts"
@@ -1743,8 +2942,10 @@ def main():
         # 确定 Spot 策略
         spot_strategy = "SpotWithPriceLimit" if spot_price_limit else "SpotAsPriceGo"
 
-        # 创建实例（支持磁盘类型降级）
-        disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+        # 创建实例（按支持表选择磁盘类型，必要时降级）
+        disk_categories = get_supported_disk_categories(
+            region_id, instance_type, zone_id, disk_map
+        )
         instance_created = False
         last_error = None
 
@@ -1779,6 +2980,9 @@ def main():
                         f"Instance created successfully with disk category: {disk_category}",
                         file=sys.stderr,
                     )
+                    record_disk_categories(
+                        disk_map, instance_type, zone_id, supported=[disk_category]
+                    )
                     instance_created = True
                     break
                 else:
@@ -1791,14 +2995,18 @@ def main():
             else:
                 # 记录错误信息，继续尝试下一个磁盘类型
                 last_error = response
-                if (
-                    "InvalidSystemDiskCategory" in response
-                    or "not support" in response.lower()
-                ):
+                if is_disk_category_error(response):
                     print(
                         f"Disk category {disk_category} not supported, trying next...",
                         file=sys.stderr,
                     )
+                    if is_disk_category_rejected(response):
+                        record_disk_categories(
+                            disk_map,
+                            instance_type,
+                            zone_id,
+                            unsupported=[disk_category],
+                        )
                 else:
                     # 其他错误，也继续尝试下一个磁盘类型（可能是临时错误）
                     print(
@@ -1813,6 +3021,7 @@ def main():
                         print(f"Error preview: {error_preview}", file=sys.stderr)
 
         # 所有磁盘类型都失败了
+        save_disk_category_map(disk_category_map_file, disk_map)
         if not instance_created:
             error_exit(
                 f"Failed to create instance with all disk categories. Last error: {last_error}"
@@ -1825,13 +3034,17 @@ def main():
         print(f"Instance created: {instance_id}", file=sys.stderr)
 
     # 确保清理实例（即使后续步骤失败）
+    image_ready = False
     try:
         # 等待实例就绪
-        if not wait_for_instance_ready(region_id, instance_id):
+        if not wait_for_instance_ready(region_id, [instance_id]):
             error_exit("Instance failed to become ready")
 
         # 等待 User Data 脚本完成
-        if not wait_for_user_data_complete(region_id, instance_id):
+        # 预热构建缓存需要在构建实例上完整编译一次 OpenResty，放宽等待时间
+        if not wait_for_user_data_complete(
+            region_id, instance_id, timeout=3600 if build_context_b64 else 1800
+        ):
             error_exit("User Data script failed to complete")
 
         # 创建自定义镜像（使用固定名称，便于引用）
@@ -1855,12 +3068,34 @@ def main():
         description = f"Custom Ubuntu 24 image for {arch} with pre-installed tools (base: {image_id})"
         tags = {
             "VersionHash": version_hash,
+            "ContentHash": content_hash,
+            "ToolVersions": format_tool_versions(tool_versions),
             "BaseImageId": image_id,
             "Architecture": arch,
             "BuildTimestamp": str(timestamp),
             "Latest": "true",  # 标记为最新版本
         }
 
+        # snapshot 模式：停机后为系统盘创建快照，快照完成即释放实例，再从快照创建镜像，
+        # 镜像创建的等待期间不再占用实例
+        snapshot_id = None
+        if image_create_mode == "snapshot":
+            if not stop_instance(region_id, instance_id):
+                error_exit(f"Failed to stop instance {instance_id}")
+            disk_id = get_system_disk_id(region_id, instance_id)
+            if not disk_id:
+                error_exit(f"Failed to find the system disk of {instance_id}")
+            snapshot_id = create_snapshot(
+                region_id, disk_id, f"{image_name_latest}-{timestamp}", tags
+            )
+            if not snapshot_id:
+                error_exit(f"Failed to create snapshot of {disk_id}")
+            print(f"Snapshot created: {snapshot_id}", file=sys.stderr)
+            if not wait_for_snapshot_ready(region_id, [snapshot_id]):
+                error_exit(f"Snapshot {snapshot_id} failed to become ready")
+            if delete_instance(region_id, instance_id):
+                instance_id = None
+
         print(f"Creating custom image: {image_name_latest}", file=sys.stderr)
         exit_code, response = create_image(
             region_id=region_id,
@@ -1868,6 +3103,8 @@ def main():
             image_name=image_name_latest,
             description=description,
             tags=tags,
+            snapshot_id=snapshot_id,
+            arch=arch,
         )
 
         if exit_code != 0:
@@ -1880,30 +3117,41 @@ def main():
         print(f"Image created: {image_id_new}", file=sys.stderr)
 
         # 等待镜像就绪
-        if not wait_for_image_ready(region_id, image_id_new):
+        if not wait_for_image_ready(region_id, [image_id_new]):
             error_exit("Image failed to become ready")
+        image_ready = True
 
         # 再次清理旧版本镜像（确保不超过保留数量）
-        # 注意：排除新创建的镜像，它应该保持 -latest 后缀
-        print(
-            f"Final cleanup of old images (keeping {keep_count} latest)",
-            file=sys.stderr,
-        )
-        cleanup_old_images(
-            region_id, image_name_latest, keep_count, exclude_image_id=image_id_new
-        )
+        # 注意：排除新创建的镜像，它应该保持 -latest 后缀；多架构模式下由编排统一清理
+        if os.environ.get("SKIP_FINAL_CLEANUP", "false").lower() != "true":
+            print(
+                f"Final cleanup of old images (keeping {keep_count} latest)",
+                file=sys.stderr,
+            )
+            cleanup_old_images(
+                region_id, image_name_latest, keep_count, exclude_image_id=image_id_new
+            )
 
         # 输出结果
         print(f"IMAGE_ID={image_id_new}", file=sys.stdout)
         print(f"IMAGE_NAME={image_name_latest}", file=sys.stdout)
         print("SKIP_BUILD=false", file=sys.stdout)
 
+        # 复制到其他地域（只依赖源镜像，与构建实例的自毁同时进行）
+        replicate_latest_image(
+            region_id, image_id_new, image_name_latest, description, tags, keep_count
+        )
+
     finally:
-        # 清理临时实例（如果自毁机制失败，作为备用）
-        # 注意：如果 RAM 角色配置正确，实例应该已经通过自毁机制删除
-        if instance_id:
+        # 镜像快照完成后实例会自行释放（与镜像就绪几乎同时），这里只在短暂等待后兜底删除；
+        # 构建失败或实例未绑定 RAM 角色（无法自毁）时立即删除
+        if instance_id and not (
+            image_ready
+            and ram_role_name
+            and wait_for_self_release(region_id, instance_id, timeout=90)
+        ):
             print(
-                "Attempting to delete instance as fallback (self-destruct should have already done this)",
+                "Deleting instance as fallback (self-destruct did not release it)",
                 file=sys.stderr,
             )
             delete_instance(region_id, instance_id)
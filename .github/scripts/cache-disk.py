@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+构建缓存数据盘管理
+按架构维护保存 /var/lib/docker（含 BuildKit 状态）的数据盘，
+挂载到新建的 Spot Runner 上（DeleteWithInstance=false，实例释放后数据盘保留），
+跨可用区时从最新的缓存快照创建
+
+用法：
+    cache-disk.py attach    为 INSTANCE_ID 挂载同可用区的空闲缓存盘（没有则创建），输出 DISK_ID
+    cache-disk.py snapshot  为空闲缓存盘创建快照，清理旧快照和多余的数据盘
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+# 缓存盘/快照标签
+CACHE_TAG_KEY = "BuildCache"
+CACHE_CREATED_TAG_KEY = "BuildCacheCreatedAt"
+
+# 缓存盘挂载失败时写入实例的标记文件（与 User Data 模板一致）
+NO_CACHE_DISK_MARKER = "/run/no-cache-disk"
+
+# 数据盘类型优先级
+DISK_CATEGORIES = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 60) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def get_tag(resource: dict, key: str) -> Optional[str]:
+    """读取资源标签值"""
+    for tag in resource.get("Tags", {}).get("Tag", []):
+        if tag.get("TagKey") == key:
+            return tag.get("TagValue")
+    return None
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """解析阿里云时间格式（例如：2024-01-01T00:00Z / 2024-01-01T00:00:00Z）"""
+    for fmt in ("%Y-%m-%dT%H:%MZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return datetime.strptime(value or "", fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def lineage_age_days(resource: dict) -> float:
+    """缓存链路的年龄（天）：以首次冷启动创建缓存的时间为准"""
+    created = parse_time(get_tag(resource, CACHE_CREATED_TAG_KEY)) or parse_time(
+        resource.get("CreationTime")
+    )
+    if not created:
+        return 0.0
+    return (datetime.now(timezone.utc) - created).total_seconds() / 86400
+
+
+def list_cache_disks(
+    region_id: str, arch: str, zone_id: Optional[str] = None
+) -> List[dict]:
+    """列出空闲的缓存盘（最新在前）"""
+    args = [
+        "DescribeDisks",
+        "--RegionId",
+        region_id,
+        "--Status",
+        "Available",
+        "--Tag.1.Key",
+        CACHE_TAG_KEY,
+        "--Tag.1.Value",
+        arch,
+        "--PageSize",
+        "100",
+    ]
+    if zone_id:
+        args.extend(["--ZoneId", zone_id])
+
+    data = run_aliyun(args, timeout=30)
+    disks = (data or {}).get("Disks", {}).get("Disk", [])
+    disks.sort(key=lambda d: d.get("CreationTime", ""), reverse=True)
+    return disks
+
+
+def list_cache_snapshots(region_id: str, arch: str) -> List[dict]:
+    """列出已完成的缓存快照（最新在前）"""
+    data = run_aliyun(
+        [
+            "DescribeSnapshots",
+            "--RegionId",
+            region_id,
+            "--Status",
+            "accomplished",
+            "--Tag.1.Key",
+            CACHE_TAG_KEY,
+            "--Tag.1.Value",
+            arch,
+            "--PageSize",
+            "100",
+        ],
+        timeout=30,
+    )
+    snapshots = (data or {}).get("Snapshots", {}).get("Snapshot", [])
+    snapshots.sort(key=lambda s: s.get("CreationTime", ""), reverse=True)
+    return snapshots
+
+
+def wait_for_instance(region_id: str, instance_id: str, timeout: int = 300) -> dict:
+    """等待实例进入可挂载数据盘的状态（Running/Stopped）"""
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--InstanceIds",
+                json.dumps([instance_id]),
+            ],
+            timeout=30,
+        )
+        instances = (data or {}).get("Instances", {}).get("Instance", [])
+        if instances and instances[0].get("Status") in ("Running", "Stopped"):
+            return instances[0]
+        time.sleep(5)
+
+    error_exit(f"Instance {instance_id} did not become Running within {timeout}s")
+
+
+def wait_for_disk(region_id: str, disk_id: str, timeout: int = 300) -> bool:
+    """等待数据盘进入 Available 状态"""
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        data = run_aliyun(
+            [
+                "DescribeDisks",
+                "--RegionId",
+                region_id,
+                "--DiskIds",
+                json.dumps([disk_id]),
+            ],
+            timeout=30,
+        )
+        disks = (data or {}).get("Disks", {}).get("Disk", [])
+        if disks and disks[0].get("Status") == "Available":
+            return True
+        time.sleep(5)
+    return False
+
+
+def create_cache_disk(
+    region_id: str,
+    zone_id: str,
+    arch: str,
+    size_gb: int,
+    disk_category: str,
+    max_age_days: float,
+) -> Optional[str]:
+    """创建缓存盘：优先从未过期的最新缓存快照创建，否则创建空盘"""
+    snapshot = None
+    for candidate in list_cache_snapshots(region_id, arch):
+        if lineage_age_days(candidate) <= max_age_days:
+            snapshot = candidate
+            break
+
+    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if snapshot:
+        created_at = get_tag(snapshot, CACHE_CREATED_TAG_KEY) or snapshot.get(
+            "CreationTime", created_at
+        )
+        size_gb = max(size_gb, int(snapshot.get("SourceDiskSize") or 0))
+        print(
+            f"Creating cache disk from snapshot {snapshot['SnapshotId']}",
+            file=sys.stderr,
+        )
+    else:
+        print("Creating empty cache disk (cold cache)", file=sys.stderr)
+
+    categories = [disk_category] + [c for c in DISK_CATEGORIES if c != disk_category]
+    for category in categories:
+        args = [
+            "CreateDisk",
+            "--RegionId",
+            region_id,
+            "--ZoneId",
+            zone_id,
+            "--DiskName",
+            f"build-cache-{arch}",
+            "--DiskCategory",
+            category,
+            "--Size",
+            str(size_gb),
+            "--Tag.1.Key",
+            CACHE_TAG_KEY,
+            "--Tag.1.Value",
+            arch,
+            "--Tag.2.Key",
+            CACHE_CREATED_TAG_KEY,
+            "--Tag.2.Value",
+            created_at,
+        ]
+        if snapshot:
+            args.extend(["--SnapshotId", snapshot["SnapshotId"]])
+
+        data = run_aliyun(args)
+        if data and data.get("DiskId"):
+            disk_id = data["DiskId"]
+            if wait_for_disk(region_id, disk_id):
+                return disk_id
+            print(f"Disk {disk_id} did not become Available", file=sys.stderr)
+            return None
+
+    return None
+
+
+def attach(region_id: str, arch: str) -> None:
+    """为实例挂载缓存盘"""
+    instance_id = get_env_var("INSTANCE_ID")
+    size_gb = int(os.environ.get("CACHE_DISK_SIZE", "100"))
+    disk_category = os.environ.get("CACHE_DISK_CATEGORY", "cloud_essd")
+    max_age_days = float(os.environ.get("CACHE_MAX_AGE_DAYS", "7"))
+
+    instance = wait_for_instance(region_id, instance_id)
+    zone_id = instance.get("ZoneId")
+    print(f"Instance {instance_id} is in zone {zone_id}", file=sys.stderr)
+
+    # AttachDisk 只会对一个实例成功，作为并发运行之间的认领：挂载失败（多半已被
+    # 其他运行抢先挂载）时换下一块空闲盘，都不可用时新建
+    for disk in list_cache_disks(region_id, arch, zone_id):
+        age_days = lineage_age_days(disk)
+        if age_days > max_age_days:
+            # 缓存过旧：删除后冷启动，限制缓存漂移和累积
+            print(
+                f"Deleting stale cache disk {disk['DiskId']} ({age_days:.1f} days old)",
+                file=sys.stderr,
+            )
+            run_aliyun(["DeleteDisk", "--DiskId", disk["DiskId"]])
+            continue
+        print(f"Reusing cache disk {disk['DiskId']}", file=sys.stderr)
+        if attach_disk(instance_id, disk["DiskId"]):
+            return
+        print(f"Failed to attach {disk['DiskId']}, trying next", file=sys.stderr)
+
+    disk_id = create_cache_disk(
+        region_id, zone_id, arch, size_gb, disk_category, max_age_days
+    )
+    if disk_id and attach_disk(instance_id, disk_id):
+        return
+
+    # User Data 在等待数据盘，通知它不再等待，直接使用本地盘
+    signal_no_cache_disk(region_id, instance_id)
+    error_exit(f"Failed to attach a build cache disk to {instance_id}")
+
+
+def attach_disk(instance_id: str, disk_id: str) -> bool:
+    """挂载缓存盘（实例释放后保留），成功时输出 DISK_ID"""
+    data = run_aliyun(
+        [
+            "AttachDisk",
+            "--InstanceId",
+            instance_id,
+            "--DiskId",
+            disk_id,
+            "--DeleteWithInstance",
+            "false",
+        ]
+    )
+    if data is None:
+        return False
+
+    print(f"Cache disk {disk_id} attached to {instance_id}", file=sys.stderr)
+    print(f"DISK_ID={disk_id}")
+    return True
+
+
+def signal_no_cache_disk(region_id: str, instance_id: str) -> None:
+    """通过云助手在实例上写入标记文件，User Data 看到后停止等待缓存盘"""
+    data = run_aliyun(
+        [
+            "RunCommand",
+            "--RegionId",
+            region_id,
+            "--Type",
+            "RunShellScript",
+            "--CommandContent",
+            f"touch {NO_CACHE_DISK_MARKER}",
+            "--InstanceId.1",
+            instance_id,
+            "--Name",
+            "no-cache-disk",
+        ]
+    )
+    if data is None:
+        print(
+            "Warning: Failed to notify the instance, its user data will wait "
+            "for the cache disk until timeout",
+            file=sys.stderr,
+        )
+
+
+def snapshot(region_id: str, arch: str) -> None:
+    """为空闲缓存盘创建快照，并清理旧快照和多余的数据盘"""
+    keep_snapshots = int(os.environ.get("CACHE_SNAPSHOT_KEEP", "2"))
+    disks_per_zone = int(os.environ.get("CACHE_DISKS_PER_ZONE", "2"))
+
+    disks = list_cache_disks(region_id, arch)
+    creating = False
+    if disks:
+        # 只为最新的空闲缓存盘创建快照
+        disk = disks[0]
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M")
+        data = run_aliyun(
+            [
+                "CreateSnapshot",
+                "--DiskId",
+                disk["DiskId"],
+                "--SnapshotName",
+                f"build-cache-{arch}-{timestamp}",
+                "--Tag.1.Key",
+                CACHE_TAG_KEY,
+                "--Tag.1.Value",
+                arch,
+                "--Tag.2.Key",
+                CACHE_CREATED_TAG_KEY,
+                "--Tag.2.Value",
+                get_tag(disk, CACHE_CREATED_TAG_KEY) or disk.get("CreationTime", ""),
+            ]
+        )
+        if data and data.get("SnapshotId"):
+            creating = True
+            print(
+                f"Snapshot {data['SnapshotId']} created from {disk['DiskId']}",
+                file=sys.stderr,
+            )
+    else:
+        print(f"No available {arch} cache disk to snapshot", file=sys.stderr)
+
+    # 保留最新的若干快照：列表只含已完成的快照，正在创建的快照也计入保留数量，
+    # 但至少保留一个已完成的快照，以防新快照创建失败
+    keep_accomplished = max(1, keep_snapshots - 1) if creating else keep_snapshots
+    for old_snapshot in list_cache_snapshots(region_id, arch)[keep_accomplished:]:
+        print(f"Deleting old snapshot {old_snapshot['SnapshotId']}", file=sys.stderr)
+        run_aliyun(["DeleteSnapshot", "--SnapshotId", old_snapshot["SnapshotId"]])
+
+    # 并发构建会在同一可用区创建额外的缓存盘，每个可用区只保留最新的若干块
+    per_zone = {}
+    for disk in disks:
+        per_zone.setdefault(disk.get("ZoneId"), []).append(disk)
+    for zone_disks in per_zone.values():
+        for extra in zone_disks[disks_per_zone:]:
+            print(f"Deleting extra cache disk {extra['DiskId']}", file=sys.stderr)
+            run_aliyun(["DeleteDisk", "--DiskId", extra["DiskId"]])
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("attach", "snapshot"):
+        error_exit("Usage: cache-disk.py attach|snapshot")
+
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    arch = os.environ.get("ARCH", "amd64")
+
+    if sys.argv[1] == "attach":
+        attach(region_id, arch)
+    else:
+        snapshot(region_id, arch)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,27 @@ import subprocess
 import base64
 import json
 import re
-from typing import Optional, List, Tuple
+import time
+from typing import Optional, List, Tuple, Union
+
+from disk_category_map import (
+    DISK_CATEGORIES,
+    load_disk_category_map,
+    save_disk_category_map,
+    record_disk_categories,
+    get_supported_disk_categories,
+    is_disk_category_error,
+    is_disk_category_rejected,
+)
+
+# gzip 文件头（render-user-data.py 的 gzip 模式输出）
+GZIP_MAGIC = b"\x1f\x8b"
+
+# 弹性供应组调用超时的退出码（调用结果未知，供应组可能仍会交付实例）
+FLEET_TIMEOUT_EXIT_CODE = 124
+
+# 弹性供应组调用超时后查找其交付实例的等待时间（秒）
+FLEET_LOOKUP_TIMEOUT = 120
 
 
 def error_exit(message: str) -> None:
@@ -29,12 +49,22 @@ def get_env_var(name: str, default: Optional[str] = None) -> str:
 
 def read_user_data(
     user_data_file: Optional[str] = None, user_data: Optional[str] = None
-) -> Optional[str]:
-    """读取 User Data"""
+) -> Optional[Union[str, bytes]]:
+    """读取 User Data
+
+    render-user-data.py 生成的 gzip 压缩内容按字节原样返回，不做换行规范化
+    """
     if user_data_file and os.path.isfile(user_data_file):
-        with open(user_data_file, "r", encoding="utf-8") as f:
-            raw_data = f.read()
+        with open(user_data_file, "rb") as f:
+            raw_bytes = f.read()
+        if raw_bytes[:2] == GZIP_MAGIC:
+            print(
+                f"Using User Data from file: {user_data_file} ({len(raw_bytes)} bytes, gzip)",
+                file=sys.stderr,
+            )
+            return raw_bytes
         # 规范化换行（去除 CRLF）
+        raw_data = raw_bytes.decode("utf-8")
         user_data = raw_data.replace("\r\n", "\n").replace("\r", "\n")
         size = len(user_data.encode("utf-8"))
         print(
@@ -56,18 +86,22 @@ def read_user_data(
         return None
 
 
-def ensure_shebang(user_data: str) -> str:
-    """确保 User Data 有 shebang"""
+def ensure_shebang(user_data: Union[str, bytes]) -> Union[str, bytes]:
+    """确保 User Data 有 shebang（压缩内容跳过）"""
+    if isinstance(user_data, bytes):
+        return user_data
     if not user_data.startswith("#!"):
         print("User Data missing shebang; prepending #!/bin/bash", file=sys.stderr)
         return "#!/bin/bash\n" + user_data
     return user_data
 
 
-def encode_user_data(user_data: str) -> str:
+def encode_user_data(user_data: Union[str, bytes]) -> str:
     """将 User Data 编码为 base64"""
     try:
-        encoded = base64.b64encode(user_data.encode("utf-8")).decode("ascii")
+        if isinstance(user_data, str):
+            user_data = user_data.encode("utf-8")
+        encoded = base64.b64encode(user_data).decode("ascii")
         return encoded
     except (UnicodeEncodeError, UnicodeDecodeError) as e:
         error_exit(f"Failed to encode User Data to base64: {e}")
@@ -219,73 +253,25 @@ def calculate_spot_price_limit(
     return default_limit
 
 
-def get_supported_disk_category(
-    region_id: str, instance_type: str, zone_id: Optional[str] = None
-) -> str:
-    """获取实例类型支持的系统盘类型（降级策略）"""
-    # 磁盘类型优先级：cloud_essd -> cloud_ssd -> cloud_efficiency
-    disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
-
-    # 如果没有指定可用区，尝试查询（可选）
-    if not zone_id:
-        # 先尝试查询实例类型支持的磁盘类型
-        try:
-            cmd = [
-                "aliyun",
-                "ecs",
-                "DescribeAvailableResource",
-                "--RegionId",
-                region_id,
-                "--InstanceType",
-                instance_type,
-                "--DestinationResource",
-                "SystemDisk",
-            ]
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, check=True, timeout=30
-            )
-            data = json.loads(result.stdout)
-
-            # 解析支持的磁盘类型
-            if (
-                "AvailableZones" in data
-                and "AvailableZone" in data["AvailableZones"]
-                and len(data["AvailableZones"]["AvailableZone"]) > 0
-            ):
-                zone = data["AvailableZones"]["AvailableZone"][0]
-                if (
-                    "AvailableResources" in zone
-                    and "AvailableResource" in zone["AvailableResources"]
-                    and len(zone["AvailableResources"]["AvailableResource"]) > 0
-                ):
-                    resource = zone["AvailableResources"]["AvailableResource"][0]
-                    if (
-                        "SupportedResources" in resource
-                        and "SupportedResource" in resource["SupportedResources"]
-                    ):
-                        supported = resource["SupportedResources"]["SupportedResource"]
-                        supported_categories = [
-                            r.get("Value", "") for r in supported if r.get("Value", "")
-                        ]
-
-                        # 按优先级选择第一个支持的磁盘类型
-                        for category in disk_categories:
-                            if category in supported_categories:
-                                print(
-                                    f"Instance type {instance_type} supports disk category: {category}",
-                                    file=sys.stderr,
-                                )
-                                return category
-
-        except (subprocess.SubprocessError, json.JSONDecodeError, KeyError) as e:
-            print(
-                f"Warning: Failed to query supported disk categories: {e}",
-                file=sys.stderr,
-            )
+def parse_instance_tags(value: Optional[str]) -> List[Tuple[str, str]]:
+    """解析额外的实例标签（格式：Key=Value,Key=Value）"""
+    tags = []
+    for item in (value or "").split(","):
+        key, sep, tag_value = item.partition("=")
+        if sep and key.strip():
+            tags.append((key.strip(), tag_value.strip()))
+    return tags
 
-    # 如果查询失败，使用降级策略：尝试创建实例，如果失败则降级
-    # 这里先返回 cloud_essd，如果创建失败，调用方可以重试其他类型
-    return "cloud_essd"
+
+def build_tag_args(
+    prefix: str, extra_tags: Optional[List[Tuple[str, str]]] = None
+) -> List[str]:
+    """构建标签参数（GITHUB_RUNNER_TYPE 标签始终在第一位）"""
+    tags = [("GITHUB_RUNNER_TYPE", "aliyun-ecs-spot")] + list(extra_tags or [])
+    args = []
+    for index, (key, value) in enumerate(tags, 1):
+        args.extend([f"{prefix}.{index}.Key", key, f"{prefix}.{index}.Value", value])
+    return args
 
 
 def create_instance(
@@ -301,11 +287,19 @@ def create_instance(
     spot_price_limit: Optional[str] = None,
     user_data_b64: Optional[str] = None,
     system_disk_category: Optional[str] = None,
+    launch_template_id: Optional[str] = None,
+    launch_template_version: Optional[str] = None,
+    extra_tags: Optional[List[Tuple[str, str]]] = None,
 ) -> Tuple[int, str]:
-    """创建 ECS 实例"""
+    """创建 ECS 实例
+
+    指定启动模板时，镜像、安全组、RAM 角色、密钥对和标签由模板提供，
+    只覆盖实例规格、交换机、名称、价格、系统盘类型和 User Data
+    """
     # 如果没有指定磁盘类型，自动检测
     if not system_disk_category:
-        system_disk_category = get_supported_disk_category(region_id, instance_type)
+        categories = get_supported_disk_categories(region_id, instance_type)
+        system_disk_category = categories[0]
 
     cmd = [
         "aliyun",
@@ -313,12 +307,8 @@ def create_instance(
         "RunInstances",
         "--RegionId",
         region_id,
-        "--ImageId",
-        image_id,
         "--InstanceType",
         instance_type,
-        "--SecurityGroupId",
-        security_group_id,
         "--VSwitchId",
         vswitch_id,
         "--InstanceName",
@@ -327,19 +317,33 @@ def create_instance(
         "PostPaid",
         "--SystemDisk.Category",
         system_disk_category,
-        "--SecurityEnhancementStrategy",
-        "Deactive",
-        "--Tag.1.Key",
-        "GITHUB_RUNNER_TYPE",
-        "--Tag.1.Value",
-        "aliyun-ecs-spot",
     ]
 
-    if key_pair_name:
-        cmd.extend(["--KeyPairName", key_pair_name])
+    if launch_template_id:
+        cmd.extend(["--LaunchTemplateId", launch_template_id])
+        if launch_template_version:
+            cmd.extend(["--LaunchTemplateVersion", launch_template_version])
+        # 传入标签会覆盖模板中的标签，因此连同 GITHUB_RUNNER_TYPE 一起传入
+        if extra_tags:
+            cmd.extend(build_tag_args("--Tag", extra_tags))
+    else:
+        cmd.extend(
+            [
+                "--ImageId",
+                image_id,
+                "--SecurityGroupId",
+                security_group_id,
+                "--SecurityEnhancementStrategy",
+                "Deactive",
+            ]
+            + build_tag_args("--Tag", extra_tags)
+        )
 
-    if ram_role_name:
-        cmd.extend(["--RamRoleName", ram_role_name])
+        if key_pair_name:
+            cmd.extend(["--KeyPairName", key_pair_name])
+
+        if ram_role_name:
+            cmd.extend(["--RamRoleName", ram_role_name])
 
     if spot_strategy == "SpotWithPriceLimit" and spot_price_limit:
         cmd.extend(
@@ -384,6 +388,301 @@ def extract_instance_id(response: str) -> Optional[str]:
     return None
 
 
+def create_fleet_instance(
+    region_id: str,
+    image_id: str,
+    candidates: List[Tuple[str, str, str, str, Optional[int]]],
+    security_group_id: str,
+    instance_name: str,
+    key_pair_name: Optional[str] = None,
+    ram_role_name: Optional[str] = None,
+    user_data_b64: Optional[str] = None,
+    disk_categories: Optional[List[str]] = None,
+    allocation_strategy: str = "lowest-price",
+    extra_tags: Optional[List[Tuple[str, str]]] = None,
+) -> Tuple[int, str]:
+    """通过一次性弹性供应组（instant）在全部候选中一次调用创建实例
+
+    Args:
+        candidates: 候选列表 (instance_type, zone_id, vswitch_id, price_limit, cpu)，
+            顺序即优先级
+        disk_categories: 按优先级排列的系统盘类型，由供应组依次尝试
+        allocation_strategy: lowest-price | diversified | capacity-optimized
+
+    Returns:
+        (退出码, 响应内容)
+    """
+    cmd = [
+        "aliyun",
+        "ecs",
+        "CreateAutoProvisioningGroup",
+        "--RegionId",
+        region_id,
+        "--AutoProvisioningGroupName",
+        instance_name,
+        "--AutoProvisioningGroupType",
+        "instant",
+        "--TotalTargetCapacity",
+        "1",
+        "--SpotTargetCapacity",
+        "1",
+        "--PayAsYouGoTargetCapacity",
+        "0",
+        "--DefaultTargetCapacityType",
+        "Spot",
+        "--SpotAllocationStrategy",
+        allocation_strategy,
+        "--SpotInstanceInterruptionBehavior",
+        "terminate",
+        "--LaunchConfiguration.ImageId",
+        image_id,
+        "--LaunchConfiguration.SecurityGroupId",
+        security_group_id,
+        "--LaunchConfiguration.InstanceName",
+        instance_name,
+        "--LaunchConfiguration.SecurityEnhancementStrategy",
+        "Deactive",
+    ] + build_tag_args("--LaunchConfiguration.Tag", extra_tags)
+
+    if key_pair_name:
+        cmd.extend(["--LaunchConfiguration.KeyPairName", key_pair_name])
+
+    if ram_role_name:
+        cmd.extend(["--LaunchConfiguration.RamRoleName", ram_role_name])
+
+    if user_data_b64:
+        cmd.extend(["--LaunchConfiguration.UserData", user_data_b64])
+
+    for index, disk_category in enumerate(disk_categories or [], 1):
+        cmd.extend([f"--SystemDiskConfig.{index}.DiskCategory", disk_category])
+
+    # 候选顺序即优先级（Priority 越小越优先）
+    index = 0
+    for (
+        cand_instance_type,
+        _zone,
+        cand_vswitch_id,
+        cand_price_limit,
+        _cpu,
+    ) in candidates:
+        if not cand_vswitch_id:
+            continue
+        index += 1
+        prefix = f"--LaunchTemplateConfig.{index}"
+        cmd.extend(
+            [
+                f"{prefix}.InstanceType",
+                cand_instance_type,
+                f"{prefix}.VSwitchId",
+                cand_vswitch_id,
+                f"{prefix}.Priority",
+                str(index - 1),
+                f"{prefix}.WeightedCapacity",
+                "1",
+            ]
+        )
+        if cand_price_limit:
+            cmd.extend([f"{prefix}.MaxPrice", cand_price_limit])
+
+    if index == 0:
+        return 1, "No usable candidates for fleet launch"
+
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=120
+        )
+        return result.returncode, result.stdout + result.stderr
+    except subprocess.TimeoutExpired as e:
+        return FLEET_TIMEOUT_EXIT_CODE, str(e)
+    except (subprocess.SubprocessError, OSError) as e:
+        return 1, str(e)
+
+
+def run_ecs(args: List[str], timeout: int = 30) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    try:
+        result = subprocess.run(
+            ["aliyun", "ecs"] + args,
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=timeout,
+        )
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except (subprocess.SubprocessError, OSError, json.JSONDecodeError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+
+def recover_fleet_launch(
+    region_id: str, instance_name: str
+) -> Tuple[Optional[str], bool]:
+    """弹性供应组调用超时后确认其结果
+
+    先按实例名称查找供应组交付的实例；在等待时间内未找到时删除同名供应组（连同其实例），
+    确保回退到逐个启动时不会多出一台实例
+
+    Returns:
+        (交付的实例 ID 或 None, 是否可以安全回退到逐个启动)
+    """
+    deadline = time.time() + FLEET_LOOKUP_TIMEOUT
+    while True:
+        data = run_ecs(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--InstanceName",
+                instance_name,
+            ]
+        )
+        instances = (data or {}).get("Instances", {}).get("Instance", [])
+        if instances:
+            instance = instances[0]
+            print(
+                f"Fleet launch timed out but delivered {instance.get('InstanceId')}",
+                file=sys.stderr,
+            )
+            print(f"Instance Type: {instance.get('InstanceType')}", file=sys.stderr)
+            print(f"Zone: {instance.get('ZoneId')}", file=sys.stderr)
+            return instance.get("InstanceId"), True
+        if time.time() >= deadline:
+            break
+        time.sleep(10)
+
+    data = run_ecs(
+        [
+            "DescribeAutoProvisioningGroups",
+            "--RegionId",
+            region_id,
+            "--AutoProvisioningGroupName",
+            instance_name,
+        ]
+    )
+    if data is None:
+        return None, False
+    groups = data.get("AutoProvisioningGroups", {}).get("AutoProvisioningGroup", [])
+    for group in groups:
+        group_id = group.get("AutoProvisioningGroupId")
+        print(f"Deleting timed out auto provisioning group {group_id}", file=sys.stderr)
+        if (
+            run_ecs(
+                [
+                    "DeleteAutoProvisioningGroup",
+                    "--RegionId",
+                    region_id,
+                    "--AutoProvisioningGroupId",
+                    group_id,
+                    "--TerminateInstances",
+                    "true",
+                ]
+            )
+            is None
+        ):
+            return None, False
+    return None, True
+
+
+def extract_fleet_instance(response: str) -> Tuple[Optional[str], List[dict]]:
+    """从弹性供应组响应中提取实例 ID 及各候选的启动结果
+
+    Returns:
+        (实例 ID 或 None, LaunchResult 列表)
+    """
+    try:
+        data = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        return None, []
+
+    if not isinstance(data, dict):
+        return None, []
+
+    launch_results = data.get("LaunchResults", {}).get("LaunchResult", [])
+    if not isinstance(launch_results, list):
+        return None, []
+
+    for launch_result in launch_results:
+        instance_ids = launch_result.get("InstanceIds", {}).get("InstanceId", [])
+        if isinstance(instance_ids, list) and instance_ids:
+            return instance_ids[0], launch_results
+
+    return None, launch_results
+
+
+def launch_fleet(
+    region_id: str,
+    image_id: str,
+    candidates: List[Tuple[str, str, str, str, Optional[int]]],
+    security_group_id: str,
+    instance_name: str,
+    key_pair_name: Optional[str],
+    ram_role_name: Optional[str],
+    user_data_b64: Optional[str],
+    disk_map: dict,
+    allocation_strategy: str,
+    extra_tags: Optional[List[Tuple[str, str]]] = None,
+) -> Tuple[Optional[str], bool]:
+    """以单次调用在所有候选中启动实例
+
+    Returns:
+        (实例 ID 或 None, 失败时是否可以安全回退到逐个启动)
+    """
+    # 合并各候选支持的系统盘类型，保持 DISK_CATEGORIES 的优先顺序
+    supported = set()
+    for cand_instance_type, cand_zone_id, _vswitch, _price, _cpu in candidates:
+        supported.update(
+            get_supported_disk_categories(
+                region_id, cand_instance_type, cand_zone_id, disk_map
+            )
+        )
+    disk_categories = [c for c in DISK_CATEGORIES if c in supported]
+
+    print(
+        f"Launching via auto provisioning group across {len(candidates)} candidates "
+        f"(strategy: {allocation_strategy}, disk categories: {', '.join(disk_categories)})",
+        file=sys.stderr,
+    )
+    exit_code, response = create_fleet_instance(
+        region_id=region_id,
+        image_id=image_id,
+        candidates=candidates,
+        security_group_id=security_group_id,
+        instance_name=instance_name,
+        key_pair_name=key_pair_name,
+        ram_role_name=ram_role_name,
+        user_data_b64=user_data_b64,
+        disk_categories=disk_categories,
+        allocation_strategy=allocation_strategy,
+        extra_tags=extra_tags,
+    )
+    if exit_code == FLEET_TIMEOUT_EXIT_CODE:
+        # 调用超时不代表供应组失败，直接回退可能同时得到两台实例
+        print(f"Fleet launch timed out: {response[:500]}", file=sys.stderr)
+        return recover_fleet_launch(region_id, instance_name)
+    if exit_code != 0:
+        print(f"Fleet launch failed: {response[:500]}", file=sys.stderr)
+        return None, True
+
+    instance_id, launch_results = extract_fleet_instance(response)
+    for launch_result in launch_results:
+        if launch_result.get("ErrorCode"):
+            print(
+                f"Fleet candidate {launch_result.get('InstanceType')} in "
+                f"{launch_result.get('ZoneId')} failed: "
+                f"{launch_result.get('ErrorCode')} {launch_result.get('ErrorMsg', '')}",
+                file=sys.stderr,
+            )
+        elif launch_result.get("InstanceIds", {}).get("InstanceId"):
+            print(
+                f"Instance Type: {launch_result.get('InstanceType')}", file=sys.stderr
+            )
+            print(f"Zone: {launch_result.get('ZoneId')}", file=sys.stderr)
+
+    if not instance_id:
+        print("Fleet launch returned no instance", file=sys.stderr)
+    return instance_id, True
+
+
 def main():
     """主函数"""
     # 从环境变量获取参数
@@ -402,6 +701,16 @@ def main():
     arch = os.environ.get("ARCH", "amd64")
     spot_price_limit = os.environ.get("SPOT_PRICE_LIMIT")
     candidates_file = os.environ.get("CANDIDATES_FILE")
+    zone_id = os.environ.get("ZONE_ID")
+    disk_category_map_file = os.environ.get("DISK_CATEGORY_MAP_FILE")
+    launch_mode = os.environ.get("LAUNCH_MODE", "sequential").strip().lower()
+    fleet_allocation_strategy = os.environ.get(
+        "FLEET_ALLOCATION_STRATEGY", "lowest-price"
+    )
+    launch_template_id = os.environ.get("LAUNCH_TEMPLATE_ID")
+    launch_template_version = os.environ.get("LAUNCH_TEMPLATE_VERSION")
+    # 额外的实例标签（例如调度器记录的 RunnerSlots）
+    extra_tags = parse_instance_tags(os.environ.get("INSTANCE_TAGS"))
 
     # 使用统一函数获取镜像 ID（支持镜像族系）
     image_id = get_image_id(region_id, arch)
@@ -434,6 +743,14 @@ def main():
     if user_data_content:
         user_data_content = ensure_shebang(user_data_content)
 
+    # 只编码一次，所有候选共用
+    user_data_b64 = None
+    if user_data_content:
+        user_data_b64 = encode_user_data(user_data_content)
+
+    # 读取持久化的系统盘类型支持表
+    disk_map = load_disk_category_map(disk_category_map_file)
+
     print("=== Creating Spot Instance ===", file=sys.stderr)
     print(f"Instance Name: {instance_name}", file=sys.stderr)
     print(f"Instance Type: {instance_type}", file=sys.stderr)
@@ -445,6 +762,11 @@ def main():
     print(f"Image ID: {image_id}", file=sys.stderr)
     if key_pair_name:
         print(f"Key Pair Name: {key_pair_name}", file=sys.stderr)
+    if launch_template_id:
+        print(
+            f"Launch Template: {launch_template_id} (version: {launch_template_version or 'default'})",
+            file=sys.stderr,
+        )
     if spot_price_limit:
         print(f"Spot Price Limit: {spot_price_limit}", file=sys.stderr)
 
@@ -454,6 +776,37 @@ def main():
         candidate_count = len(candidates)
         print(f"Found {candidate_count} candidate instances for retry", file=sys.stderr)
 
+        # fleet 模式：一次调用交给弹性供应组在全部候选中选择，失败再逐个重试
+        if launch_mode == "fleet" and candidates:
+            instance_id, can_fall_back = launch_fleet(
+                region_id=region_id,
+                image_id=image_id,
+                candidates=candidates,
+                security_group_id=security_group_id,
+                instance_name=instance_name,
+                key_pair_name=key_pair_name,
+                ram_role_name=ram_role_name,
+                user_data_b64=user_data_b64,
+                disk_map=disk_map,
+                allocation_strategy=fleet_allocation_strategy,
+                extra_tags=extra_tags,
+            )
+            save_disk_category_map(disk_category_map_file, disk_map)
+            if instance_id:
+                print("Spot instance created successfully via fleet", file=sys.stderr)
+                print(instance_id)
+                sys.exit(0)
+            if not can_fall_back:
+                error_exit(
+                    "Fleet launch timed out and its outcome could not be confirmed, "
+                    "not launching a second instance"
+                )
+            print(
+                "Warning: Fleet launch did not deliver an instance, "
+                "falling back to sequential launch",
+                file=sys.stderr,
+            )
+
         # 尝试每个候选结果
         for attempt, (
             cand_instance_type,
@@ -475,18 +828,15 @@ def main():
                 file=sys.stderr,
             )
 
-            # 编码 User Data
-            user_data_b64 = None
-            if user_data_content:
-                user_data_b64 = encode_user_data(user_data_content)
-
             # 确定 Spot 策略
             spot_strategy = (
                 "SpotWithPriceLimit" if cand_spot_price_limit else "SpotAsPriceGo"
             )
 
-            # 创建实例（支持磁盘类型降级）
-            disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+            # 创建实例（按支持表选择磁盘类型，必要时降级）
+            disk_categories = get_supported_disk_categories(
+                region_id, cand_instance_type, cand_zone_id, disk_map
+            )
             instance_created = False
 
             for disk_category in disk_categories:
@@ -507,6 +857,9 @@ def main():
                     spot_price_limit=cand_spot_price_limit,
                     user_data_b64=user_data_b64,
                     system_disk_category=disk_category,
+                    launch_template_id=launch_template_id,
+                    launch_template_version=launch_template_version,
+                    extra_tags=extra_tags,
                 )
 
                 # 检查是否成功
@@ -517,6 +870,13 @@ def main():
                             f"Spot instance created successfully on attempt {attempt} with disk category: {disk_category}",
                             file=sys.stderr,
                         )
+                        record_disk_categories(
+                            disk_map,
+                            cand_instance_type,
+                            cand_zone_id,
+                            supported=[disk_category],
+                        )
+                        save_disk_category_map(disk_category_map_file, disk_map)
                         print(f"Instance Type: {cand_instance_type}", file=sys.stderr)
                         print(f"Zone: {cand_zone_id}", file=sys.stderr)
                         print(f"VSwitch: {cand_vswitch_id}", file=sys.stderr)
@@ -531,14 +891,18 @@ def main():
                         )
                 else:
                     # 检查错误信息，如果是磁盘类型不支持，尝试下一个
-                    if (
-                        "InvalidSystemDiskCategory" in response
-                        or "not support" in response.lower()
-                    ):
+                    if is_disk_category_error(response):
                         print(
                             f"Disk category {disk_category} not supported, trying next...",
                             file=sys.stderr,
                         )
+                        if is_disk_category_rejected(response):
+                            record_disk_categories(
+                                disk_map,
+                                cand_instance_type,
+                                cand_zone_id,
+                                unsupported=[disk_category],
+                            )
                         continue
                     else:
                         # 其他错误，不继续尝试
@@ -554,6 +918,7 @@ def main():
                     print(f"Response: {response[:500]}...", file=sys.stderr)
 
         # 所有候选结果都失败了
+        save_disk_category_map(disk_category_map_file, disk_map)
         error_exit(f"Failed to create Spot instance after {candidate_count} attempts")
     else:
         # 没有候选结果文件，使用原始逻辑（单次尝试）
@@ -563,11 +928,6 @@ def main():
         if not vswitch_id:
             error_exit("ALIYUN_VSWITCH_ID is required")
 
-        # 编码 User Data
-        user_data_b64 = None
-        if user_data_content:
-            user_data_b64 = encode_user_data(user_data_content)
-
         # 确定 Spot 策略
         spot_strategy = "SpotWithPriceLimit" if spot_price_limit else "SpotAsPriceGo"
 
@@ -578,8 +938,10 @@ def main():
         print(f"Executing command: {cmd_display}", file=sys.stderr)
         print("About to execute Aliyun CLI command...", file=sys.stderr)
 
-        # 创建实例（支持磁盘类型降级）
-        disk_categories = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+        # 创建实例（按支持表选择磁盘类型，必要时降级）
+        disk_categories = get_supported_disk_categories(
+            region_id, instance_type, zone_id, disk_map
+        )
         instance_created = False
         last_error = None
 
@@ -601,6 +963,9 @@ def main():
                 spot_price_limit=spot_price_limit,
                 user_data_b64=user_data_b64,
                 system_disk_category=disk_category,
+                launch_template_id=launch_template_id,
+                launch_template_version=launch_template_version,
+                extra_tags=extra_tags,
             )
 
             # 检查是否成功
@@ -611,6 +976,10 @@ def main():
                         f"Instance created successfully with disk category: {disk_category}",
                         file=sys.stderr,
                     )
+                    record_disk_categories(
+                        disk_map, instance_type, zone_id, supported=[disk_category]
+                    )
+                    save_disk_category_map(disk_category_map_file, disk_map)
                     instance_created = True
                     print(instance_id)
                     sys.exit(0)
@@ -623,14 +992,18 @@ def main():
                     last_error = response
             else:
                 # 检查错误信息，如果是磁盘类型不支持，尝试下一个
-                if (
-                    "InvalidSystemDiskCategory" in response
-                    or "not support" in response.lower()
-                ):
+                if is_disk_category_error(response):
                     print(
                         f"Disk category {disk_category} not supported, trying next...",
                         file=sys.stderr,
                     )
+                    if is_disk_category_rejected(response):
+                        record_disk_categories(
+                            disk_map,
+                            instance_type,
+                            zone_id,
+                            unsupported=[disk_category],
+                        )
                     last_error = response
                     continue
                 else:
@@ -640,6 +1013,7 @@ def main():
 
         # 所有磁盘类型都失败了
         if not instance_created:
+            save_disk_category_map(disk_category_map_file, disk_map)
             error_exit(
                 f"Failed to create Spot instance with all disk categories. Last error: {last_error}"
             )
@@ -37,7 +37,7 @@ fi
 # 检查 .env 文件中的配置
 if [[ -f "${RUNNER_DIR}/.env" ]]; then
     echo "   .env 文件中的相关配置:"
-    grep -E "ACTIONS_RUNNER_HOOK_POST_JOB|POST_JOB" "${RUNNER_DIR}/.env" || echo "      未找到 POST_JOB 相关配置"
+    grep -E "ACTIONS_RUNNER_HOOK_JOB_COMPLETED" "${RUNNER_DIR}/.env" || echo "      未找到 ACTIONS_RUNNER_HOOK_JOB_COMPLETED 配置"
 else
     echo "   ✗ .env 文件不存在: ${RUNNER_DIR}/.env"
 fi
@@ -163,10 +163,10 @@ echo ""
 
 # 9. 检查环境变量
 echo "9. 检查环境变量"
-echo "   ACTIONS_RUNNER_HOOK_POST_JOB: ${ACTIONS_RUNNER_HOOK_POST_JOB:-未设置}"
+echo "   ACTIONS_RUNNER_HOOK_JOB_COMPLETED: ${ACTIONS_RUNNER_HOOK_JOB_COMPLETED:-未设置}"
 if [[ -f "${RUNNER_DIR}/.env" ]]; then
     echo "   .env 文件中的环境变量:"
-    grep -E "ACTIONS_RUNNER_HOOK|POST_JOB" "${RUNNER_DIR}/.env" | sed 's/^/      /' || echo "      未找到相关环境变量"
+    grep -E "ACTIONS_RUNNER_HOOK" "${RUNNER_DIR}/.env" | sed 's/^/      /' || echo "      未找到相关环境变量"
 fi
 echo ""
 
@@ -0,0 +1,230 @@
+"""
+系统盘类型支持表
+按实例规格族和可用区记录支持的系统盘类型，跨运行持久化（create-spot-instance.py、
+build-custom-image.py 共用）
+
+支持表只记录规格能力：DescribeAvailableResource 返回的类型都视为支持（库存状态
+只影响本次运行的尝试顺序），只有响应中缺失或启动时错误码明确拒绝的类型才记为不支持
+"""
+
+import calendar
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# 系统盘类型优先级：cloud_essd -> cloud_ssd -> cloud_efficiency
+DISK_CATEGORIES = ["cloud_essd", "cloud_ssd", "cloud_efficiency"]
+
+# 支持表条目的有效期（秒），过期后重新查询，纠正过时或误记的条目
+DISK_CATEGORY_MAP_TTL = 7 * 24 * 3600
+
+
+def get_instance_family(instance_type: str) -> str:
+    """从实例类型解析实例规格族（例如：ecs.c7.2xlarge -> ecs.c7）"""
+    parts = instance_type.split(".")
+    if len(parts) >= 3:
+        return ".".join(parts[:2])
+    return instance_type
+
+
+def is_entry_expired(entry: dict) -> bool:
+    """支持表条目是否超过有效期（缺少或无法解析 updated_at 时视为过期）"""
+    try:
+        updated_at = calendar.timegm(
+            time.strptime(entry.get("updated_at", ""), "%Y-%m-%dT%H:%M:%SZ")
+        )
+    except ValueError:
+        return True
+    return time.time() - updated_at > DISK_CATEGORY_MAP_TTL
+
+
+def load_disk_category_map(map_file: Optional[str]) -> dict:
+    """读取持久化的系统盘类型支持表
+
+    格式：{"<instance_family>|<zone_id>": {"supported": [...], "unsupported": [...], "updated_at": "..."}}
+    """
+    if not map_file or not os.path.isfile(map_file):
+        return {}
+
+    try:
+        with open(map_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            print(
+                f"Loaded disk category map: {map_file} ({len(data)} entries)",
+                file=sys.stderr,
+            )
+            return data
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Failed to load disk category map: {e}", file=sys.stderr)
+
+    return {}
+
+
+def save_disk_category_map(map_file: Optional[str], disk_map: dict) -> None:
+    """保存系统盘类型支持表"""
+    if not map_file:
+        return
+
+    try:
+        map_dir = os.path.dirname(map_file)
+        if map_dir:
+            os.makedirs(map_dir, exist_ok=True)
+        with open(map_file, "w", encoding="utf-8") as f:
+            json.dump(disk_map, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"Warning: Failed to save disk category map: {e}", file=sys.stderr)
+
+
+def record_disk_categories(
+    disk_map: dict,
+    instance_type: str,
+    zone_id: Optional[str],
+    supported: Optional[List[str]] = None,
+    unsupported: Optional[List[str]] = None,
+) -> None:
+    """更新系统盘类型支持表（来源：启动成功/失败、DescribeAvailableResource）"""
+    if not zone_id:
+        return
+
+    key = f"{get_instance_family(instance_type)}|{zone_id}"
+    entry = disk_map.setdefault(key, {"supported": [], "unsupported": []})
+
+    for category in supported or []:
+        if category not in entry["supported"]:
+            entry["supported"].append(category)
+        if category in entry["unsupported"]:
+            entry["unsupported"].remove(category)
+
+    for category in unsupported or []:
+        if category not in entry["unsupported"]:
+            entry["unsupported"].append(category)
+        if category in entry["supported"]:
+            entry["supported"].remove(category)
+
+    entry["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def query_available_disk_categories(
+    region_id: str, instance_type: str, zone_id: Optional[str] = None
+) -> Optional[Dict[str, str]]:
+    """通过 DescribeAvailableResource 查询实例类型在可用区内支持的系统盘类型
+
+    返回 系统盘类型 -> 状态（Available、SoldOut 等），查询失败或无结果时返回 None
+    """
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeAvailableResource",
+        "--RegionId",
+        region_id,
+        "--InstanceType",
+        instance_type,
+        "--DestinationResource",
+        "SystemDisk",
+        "--InstanceChargeType",
+        "PostPaid",
+        "--SpotStrategy",
+        "SpotAsPriceGo",
+    ]
+    if zone_id:
+        cmd.extend(["--ZoneId", zone_id])
+
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=True, timeout=30
+        )
+        data = json.loads(result.stdout)
+    except (subprocess.SubprocessError, json.JSONDecodeError) as e:
+        print(
+            f"Warning: Failed to query supported disk categories: {e}",
+            file=sys.stderr,
+        )
+        return None
+
+    categories: Dict[str, str] = {}
+    zones = data.get("AvailableZones", {}).get("AvailableZone", [])
+    for zone in zones:
+        if zone_id and zone.get("ZoneId") != zone_id:
+            continue
+        resources = zone.get("AvailableResources", {}).get("AvailableResource", [])
+        for resource in resources:
+            supported = resource.get("SupportedResources", {}).get(
+                "SupportedResource", []
+            )
+            for item in supported:
+                value = item.get("Value", "")
+                if value and categories.get(value) != "Available":
+                    categories[value] = item.get("Status", "Available")
+        # 未指定可用区时只取第一个可用区的结果
+        if not zone_id:
+            break
+
+    return categories or None
+
+
+def get_supported_disk_categories(
+    region_id: str,
+    instance_type: str,
+    zone_id: Optional[str] = None,
+    disk_map: Optional[dict] = None,
+) -> List[str]:
+    """获取实例类型在可用区内应尝试的系统盘类型列表（按优先级排序）
+
+    优先使用持久化的支持表；没有记录或记录过期时查询 DescribeAvailableResource 并写入支持表；
+    查询失败时回退到完整的降级列表（排除已知不支持的类型）。
+    """
+    disk_map = disk_map if disk_map is not None else {}
+    entry = disk_map.get(f"{get_instance_family(instance_type)}|{zone_id}", {})
+    if entry and is_entry_expired(entry):
+        entry = {}
+    supported = entry.get("supported", [])
+    unsupported = entry.get("unsupported", [])
+
+    if supported:
+        categories = [c for c in DISK_CATEGORIES if c in supported]
+        if categories:
+            print(
+                f"Disk categories for {instance_type} in {zone_id} (from map): {', '.join(categories)}",
+                file=sys.stderr,
+            )
+            return categories
+
+    available = query_available_disk_categories(region_id, instance_type, zone_id)
+    if available:
+        # 库存状态随时变化，不写入支持表；响应中缺失的类型才是规格不支持
+        record_disk_categories(
+            disk_map,
+            instance_type,
+            zone_id,
+            supported=[c for c in DISK_CATEGORIES if c in available],
+            unsupported=[c for c in DISK_CATEGORIES if c not in available],
+        )
+        # 有库存的类型优先尝试
+        categories = sorted(
+            (c for c in DISK_CATEGORIES if c in available),
+            key=lambda c: available[c] != "Available",
+        )
+        if categories:
+            print(
+                f"Instance type {instance_type} supports disk categories: {', '.join(categories)}",
+                file=sys.stderr,
+            )
+            return categories
+
+    # 查询失败时使用降级策略：依次尝试，排除已知不支持的类型
+    categories = [c for c in DISK_CATEGORIES if c not in unsupported]
+    return categories or list(DISK_CATEGORIES)
+
+
+def is_disk_category_rejected(response: str) -> bool:
+    """错误码明确表示系统盘类型不支持（只有这种情况才写入跨运行持久化的支持表）"""
+    return "InvalidSystemDiskCategory" in response or "InvalidDiskCategory" in response
+
+
+def is_disk_category_error(response: str) -> bool:
+    """判断启动失败是否可能由系统盘类型不支持导致（本次运行内尝试下一个类型）"""
+    return is_disk_category_rejected(response) or "not support" in response.lower()
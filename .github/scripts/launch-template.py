@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+维护 Runner 的 ECS 启动模板（按架构）
+镜像、安全组、RAM 角色、密钥对、标签等固定参数写入启动模板，
+配置变化时创建新版本并设为默认版本（User Data 不写入模板，每次启动时传入）
+
+输出：
+    LAUNCH_TEMPLATE_ID=<id>
+    LAUNCH_TEMPLATE_VERSION=<version>
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+# 单个启动模板最多保留 30 个版本
+MAX_TEMPLATE_VERSIONS = 30
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 60) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def resolve_image_id(region_id: str) -> str:
+    """解析镜像 ID（优先 ALIYUN_IMAGE_ID，其次镜像族系）"""
+    image_id = os.environ.get("ALIYUN_IMAGE_ID")
+    if image_id:
+        return image_id
+
+    image_family = os.environ.get("ALIYUN_IMAGE_FAMILY")
+    if image_family:
+        data = run_aliyun(
+            [
+                "DescribeImageFromFamily",
+                "--RegionId",
+                region_id,
+                "--ImageFamily",
+                image_family,
+            ],
+            timeout=30,
+        )
+        image_id = ((data or {}).get("Image") or {}).get("ImageId")
+        if image_id:
+            return image_id
+
+    error_exit("Either ALIYUN_IMAGE_ID or ALIYUN_IMAGE_FAMILY must resolve to an image")
+
+
+def build_template_config(region_id: str) -> dict:
+    """收集写入启动模板的固定参数"""
+    config = {
+        "ImageId": resolve_image_id(region_id),
+        "SecurityGroupId": get_env_var("ALIYUN_SECURITY_GROUP_ID"),
+        "VpcId": get_env_var("ALIYUN_VPC_ID"),
+        "InstanceChargeType": "PostPaid",
+        "SpotStrategy": "SpotAsPriceGo",
+        "SecurityEnhancementStrategy": "Deactive",
+    }
+
+    ram_role_name = os.environ.get("ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME")
+    if ram_role_name:
+        config["RamRoleName"] = ram_role_name
+
+    key_pair_name = os.environ.get("ALIYUN_KEY_PAIR_NAME")
+    if key_pair_name:
+        config["KeyPairName"] = key_pair_name
+
+    return config
+
+
+def compute_config_hash(config: dict) -> str:
+    """计算模板配置的内容哈希（只包含写入模板的字段，User Data 每次启动时单独传入）"""
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def config_to_args(config: dict, config_hash: str) -> List[str]:
+    """将模板配置转换为 CLI 参数"""
+    args = []
+    for key, value in config.items():
+        args.extend([f"--{key}", value])
+    args.extend(
+        [
+            "--Tag.1.Key",
+            "GITHUB_RUNNER_TYPE",
+            "--Tag.1.Value",
+            "aliyun-ecs-spot",
+            "--VersionDescription",
+            f"config-hash:{config_hash}",
+        ]
+    )
+    return args
+
+
+def find_template(region_id: str, template_name: str) -> Optional[dict]:
+    """按名称查找启动模板"""
+    data = run_aliyun(
+        [
+            "DescribeLaunchTemplates",
+            "--RegionId",
+            region_id,
+            "--LaunchTemplateName.1",
+            template_name,
+        ],
+        timeout=30,
+    )
+    templates = (data or {}).get("LaunchTemplateSets", {}).get("LaunchTemplateSet", [])
+    return templates[0] if templates else None
+
+
+def list_template_versions(region_id: str, template_id: str) -> List[dict]:
+    """列出启动模板的全部版本"""
+    data = run_aliyun(
+        [
+            "DescribeLaunchTemplateVersions",
+            "--RegionId",
+            region_id,
+            "--LaunchTemplateId",
+            template_id,
+            "--PageSize",
+            "50",
+        ],
+        timeout=30,
+    )
+    return (
+        (data or {})
+        .get("LaunchTemplateVersionSets", {})
+        .get("LaunchTemplateVersionSet", [])
+    )
+
+
+def prune_template_versions(
+    region_id: str, template_id: str, versions: List[dict]
+) -> None:
+    """删除最旧的非默认版本，为新版本腾出空间"""
+    if len(versions) < MAX_TEMPLATE_VERSIONS:
+        return
+
+    stale = sorted(
+        (v for v in versions if not v.get("DefaultVersion")),
+        key=lambda v: v.get("VersionNumber", 0),
+    )
+    for version in stale[: len(versions) - MAX_TEMPLATE_VERSIONS + 1]:
+        version_number = str(version.get("VersionNumber"))
+        print(f"Deleting launch template version {version_number}", file=sys.stderr)
+        run_aliyun(
+            [
+                "DeleteLaunchTemplateVersion",
+                "--RegionId",
+                region_id,
+                "--LaunchTemplateId",
+                template_id,
+                "--DeleteVersion.1",
+                version_number,
+            ]
+        )
+
+
+def ensure_template(
+    region_id: str, template_name: str, config: dict, config_hash: str
+) -> Tuple[str, str]:
+    """确保启动模板存在且默认版本与当前配置一致，返回 (模板 ID, 版本号)"""
+    template = find_template(region_id, template_name)
+
+    if not template:
+        print(f"Creating launch template {template_name}", file=sys.stderr)
+        data = run_aliyun(
+            [
+                "CreateLaunchTemplate",
+                "--RegionId",
+                region_id,
+                "--LaunchTemplateName",
+                template_name,
+            ]
+            + config_to_args(config, config_hash)
+        )
+        if not data or not data.get("LaunchTemplateId"):
+            error_exit(f"Failed to create launch template {template_name}")
+        return data["LaunchTemplateId"], "1"
+
+    template_id = template["LaunchTemplateId"]
+    versions = list_template_versions(region_id, template_id)
+    for version in versions:
+        if version.get("DefaultVersion"):
+            if version.get("VersionDescription") == f"config-hash:{config_hash}":
+                print(
+                    f"Launch template {template_name} is up to date "
+                    f"(version {version.get('VersionNumber')})",
+                    file=sys.stderr,
+                )
+                return template_id, str(version.get("VersionNumber"))
+            break
+
+    prune_template_versions(region_id, template_id, versions)
+
+    print(
+        f"Creating new version of launch template {template_name} (hash {config_hash})",
+        file=sys.stderr,
+    )
+    data = run_aliyun(
+        [
+            "CreateLaunchTemplateVersion",
+            "--RegionId",
+            region_id,
+            "--LaunchTemplateId",
+            template_id,
+        ]
+        + config_to_args(config, config_hash)
+    )
+    if not data or not data.get("LaunchTemplateVersionNumber"):
+        error_exit(f"Failed to create new version of launch template {template_name}")
+
+    version_number = str(data["LaunchTemplateVersionNumber"])
+    run_aliyun(
+        [
+            "ModifyLaunchTemplateDefaultVersion",
+            "--RegionId",
+            region_id,
+            "--LaunchTemplateId",
+            template_id,
+            "--DefaultVersionNumber",
+            version_number,
+        ]
+    )
+    return template_id, version_number
+
+
+def main():
+    """主函数"""
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    arch = os.environ.get("ARCH", "amd64")
+    template_name = os.environ.get("LAUNCH_TEMPLATE_NAME") or f"github-runner-{arch}"
+
+    config = build_template_config(region_id)
+    config_hash = compute_config_hash(config)
+    template_id, version = ensure_template(
+        region_id, template_name, config, config_hash
+    )
+
+    print(f"LAUNCH_TEMPLATE_ID={template_id}")
+    print(f"LAUNCH_TEMPLATE_VERSION={version}")
+
+
+if __name__ == "__main__":
+    main()
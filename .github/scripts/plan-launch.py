@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+启动前配额与容量检查
+读取账号的 Spot vCPU 配额、各可用区内候选规格的 Spot 库存、当前带 GITHUB_RUNNER_TYPE
+标签的运行中实例和安全组容量（以及 EXCLUDE_INSTANCE_TYPES 指定的排除规格），
+剔除放不下的候选（保留更小规格的候选即为降配），全部放不下时立即失败并给出原因，
+避免 create-spot-instance.py 对每个候选和磁盘类型做无意义的 RunInstances 重试
+
+候选文件（CANDIDATES_FILE）会被原地重写
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# 计入运行中的实例状态
+ACTIVE_STATUSES = ("Pending", "Starting", "Running", "Stopping")
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 30) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_candidates_file(candidates_file: str) -> List[Tuple[str, List[str]]]:
+    """解析候选结果文件，返回 (原始行, 字段列表)"""
+    candidates = []
+    with open(candidates_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                candidates.append((line, line.split("|")))
+    return candidates
+
+
+def get_account_attributes(region_id: str) -> Dict[str, List[dict]]:
+    """读取账号属性（vCPU 配额与已用量）"""
+    data = run_aliyun(
+        [
+            "DescribeAccountAttributes",
+            "--RegionId",
+            region_id,
+            "--AttributeName.1",
+            "max-spot-instance-vcpu-count",
+            "--AttributeName.2",
+            "used-spot-instance-vcpu-count",
+            "--AttributeName.3",
+            "max-postpaid-instance-vcpu-count",
+            "--AttributeName.4",
+            "used-postpaid-instance-vcpu-count",
+        ]
+    )
+    attributes = {}
+    items = (
+        (data or {}).get("AccountAttributeItems", {}).get("AccountAttributeItem", [])
+    )
+    for item in items:
+        values = item.get("AttributeValues", {}).get("ValueItem", [])
+        attributes[item.get("AttributeName")] = values
+    return attributes
+
+
+def sum_attribute(
+    attributes: Dict[str, List[dict]], name: str, zone_id: Optional[str] = None
+) -> Optional[int]:
+    """汇总属性值；带 ZoneId 的条目只统计指定可用区"""
+    values = attributes.get(name)
+    if not values:
+        return None
+
+    total = 0
+    for value in values:
+        if zone_id and value.get("ZoneId") and value.get("ZoneId") != zone_id:
+            continue
+        try:
+            total += int(value.get("Value", 0))
+        except (TypeError, ValueError):
+            continue
+    return total
+
+
+def get_runner_vcpus(region_id: str) -> int:
+    """统计带 GITHUB_RUNNER_TYPE 标签的运行中实例 vCPU（分页）"""
+    total = 0
+    page_number = 1
+    while True:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--Tag.1.Key",
+                "GITHUB_RUNNER_TYPE",
+                "--Tag.1.Value",
+                "aliyun-ecs-spot",
+                "--PageSize",
+                "100",
+                "--PageNumber",
+                str(page_number),
+            ]
+        )
+        if not data:
+            break
+
+        instances = data.get("Instances", {}).get("Instance", [])
+        total += sum(
+            int(i.get("Cpu", 0))
+            for i in instances
+            if i.get("Status") in ACTIVE_STATUSES
+        )
+        if len(instances) < 100:
+            break
+        page_number += 1
+    return total
+
+
+def get_zone_stock(region_id: str, zone_id: str) -> Optional[Dict[str, str]]:
+    """查询可用区内各 Spot 实例规格的库存状态（规格 -> StatusCategory），失败时返回 None"""
+    data = run_aliyun(
+        [
+            "DescribeAvailableResource",
+            "--RegionId",
+            region_id,
+            "--ZoneId",
+            zone_id,
+            "--DestinationResource",
+            "InstanceType",
+            "--InstanceChargeType",
+            "PostPaid",
+            "--SpotStrategy",
+            "SpotAsPriceGo",
+        ]
+    )
+    if data is None:
+        return None
+
+    stock = {}
+    for zone in data.get("AvailableZones", {}).get("AvailableZone", []):
+        resources = zone.get("AvailableResources", {}).get("AvailableResource", [])
+        for resource in resources:
+            items = resource.get("SupportedResources", {}).get("SupportedResource", [])
+            for item in items:
+                stock[item.get("Value")] = item.get("StatusCategory") or item.get(
+                    "Status", ""
+                )
+    return stock
+
+
+def get_security_group_capacity(
+    region_id: str, security_group_id: str
+) -> Optional[int]:
+    """查询安全组剩余可加入的实例（网卡）数量"""
+    data = run_aliyun(
+        [
+            "DescribeSecurityGroups",
+            "--RegionId",
+            region_id,
+            "--SecurityGroupId",
+            security_group_id,
+        ]
+    )
+    groups = (data or {}).get("SecurityGroups", {}).get("SecurityGroup", [])
+    if not groups or groups[0].get("AvailableInstanceAmount") is None:
+        return None
+    return int(groups[0]["AvailableInstanceAmount"])
+
+
+def main():
+    """主函数"""
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    candidates_file = get_env_var("CANDIDATES_FILE")
+    security_group_id = os.environ.get("ALIYUN_SECURITY_GROUP_ID")
+    # 可选：本流水线自身的 vCPU 预算（所有 Runner 合计）
+    max_runner_vcpu = os.environ.get("MAX_RUNNER_VCPU")
+    # 可选：排除的实例规格（例如 Spot 中断后重新排队时排除被回收的规格）
+    exclude_instance_types = {
+        t.strip()
+        for t in os.environ.get("EXCLUDE_INSTANCE_TYPES", "").split(",")
+        if t.strip()
+    }
+
+    if not os.path.isfile(candidates_file):
+        error_exit(f"Candidates file not found: {candidates_file}")
+
+    candidates = parse_candidates_file(candidates_file)
+    if not candidates:
+        error_exit("No launch candidates to plan")
+
+    # 安全组容量：放不下任何实例时所有候选都会失败
+    if security_group_id:
+        capacity = get_security_group_capacity(region_id, security_group_id)
+        if capacity is not None:
+            print(
+                f"Security group {security_group_id} can take {capacity} more instances",
+                file=sys.stderr,
+            )
+            if capacity <= 0:
+                error_exit(
+                    f"Security group {security_group_id} has no remaining capacity "
+                    "(ENI limit reached); release instances or use another group"
+                )
+
+    attributes = get_account_attributes(region_id)
+    runner_vcpus = get_runner_vcpus(region_id)
+    print(f"Runner instances currently use {runner_vcpus} vCPUs", file=sys.stderr)
+
+    budget = None
+    if max_runner_vcpu:
+        budget = int(max_runner_vcpu) - runner_vcpus
+        print(f"Pipeline vCPU budget remaining: {budget}", file=sys.stderr)
+
+    if not attributes:
+        print(
+            "Warning: Account attributes unavailable, skipping quota check",
+            file=sys.stderr,
+        )
+
+    # 按可用区缓存规格库存（每个可用区一次查询）
+    zone_stock: Dict[str, Optional[Dict[str, str]]] = {}
+
+    planned = []
+    reasons = []
+    for line, parts in candidates:
+        instance_type = parts[0]
+        zone_id = parts[1] if len(parts) > 1 else None
+        cpu = int(parts[4]) if len(parts) > 4 and parts[4] else None
+        if instance_type in exclude_instance_types:
+            reasons.append(f"{instance_type}: excluded by EXCLUDE_INSTANCE_TYPES")
+            continue
+
+        # 规格（实例族与架构）在该可用区已无 Spot 库存时 RunInstances 必然失败
+        if zone_id:
+            if zone_id not in zone_stock:
+                zone_stock[zone_id] = get_zone_stock(region_id, zone_id)
+            status = (zone_stock[zone_id] or {}).get(instance_type)
+            if status in ("WithoutStock", "SoldOut"):
+                reasons.append(f"{instance_type} in {zone_id}: sold out")
+                continue
+
+        if cpu is None:
+            planned.append(line)
+            continue
+
+        spot_max = sum_attribute(attributes, "max-spot-instance-vcpu-count", zone_id)
+        spot_used = sum_attribute(attributes, "used-spot-instance-vcpu-count", zone_id)
+        if (
+            spot_max is not None
+            and spot_used is not None
+            and spot_max - spot_used < cpu
+        ):
+            reasons.append(
+                f"{instance_type} in {zone_id}: needs {cpu} vCPUs, "
+                f"spot quota has {spot_max - spot_used} left"
+            )
+            continue
+
+        # Spot 实例同时计入按量付费 vCPU 总配额
+        postpaid_max = sum_attribute(
+            attributes, "max-postpaid-instance-vcpu-count", zone_id
+        )
+        postpaid_used = sum_attribute(
+            attributes, "used-postpaid-instance-vcpu-count", zone_id
+        )
+        if (
+            postpaid_max is not None
+            and postpaid_used is not None
+            and postpaid_max - postpaid_used < cpu
+        ):
+            reasons.append(
+                f"{instance_type} in {zone_id}: needs {cpu} vCPUs, "
+                f"pay-as-you-go quota has {postpaid_max - postpaid_used} left"
+            )
+            continue
+
+        if budget is not None and budget < cpu:
+            reasons.append(
+                f"{instance_type}: needs {cpu} vCPUs, pipeline budget has {budget} left"
+            )
+            continue
+
+        planned.append(line)
+
+    for reason in reasons:
+        print(f"Dropped candidate: {reason}", file=sys.stderr)
+
+    if not planned:
+        error_exit(
+            "No launch candidate fits the current quota; "
+            + (reasons[0] if reasons else "unknown reason")
+        )
+
+    with open(candidates_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(planned) + "\n")
+
+    print(
+        f"Launch plan: {len(planned)}/{len(candidates)} candidates kept",
+        file=sys.stderr,
+    )
+    print(f"PLANNED_CANDIDATES={len(planned)}")
+    print(f"DROPPED_CANDIDATES={len(candidates) - len(planned)}")
+
+
+if __name__ == "__main__":
+    main()
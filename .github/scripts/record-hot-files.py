@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+记录参考构建读取的热点文件
+从自定义镜像快照创建的系统盘按需加载数据块，构建开始时首次读取 Runner、Docker 和
+BuildKit 文件会很慢。在 build job（运行于 Runner 实例本身）构建完成后，
+用 fincore 找出系统盘上已进入页缓存、且在本次启动前就存在（来自镜像）的文件，
+按驻留字节数降序写入列表；build-custom-image.py 将列表写入镜像，
+由开机预热服务在 Runner 注册期间后台读取
+
+输出文件格式（每行）：<驻留字节数>\t<路径>
+
+输出：
+    HOT_FILES=<文件数>
+    HOT_BYTES=<驻留字节数合计>
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# 默认扫描目录：Runner、Docker/BuildKit 状态及其依赖的系统文件
+DEFAULT_ROOTS = (
+    "/opt/actions-runner,/usr/bin,/usr/sbin,/usr/lib,/usr/libexec,"
+    "/var/lib/docker,/var/lib/containerd,/etc"
+)
+
+# 不会出现在镜像中的目录（检出代码、Runner 诊断日志等）
+EXCLUDED_DIRS = ("/opt/actions-runner/_work", "/opt/actions-runner/_diag")
+
+# 单次 fincore 调用的文件数
+FINCORE_BATCH_SIZE = 500
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_boot_time() -> float:
+    """本次启动的时间（Unix 时间戳）"""
+    with open("/proc/uptime", "r", encoding="utf-8") as f:
+        return time.time() - float(f.read().split()[0])
+
+
+def list_image_files(roots: List[str], boot_time: float) -> List[str]:
+    """列出系统盘上启动前就存在的普通文件（跳过挂载的数据盘）"""
+    root_device = os.stat("/").st_dev
+    files = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            # 构建缓存数据盘挂载在 /var/lib/docker 时不属于系统盘，无需预热
+            if os.stat(dirpath).st_dev != root_device or dirpath.startswith(
+                EXCLUDED_DIRS
+            ):
+                dirnames[:] = []
+                continue
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                # 本次启动后创建或修改的文件不在镜像快照中
+                if (
+                    st.st_size > 0
+                    and st.st_ctime < boot_time
+                    and os.path.isfile(path)
+                    and not os.path.islink(path)
+                ):
+                    files.append(path)
+    return files
+
+
+def get_resident_bytes(files: List[str]) -> Dict[str, int]:
+    """通过 fincore 查询文件在页缓存中驻留的字节数（只返回大于 0 的文件）"""
+    resident = {}
+    for i in range(0, len(files), FINCORE_BATCH_SIZE):
+        batch = files[i : i + FINCORE_BATCH_SIZE]
+        result = subprocess.run(
+            ["fincore", "--bytes", "--noheadings", "--raw", "--output", "RES,FILE"]
+            + batch,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        # 个别文件无权限或已删除时 fincore 返回非零，其余结果仍然有效
+        for line in result.stdout.splitlines():
+            size, _, path = line.partition(" ")
+            try:
+                res = int(size)
+            except ValueError:
+                continue
+            if res > 0 and path:
+                resident[path] = res
+    return resident
+
+
+def main():
+    """主函数"""
+    output_file = os.environ.get("OUTPUT_FILE", ".cache/prewarm-hot-files.txt")
+    roots = [
+        root.strip()
+        for root in (os.environ.get("PREWARM_ROOTS") or DEFAULT_ROOTS).split(",")
+        if root.strip()
+    ]
+
+    if not shutil.which("fincore"):
+        error_exit("fincore (util-linux) is not installed")
+
+    start_time = time.time()
+    files = list_image_files(roots, get_boot_time())
+    resident = get_resident_bytes(files)
+    hot_files: List[Tuple[int, str]] = sorted(
+        ((res, path) for path, res in resident.items()), reverse=True
+    )
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        for res, path in hot_files:
+            f.write(f"{res}\t{path}\n")
+
+    total = sum(res for res, _ in hot_files)
+    print(
+        f"Recorded {len(hot_files)} hot files ({total / 1024 / 1024:.0f} MiB resident) "
+        f"out of {len(files)} image files in {time.time() - start_time:.0f}s",
+        file=sys.stderr,
+    )
+    print(f"HOT_FILES={len(hot_files)}")
+    print(f"HOT_BYTES={total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+一次性渲染 User Data
+从模板替换变量后按需压缩，直接写出交给 create-spot-instance.py 的字节文件，
+替代 generate-user-data.sh -> base64 -> GITHUB_OUTPUT -> write-user-data.py 的多次编解码
+
+压缩方式（USER_DATA_COMPRESSION）：
+    none  原始脚本
+    gzip  gzip 压缩的 cloud-init MIME multipart（仅 cloud-init 可用）
+    stub  gzip + base64 负载的自解压 bash 脚本（cloud-init 与云助手均可执行）
+    auto  脚本超过 AUTO_COMPRESS_THRESHOLD 时使用 stub，否则 none（默认）
+"""
+
+import base64
+import gzip
+import os
+import re
+import sys
+import textwrap
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# ECS User Data 原始数据上限（Base64 编码前）
+USER_DATA_MAX_BYTES = 32 * 1024
+
+# auto 模式下超过该大小时启用压缩
+AUTO_COMPRESS_THRESHOLD = 16 * 1024
+
+# 模板变量：(名称, 是否必需)
+TEMPLATE_VARIABLES = [
+    ("RUNNER_REGISTRATION_TOKEN", True),
+    ("GITHUB_REPOSITORY", True),
+    ("RUNNER_NAME", True),
+    ("RUNNER_LABELS", False),
+    ("RUNNER_VERSION", False),
+    ("RUNNER_COUNT", False),
+    ("RUNNER_IDLE_TIMEOUT", False),
+    ("RUNNER_JIT_CONFIG", False),
+    ("HTTP_PROXY", False),
+    ("HTTPS_PROXY", False),
+    ("NO_PROXY", False),
+    ("ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME", False),
+    ("CACHE_DISK_ENABLED", False),
+    ("CACHE_KEEP_STORAGE", False),
+]
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def shell_quote(value: str) -> str:
+    """转义为 bash 双引号字符串内容"""
+    return re.sub(r'([\\"$`])', r"\\\1", value)
+
+
+def render_template(template: str) -> str:
+    """替换模板中 NAME="${NAME:-default}" 形式的变量定义"""
+    for name, required in TEMPLATE_VARIABLES:
+        value = os.environ.get(name, "")
+        if not value:
+            if required:
+                error_exit(f"{name} is required")
+            continue
+
+        pattern = re.compile(rf'^{name}="\$\{{{name}:-[^}}]*\}}"', re.MULTILINE)
+        replacement = f'{name}="{shell_quote(value)}"'
+        template, count = pattern.subn(lambda _m: replacement, template, count=1)
+        if count == 0:
+            print(f"Warning: {name} not found in template", file=sys.stderr)
+
+    # 规范化换行（去除 CRLF）
+    return template.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def build_gzip_multipart(script: str) -> bytes:
+    """构建 gzip 压缩的 cloud-init MIME multipart"""
+    message = MIMEMultipart()
+    part = MIMEText(script, "x-shellscript", "utf-8")
+    part.add_header("Content-Disposition", 'attachment; filename="user-data.sh"')
+    message.attach(part)
+    return gzip.compress(message.as_bytes(), compresslevel=9)
+
+
+def build_stub(script: str) -> bytes:
+    """构建自解压 bash 脚本（gzip + base64 负载）"""
+    payload = base64.b64encode(
+        gzip.compress(script.encode("utf-8"), compresslevel=9)
+    ).decode("ascii")
+    lines = "\n".join(textwrap.wrap(payload, 76))
+    stub = f"""#!/bin/bash
+# 自解压 User Data：负载为 gzip + base64 编码的完整脚本
+set -euo pipefail
+umask 077
+# 负载含 Runner 注册令牌：解压到 tmpfs，打开后立即删除，不在磁盘上留下明文
+PAYLOAD=/run/user-data-payload.sh
+base64 -d <<'USER_DATA_PAYLOAD' | gunzip > "${{PAYLOAD}}"
+{lines}
+USER_DATA_PAYLOAD
+exec 3< "${{PAYLOAD}}"
+rm -f "${{PAYLOAD}}"
+exec /bin/bash /dev/fd/3
+"""
+    return stub.encode("utf-8")
+
+
+def encode(script: str, compression: str) -> bytes:
+    """按压缩方式生成最终 User Data 字节"""
+    raw = script.encode("utf-8")
+    if compression == "auto":
+        compression = "stub" if len(raw) > AUTO_COMPRESS_THRESHOLD else "none"
+
+    if compression == "none":
+        data = raw
+    elif compression == "gzip":
+        data = build_gzip_multipart(script)
+    elif compression == "stub":
+        data = build_stub(script)
+    else:
+        error_exit(
+            f"Unknown USER_DATA_COMPRESSION: {compression} (none|gzip|stub|auto)"
+        )
+
+    print(
+        f"User Data rendered: {len(raw)} bytes raw, {len(data)} bytes "
+        f"({compression}), limit {USER_DATA_MAX_BYTES} bytes",
+        file=sys.stderr,
+    )
+    return data
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2:
+        error_exit("Usage: render-user-data.py <output_file>")
+    output_file = sys.argv[1]
+
+    template_file = os.environ.get("TEMPLATE_FILE", ".github/templates/user-data.sh")
+    compression = os.environ.get("USER_DATA_COMPRESSION", "auto").strip().lower()
+
+    if not os.path.isfile(template_file):
+        error_exit(f"Template file not found: {template_file}")
+
+    with open(template_file, "r", encoding="utf-8") as f:
+        script = render_template(f.read())
+
+    if not script.startswith("#!"):
+        script = "#!/bin/bash\n" + script
+
+    data = encode(script, compression)
+    if len(data) > USER_DATA_MAX_BYTES:
+        error_exit(
+            f"User Data is {len(data)} bytes, exceeding the ECS limit of "
+            f"{USER_DATA_MAX_BYTES} bytes; use USER_DATA_COMPRESSION=stub or gzip"
+        )
+
+    # 文件包含注册令牌，仅当前用户可读
+    fd = os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    print(f"User Data file created: {output_file}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+汇总 Runner 实例的启动阶段计时
+在 build job（运行于 Runner 实例本身）中读取 User Data 写入的 /var/log/boot-report.json，
+输出各阶段耗时到 Step Summary，并与上一次的报告（基线）比较：
+镜像变化且 Runner 就绪时间变慢超过 BOOT_REGRESSION_PERCENT 时输出告警
+
+输出：
+    IMAGE_ID=<镜像 ID>
+    TIME_TO_LISTENING=<内核启动到 Runner 开始监听 Job 的秒数>
+    REGRESSION=true|false
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Optional
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def load_report(path: str) -> Optional[dict]:
+    """读取启动报告"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def wait_for_report(path: str, timeout: int) -> Optional[dict]:
+    """等待启动报告生成（Runner 就绪后实例仍需等待 systemd 启动完成才写入）"""
+    start_time = time.time()
+    while True:
+        report = load_report(path)
+        if report is not None:
+            return report
+        if time.time() - start_time >= timeout:
+            return None
+        time.sleep(5)
+
+
+def format_summary(report: dict, baseline: Optional[dict]) -> str:
+    """生成 Step Summary（Markdown）"""
+    lines = [
+        "## Runner Boot Report",
+        "",
+        (
+            f"- Instance: `{report.get('instance_id')}` ({report.get('instance_type')}, "
+            f"{report.get('zone_id')})"
+        ),
+        f"- Image: `{report.get('image_id')}` {report.get('base_image_name', '')}",
+        f"- Preinstalled runner: {report.get('preinstalled_runner')}",
+        f"- Time to listening: **{report.get('time_to_listening')}s**",
+    ]
+    if baseline:
+        lines.append(
+            f"- Previous: {baseline.get('time_to_listening')}s "
+            f"(image `{baseline.get('image_id')}`)"
+        )
+
+    lines.extend(["", "| Phase | At (s) | Duration (s) |", "| --- | --- | --- |"])
+    for phase in report.get("phases", []):
+        lines.append(
+            f"| {phase.get('name')} | {phase.get('at')} | {phase.get('duration')} |"
+        )
+
+    if report.get("systemd_analyze_time"):
+        lines.extend(["", "```", report["systemd_analyze_time"], "```"])
+
+    blame = report.get("systemd_blame") or []
+    if blame:
+        lines.extend(["", "| Unit | Time |", "| --- | --- |"])
+        for item in blame[:10]:
+            lines.append(f"| {item.get('unit')} | {item.get('time')} |")
+
+    image_build = report.get("image_build") or {}
+    if image_build.get("phases"):
+        lines.extend(
+            [
+                "",
+                (
+                    f"### Image Build ({image_build.get('build_timestamp')}, "
+                    f"{image_build.get('total_duration')}s)"
+                ),
+                "",
+                "| Phase | Duration (s) |",
+                "| --- | --- |",
+            ]
+        )
+        for phase in image_build["phases"]:
+            lines.append(f"| {phase.get('name')} | {phase.get('duration')} |")
+
+    return "\n".join(lines) + "\n"
+
+
+def is_regression(report: dict, baseline: Optional[dict], threshold: float) -> bool:
+    """新镜像的 Runner 就绪时间是否比基线慢超过阈值（同一启动路径才比较）"""
+    if not baseline or baseline.get("image_id") == report.get("image_id"):
+        return False
+    if baseline.get("preinstalled_runner") != report.get("preinstalled_runner"):
+        return False
+
+    current = report.get("time_to_listening")
+    previous = baseline.get("time_to_listening")
+    if not current or not previous:
+        return False
+    return current > previous * (1 + threshold / 100)
+
+
+def main():
+    """主函数"""
+    report_file = os.environ.get("BOOT_REPORT_FILE", "/var/log/boot-report.json")
+    baseline_file = os.environ.get("BASELINE_FILE")
+    threshold = float(os.environ.get("BOOT_REGRESSION_PERCENT") or 20)
+    timeout = int(os.environ.get("WAIT_TIMEOUT") or 90)
+
+    report = wait_for_report(report_file, timeout)
+    if report is None:
+        error_exit(f"Boot report not found: {report_file}")
+
+    baseline = load_report(baseline_file) if baseline_file else None
+    regression = is_regression(report, baseline, threshold)
+
+    summary = format_summary(report, baseline)
+    summary_file = os.environ.get("GITHUB_STEP_SUMMARY")
+    if summary_file:
+        with open(summary_file, "a", encoding="utf-8") as f:
+            f.write(summary)
+    else:
+        print(summary, file=sys.stderr)
+
+    if regression:
+        print(
+            f"Warning: Boot regression on image {report.get('image_id')}: runner "
+            f"listening after {report.get('time_to_listening')}s, previously "
+            f"{baseline.get('time_to_listening')}s on image {baseline.get('image_id')}",
+            file=sys.stderr,
+        )
+
+    # 当前报告作为下一次比较的基线
+    if baseline_file:
+        os.makedirs(os.path.dirname(baseline_file) or ".", exist_ok=True)
+        shutil.copyfile(report_file, baseline_file)
+
+    print(f"IMAGE_ID={report.get('image_id', '')}")
+    print(f"TIME_TO_LISTENING={report.get('time_to_listening', '')}")
+    print(f"REGRESSION={'true' if regression else 'false'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+按队列调度 Runner
+统计本 workflow 尚未开始 build 的运行（需求）与空闲在线 Runner、启动中实例的
+Runner 槽位（供给），决定本次运行复用已有 Runner 还是启动一台承载多个
+Ephemeral Runner 的实例
+
+需求按运行创建时间排序，供给优先分配给较早的运行；剩余运行按
+MAX_RUNNERS_PER_INSTANCE 分批，每批只由第一个运行启动实例，
+并发执行的 setup 基于相同的排序得出一致的决定
+
+用法：
+    schedule-runners.py plan  输出 LAUNCH=true|false、RUNNER_COUNT、MIN_CPU
+    schedule-runners.py wait  等待可用的空闲 Runner，输出 runner_online=true
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+GITHUB_API_URL = "https://api.github.com"
+
+# 计入供给的实例状态
+BOOTING_STATUSES = ("Pending", "Starting", "Running")
+
+# 实例承载的 Runner 数量标签
+RUNNER_SLOTS_TAG_KEY = "RunnerSlots"
+
+# build job 尚未开始的状态
+NOT_STARTED_STATUSES = ("queued", "waiting", "pending", "requested")
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def github_get(path: str, token: str) -> Optional[dict]:
+    """调用 GitHub REST API（GET）"""
+    request = urllib.request.Request(
+        f"{GITHUB_API_URL}{path}",
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+        print(f"Warning: GET {path} failed: {e}", file=sys.stderr)
+        return None
+
+
+def run_aliyun(args: List[str], timeout: int = 30) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return None
+
+
+def list_runners(repository: str, token: str) -> List[dict]:
+    """列出仓库的自托管 Runner（分页）"""
+    runners = []
+    page = 1
+    while True:
+        data = github_get(
+            f"/repos/{repository}/actions/runners?per_page=100&page={page}", token
+        )
+        if data is None:
+            error_exit("Failed to list self-hosted runners")
+        batch = data.get("runners", [])
+        runners.extend(batch)
+        if len(batch) < 100:
+            break
+        page += 1
+    return runners
+
+
+def has_labels(runner: dict, labels: List[str]) -> bool:
+    """Runner 是否具备全部所需标签"""
+    runner_labels = {
+        label.get("name", "").lower() for label in runner.get("labels", [])
+    }
+    return all(label.lower() in runner_labels for label in labels)
+
+
+def list_pending_runs(
+    repository: str,
+    token: str,
+    workflow_file: str,
+    setup_job_name: str,
+    build_job_name: str,
+    run_id: int,
+    newer_limit: int,
+) -> List[Tuple[str, int]]:
+    """
+    列出 build job 尚未开始的运行，返回 (创建时间, 运行 ID)，按创建时间排序
+
+    排名只取决于更早的运行，更新的运行只影响批大小，因此只检查本运行之后的
+    newer_limit 个运行；整个运行仍在排队时 build 必然未开始，无需查询 job
+    """
+    runs = []
+    for status in ("queued", "in_progress"):
+        page = 1
+        while True:
+            data = github_get(
+                f"/repos/{repository}/actions/workflows/{workflow_file}/runs"
+                f"?status={status}&per_page=100&page={page}",
+                token,
+            )
+            if data is None:
+                error_exit(f"Failed to list {status} runs of {workflow_file}")
+            batch = data.get("workflow_runs", [])
+            runs.extend(
+                (run.get("created_at", ""), int(run["id"]), status) for run in batch
+            )
+            if len(batch) < 100:
+                break
+            page += 1
+    runs.sort()
+
+    own = [created_at for created_at, rid, _ in runs if rid == run_id]
+    if own:
+        older = [run for run in runs if run[0] <= own[0]]
+        runs = older + [run for run in runs if run[0] > own[0]][:newer_limit]
+
+    pending = []
+    for created_at, rid, status in runs:
+        if status == "queued":
+            pending.append((created_at, rid))
+            continue
+
+        jobs_data = github_get(
+            f"/repos/{repository}/actions/runs/{rid}/jobs?per_page=100", token
+        )
+        jobs = (jobs_data or {}).get("jobs", [])
+
+        # setup 已失败的运行不会再有 build job
+        if any(
+            job.get("name") == setup_job_name
+            and job.get("status") == "completed"
+            and job.get("conclusion") != "success"
+            for job in jobs
+        ):
+            continue
+
+        build_jobs = [job for job in jobs if job.get("name") == build_job_name]
+        if build_jobs and build_jobs[0].get("status") not in NOT_STARTED_STATUSES:
+            continue
+        pending.append((created_at, rid))
+
+    return sorted(set(pending))
+
+
+def get_age_seconds(instance: dict, now: datetime) -> Optional[float]:
+    """实例创建至今的秒数（CreationTime 例如：2024-01-01T00:00Z）"""
+    creation_time = instance.get("CreationTime", "")
+    for fmt in ("%Y-%m-%dT%H:%MZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            created = datetime.strptime(creation_time, fmt).replace(tzinfo=timezone.utc)
+            return (now - created).total_seconds()
+        except ValueError:
+            continue
+    return None
+
+
+def count_booting_slots(
+    region_id: str, arch: str, runners: List[dict], boot_window: int
+) -> int:
+    """统计启动中实例尚未注册的 Runner 槽位"""
+    instances = []
+    page_number = 1
+    while True:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--Tag.1.Key",
+                "GITHUB_RUNNER_TYPE",
+                "--Tag.1.Value",
+                "aliyun-ecs-spot",
+                "--PageSize",
+                "100",
+                "--PageNumber",
+                str(page_number),
+            ]
+        )
+        if data is None:
+            print("Warning: Failed to list runner instances", file=sys.stderr)
+            return 0
+        page = data.get("Instances", {}).get("Instance", [])
+        instances.extend(page)
+        if len(page) < 100:
+            break
+        page_number += 1
+
+    # JIT Runner 在实例启动前就已注册（离线），只有在线的 Runner 才算占用槽位
+    runner_names = [
+        runner.get("name", "") for runner in runners if runner.get("status") == "online"
+    ]
+    now = datetime.now(timezone.utc)
+    slots = 0
+    for instance in instances:
+        name = instance.get("InstanceName", "")
+        if instance.get("Status") not in BOOTING_STATUSES:
+            continue
+        if not name.startswith(f"ci-runner-{arch}-"):
+            continue
+
+        # 超过启动窗口仍未注册的实例视为异常，不计入供给
+        age = get_age_seconds(instance, now)
+        if age is None or age > boot_window:
+            continue
+
+        instance_slots = 1
+        for tag in instance.get("Tags", {}).get("Tag", []):
+            if tag.get("TagKey") == RUNNER_SLOTS_TAG_KEY:
+                try:
+                    instance_slots = max(1, int(tag.get("TagValue", "1")))
+                except ValueError:
+                    pass
+
+        registered = sum(
+            1 for n in runner_names if n == name or n.startswith(f"{name}-")
+        )
+        slots += max(0, instance_slots - registered)
+    return slots
+
+
+def get_max_per_instance() -> int:
+    """单实例 Runner 数（受最大 CPU 限制）"""
+    base_cpu = int(os.environ.get("MIN_CPU") or 8)
+    max_cpu = int(os.environ.get("MAX_CPU") or 64)
+    max_per_instance = int(os.environ.get("MAX_RUNNERS_PER_INSTANCE") or 4)
+    return max(1, min(max_per_instance, max_cpu // base_cpu))
+
+
+def assess(repository: str, token: str, labels: List[str]) -> Dict[str, int]:
+    """统计需求与供给，返回 idle、booting、demand 和本运行的排名 rank"""
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    arch = os.environ.get("ARCH", "amd64")
+    run_id = int(get_env_var("GITHUB_RUN_ID"))
+    workflow_file = get_env_var("WORKFLOW_FILE")
+    setup_job_name = os.environ.get("SETUP_JOB_NAME", "Setup Spot Instance")
+    build_job_name = os.environ.get("BUILD_JOB_NAME", "Build and Push")
+    boot_window = int(os.environ.get("BOOT_WINDOW_SECONDS") or 900)
+
+    runners = list_runners(repository, token)
+    idle = sum(
+        1
+        for r in runners
+        if has_labels(r, labels) and r.get("status") == "online" and not r.get("busy")
+    )
+    booting = count_booting_slots(region_id, arch, runners, boot_window)
+
+    pending = [
+        pending_run_id
+        for _, pending_run_id in list_pending_runs(
+            repository,
+            token,
+            workflow_file,
+            setup_job_name,
+            build_job_name,
+            run_id,
+            get_max_per_instance(),
+        )
+    ]
+    if run_id not in pending:
+        pending.append(run_id)
+    return {
+        "idle": idle,
+        "booting": booting,
+        "demand": len(pending),
+        "rank": pending.index(run_id),
+    }
+
+
+def plan(repository: str, token: str, labels: List[str]) -> None:
+    """决定本次运行复用 Runner 还是启动实例"""
+    base_cpu = int(os.environ.get("MIN_CPU") or 8)
+    max_per_instance = get_max_per_instance()
+
+    state = assess(repository, token, labels)
+    idle, booting, demand, rank = (
+        state["idle"],
+        state["booting"],
+        state["demand"],
+        state["rank"],
+    )
+    supply = idle + booting
+
+    print(
+        f"Demand: {demand} pending builds; supply: {idle} idle runners + "
+        f"{booting} booting slots; this run is #{rank + 1}",
+        file=sys.stderr,
+    )
+
+    if rank < supply:
+        print("Reusing an idle or booting runner", file=sys.stderr)
+        print("LAUNCH=false")
+        return
+
+    # 未被覆盖的运行按批分组，每批由第一个运行启动实例
+    offset = rank - supply
+    if offset % max_per_instance != 0:
+        print(
+            f"Runner will be provided by run #{rank - offset % max_per_instance + 1}",
+            file=sys.stderr,
+        )
+        print("LAUNCH=false")
+        return
+
+    runner_count = min(max_per_instance, demand - rank)
+    print(
+        f"Launching one instance for {runner_count} runners "
+        f"({base_cpu * runner_count} vCPUs)",
+        file=sys.stderr,
+    )
+    print("LAUNCH=true")
+    print(f"RUNNER_COUNT={runner_count}")
+    print(f"MIN_CPU={base_cpu * runner_count}")
+
+
+def wait(repository: str, token: str, labels: List[str]) -> None:
+    """
+    等待轮到本运行的空闲 Runner（由其它运行启动的实例提供）
+
+    更早的待构建运行优先取用空闲 Runner，空闲数超过本运行的排名才算可用，
+    避免多个等待中的运行认领同一台 Runner；负责启动实例的运行失败后，
+    重新计算会让本运行成为启动者，此时立即失败而不是等到超时
+    """
+    timeout = int(os.environ.get("TIMEOUT") or 600)
+    interval = int(os.environ.get("INTERVAL") or 10)
+    max_per_instance = get_max_per_instance()
+
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        state = assess(repository, token, labels)
+        rank, idle = state["rank"], state["idle"]
+        if rank < idle:
+            print(
+                f"{idle} idle runners available, this run is #{rank + 1}",
+                file=sys.stderr,
+            )
+            print("runner_online=true")
+            return
+
+        offset = rank - idle - state["booting"]
+        if offset >= 0 and offset % max_per_instance == 0:
+            error_exit(
+                "No run is providing a runner for this run any more "
+                "(the launching run may have failed)"
+            )
+        time.sleep(interval)
+
+    error_exit(f"No idle runner became available within {timeout}s")
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("plan", "wait"):
+        error_exit("Usage: schedule-runners.py plan|wait")
+
+    token = get_env_var("GITHUB_TOKEN")
+    repository = get_env_var("GITHUB_REPOSITORY")
+    labels = [
+        label.strip()
+        for label in get_env_var("RUNNER_LABELS").split(",")
+        if label.strip()
+    ]
+
+    if sys.argv[1] == "plan":
+        plan(repository, token, labels)
+    else:
+        wait(repository, token, labels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,704 @@
+#!/usr/bin/env python3
+"""
+Runner 启动编排
+将 setup job 的各个步骤组织为依赖图并发执行：注册令牌、JIT 配置、
+spot-instance-advisor 下载与实例选择、自定义镜像查询、启动模板等互不依赖的节点同时进行，
+实例选择与镜像解析完成后立即创建实例；各节点仍调用原有脚本，
+节点耗时与关键路径写入 Step Summary
+
+依赖图：
+    schedule ─┬─ advisor ─ select ─ plan ──────────────┐
+              │  image ─ launch_template ──────────────┤
+              │  token ─┬─ user_data ─ warm_pool ──────┼─ create ─┬─ cache_disk
+              └─ jit ───┘                              │          └─ wait
+              └─ reuse（调度器决定复用已有 Runner 时）
+
+输出：
+    instance_id、runner_name、runner_online、launched_instance_type、runner_count、
+    instance_type、zone_id、vswitch_id、spot_price_limit、cpu_cores、
+    launch_template_id、launch_template_version
+"""
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+GITHUB_API_URL = "https://api.github.com"
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 回退版本 v1.0.1：从该版本开始支持 --arch 参数
+ADVISOR_FALLBACK_VERSION = "v1.0.1"
+
+# 日志输出锁，避免并发节点的日志行交错
+LOG_LOCK = threading.Lock()
+
+
+class NodeError(Exception):
+    """节点执行失败"""
+
+
+class Node:
+    """依赖图中的一个节点"""
+
+    def __init__(
+        self,
+        name: str,
+        deps: List[str],
+        func: Callable[["Setup"], Dict[str, str]],
+        enabled: Callable[["Setup"], bool] = lambda setup: True,
+        optional: bool = False,
+    ):
+        self.name = name
+        self.deps = deps
+        self.func = func
+        self.enabled = enabled
+        # 可选节点失败时不中断编排（与原 workflow 中 continue-on-error 的步骤对应）
+        self.optional = optional
+        self.status = "pending"
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def log(node: str, message: str) -> None:
+    """输出带节点名前缀的日志"""
+    with LOG_LOCK:
+        print(f"[{node}] {message}", file=sys.stderr, flush=True)
+
+
+def mask(value: str) -> None:
+    """在 workflow 日志中隐藏敏感值"""
+    if value:
+        with LOG_LOCK:
+            print(f"::add-mask::{value}", file=sys.stderr, flush=True)
+
+
+def parse_output(output: str) -> Dict[str, str]:
+    """解析脚本输出的 KEY=VALUE 行"""
+    result = {}
+    for line in output.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key.strip():
+            result[key.strip()] = value.strip()
+    return result
+
+
+def run_script(
+    node: str,
+    args: List[str],
+    env: Dict[str, str],
+    on_line: Optional[Callable[[str], None]] = None,
+) -> str:
+    """运行脚本，实时输出带前缀的标准错误，返回标准输出"""
+    process = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env={**os.environ, **env},
+    )
+    stdout_chunks: List[str] = []
+    reader = threading.Thread(
+        target=lambda: stdout_chunks.append(process.stdout.read()), daemon=True
+    )
+    reader.start()
+    for line in process.stderr:
+        if on_line:
+            on_line(line.strip())
+        log(node, line.rstrip("\n"))
+    process.wait()
+    reader.join()
+
+    if process.returncode != 0:
+        raise NodeError(f"{os.path.basename(args[1])} exited with {process.returncode}")
+    return "".join(stdout_chunks)
+
+
+def run_python(
+    node: str,
+    script: str,
+    env: Dict[str, str],
+    *args: str,
+    on_line: Optional[Callable[[str], None]] = None,
+) -> str:
+    """运行同目录下的 Python 脚本"""
+    return run_script(
+        node,
+        [sys.executable, os.path.join(SCRIPTS_DIR, script), *args],
+        env,
+        on_line=on_line,
+    )
+
+
+def github_request(
+    method: str, path: str, token: str, body: Optional[dict] = None
+) -> dict:
+    """调用 GitHub REST API"""
+    request = urllib.request.Request(
+        f"{GITHUB_API_URL}{path}",
+        method=method,
+        data=json.dumps(body).encode("utf-8") if body is not None else None,
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            content = response.read().decode("utf-8")
+            return json.loads(content) if content.strip() else {}
+    except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+        raise NodeError(f"{method} {path} failed: {e}") from e
+
+
+class Setup:
+    """编排上下文：共享的配置与各节点输出"""
+
+    def __init__(self):
+        self.arch = get_env_var("ARCH")
+        self.repository = get_env_var("GITHUB_REPOSITORY")
+        self.pat = get_env_var("RUNNER_REGISTRATION_PAT")
+        self.labels = get_env_var("RUNNER_LABELS")
+        self.runner_name = f"ci-runner-{self.arch}-spot-{int(time.time())}"
+        self.outputs: Dict[str, Dict[str, str]] = {}
+
+    def get(self, node: str, key: str, default: str = "") -> str:
+        """读取节点输出"""
+        return self.outputs.get(node, {}).get(key, default) or default
+
+    @property
+    def launch(self) -> bool:
+        """是否需要启动实例（调度器决定复用已有 Runner 时为 False）"""
+        return self.get("schedule", "LAUNCH") != "false"
+
+    @property
+    def runner_count(self) -> str:
+        return self.get("schedule", "RUNNER_COUNT", "1")
+
+    @property
+    def min_cpu(self) -> str:
+        return self.get("schedule", "MIN_CPU", os.environ.get("MIN_CPU", ""))
+
+    @property
+    def instance_id(self) -> str:
+        return self.get("warm_pool", "INSTANCE_ID") or self.get("create", "INSTANCE_ID")
+
+    @property
+    def launched_node(self) -> str:
+        """提供实例的节点（预热池或 create）"""
+        return "warm_pool" if self.get("warm_pool", "INSTANCE_ID") else "create"
+
+    @property
+    def launched_instance_type(self) -> str:
+        return self.get(self.launched_node, "INSTANCE_TYPE")
+
+    @property
+    def cpu_cores(self) -> str:
+        """实际启动实例的 CPU 核数，未知时回退到选型结果"""
+        return self.get(self.launched_node, "CPU_CORES") or self.get(
+            "select", "CPU_CORES"
+        )
+
+    def image_env(self) -> Dict[str, str]:
+        """优先使用预装工具的自定义镜像，未找到时回退到基础镜像或镜像族系"""
+        custom_image_id = self.get("image", "IMAGE_ID")
+        return {
+            "ALIYUN_IMAGE_ID": custom_image_id or os.environ.get("BASE_IMAGE_ID", ""),
+            "ALIYUN_IMAGE_FAMILY": (
+                "" if custom_image_id else os.environ.get("BASE_IMAGE_FAMILY", "")
+            ),
+        }
+
+
+def node_schedule(setup: Setup) -> Dict[str, str]:
+    """按队列调度：复用空闲 Runner 或启动多 Runner 实例"""
+    return parse_output(
+        run_python(
+            "schedule",
+            "schedule-runners.py",
+            {"GITHUB_TOKEN": setup.pat},
+            "plan",
+        )
+    )
+
+
+def node_token(setup: Setup) -> Dict[str, str]:
+    """获取 Runner 注册令牌（JIT 配置失败时实例回退使用）"""
+    data = github_request(
+        "POST",
+        f"/repos/{setup.repository}/actions/runners/registration-token",
+        setup.pat,
+    )
+    mask(data.get("token", ""))
+    return {"TOKEN": data.get("token", "")}
+
+
+def node_jit(setup: Setup) -> Dict[str, str]:
+    """预先注册 JIT Runner，实例启动后直接运行，省去 config.sh 注册"""
+    count = int(setup.runner_count)
+    runner_group_id = int(os.environ.get("RUNNER_GROUP_ID") or 1)
+    configs = []
+    runner_ids = []
+    for i in range(1, count + 1):
+        data = github_request(
+            "POST",
+            f"/repos/{setup.repository}/actions/runners/generate-jitconfig",
+            setup.pat,
+            {
+                "name": f"{setup.runner_name}-{i}" if count > 1 else setup.runner_name,
+                "runner_group_id": runner_group_id,
+                "labels": setup.labels.split(","),
+                "work_folder": "_work",
+            },
+        )
+        config = data.get("encoded_jit_config", "")
+        mask(config)
+        configs.append(config)
+        runner_ids.append(str(data.get("runner", {}).get("id", "")))
+    return {
+        "RUNNER_JIT_CONFIG": ",".join(configs),
+        "RUNNER_IDS": ",".join(runner_id for runner_id in runner_ids if runner_id),
+    }
+
+
+def delete_jit_runners(setup: Setup) -> None:
+    """删除预先注册的 JIT Runner（启动失败时不会再有实例使用它们）"""
+    runner_ids = setup.get("jit", "RUNNER_IDS")
+    for runner_id in filter(None, runner_ids.split(",")):
+        try:
+            github_request(
+                "DELETE",
+                f"/repos/{setup.repository}/actions/runners/{runner_id}",
+                setup.pat,
+            )
+            log("jit", f"Deleted pre-registered runner {runner_id}")
+        except NodeError as e:
+            log("jit", f"Warning: {e}")
+
+
+def node_advisor(setup: Setup) -> Dict[str, str]:
+    """下载 spot-instance-advisor 预构建二进制"""
+    try:
+        version = github_request(
+            "GET", "/repos/maskshell/spot-instance-advisor/releases/latest", setup.pat
+        ).get("tag_name")
+    except NodeError as e:
+        log("advisor", f"Warning: {e}")
+        version = None
+    version = version or ADVISOR_FALLBACK_VERSION
+    log("advisor", f"Using spot-instance-advisor version: {version}")
+
+    path = os.path.abspath("spot-instance-advisor")
+    url = (
+        "https://github.com/maskshell/spot-instance-advisor/releases/download/"
+        f"{version}/spot-instance-advisor-linux-amd64"
+    )
+    try:
+        with urllib.request.urlopen(url, timeout=120) as response:
+            with open(path, "wb") as f:
+                f.write(response.read())
+    except (urllib.error.URLError, OSError) as e:
+        raise NodeError(f"Failed to download spot-instance-advisor: {e}") from e
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return {"ADVISOR_PATH": path}
+
+
+def node_select(setup: Setup) -> Dict[str, str]:
+    """选择最优 Spot 实例规格"""
+    outputs = parse_output(
+        run_python(
+            "select",
+            "select-instance.py",
+            {
+                "SPOT_ADVISOR_BINARY": setup.get("advisor", "ADVISOR_PATH"),
+                "MIN_CPU": setup.min_cpu,
+            },
+        )
+    )
+    outputs.setdefault("CPU_CORES", "8")
+    return outputs
+
+
+def node_plan(setup: Setup) -> Dict[str, str]:
+    """按配额和安全组容量剔除放不下的候选"""
+    return parse_output(
+        run_python(
+            "plan",
+            "plan-launch.py",
+            {"CANDIDATES_FILE": setup.get("select", "CANDIDATES_FILE")},
+        )
+    )
+
+
+def node_image(setup: Setup) -> Dict[str, str]:
+    """查询预装工具的自定义镜像 ID"""
+    return parse_output(run_python("image", "get-image-id-by-name.py", {}))
+
+
+def node_launch_template(setup: Setup) -> Dict[str, str]:
+    """镜像或 User Data 模板变化时创建启动模板新版本"""
+    return parse_output(
+        run_python("launch_template", "launch-template.py", setup.image_env())
+    )
+
+
+def node_user_data(setup: Setup) -> Dict[str, str]:
+    """渲染 User Data 字节文件（预热池另需可直接运行的脚本）"""
+    env = {
+        "RUNNER_REGISTRATION_TOKEN": setup.get("token", "TOKEN"),
+        "RUNNER_NAME": setup.runner_name,
+        "RUNNER_JIT_CONFIG": setup.get("jit", "RUNNER_JIT_CONFIG"),
+        "RUNNER_COUNT": setup.runner_count,
+        # 代理只用于实例，不影响本机的 API 调用
+        "HTTP_PROXY": os.environ.get("RUNNER_HTTP_PROXY", ""),
+        "HTTPS_PROXY": os.environ.get("RUNNER_HTTPS_PROXY", ""),
+        "NO_PROXY": os.environ.get("RUNNER_NO_PROXY", ""),
+    }
+    run_python("user_data", "render-user-data.py", env, "/tmp/user-data.bin")
+    if os.environ.get("WARM_POOL_SIZE", "0") not in ("", "0"):
+        run_python(
+            "user_data",
+            "render-user-data.py",
+            {**env, "USER_DATA_COMPRESSION": "stub"},
+            "/tmp/warm-user-data.sh",
+        )
+    return {"USER_DATA_FILE": "/tmp/user-data.bin"}
+
+
+def node_warm_pool(setup: Setup) -> Dict[str, str]:
+    """从预热池启动已停机的实例（池为空时不输出 INSTANCE_ID）"""
+    return parse_output(
+        run_python(
+            "warm_pool",
+            "warm-pool.py",
+            {
+                "INSTANCE_NAME": setup.runner_name,
+                "USER_DATA_FILE": "/tmp/warm-user-data.sh",
+            },
+            "acquire",
+        )
+    )
+
+
+def node_create(setup: Setup) -> Dict[str, str]:
+    """创建 Spot 实例（预热池已提供实例时跳过）"""
+    if setup.get("warm_pool", "INSTANCE_ID"):
+        log("create", "Using warm pool instance, skipping instance creation")
+        return {}
+
+    env = {
+        **setup.image_env(),
+        "ALIYUN_VSWITCH_ID": setup.get("select", "VSWITCH_ID"),
+        "INSTANCE_TYPE": setup.get("select", "INSTANCE_TYPE"),
+        "SPOT_PRICE_LIMIT": setup.get("select", "SPOT_PRICE_LIMIT"),
+        "CANDIDATES_FILE": setup.get("select", "CANDIDATES_FILE"),
+        "ZONE_ID": setup.get("select", "ZONE_ID"),
+        "INSTANCE_NAME": setup.runner_name,
+        "USER_DATA_FILE": setup.get("user_data", "USER_DATA_FILE"),
+        # 输出详细的 VSwitch ID 映射信息
+        "DEBUG": "true",
+        "LAUNCH_TEMPLATE_ID": setup.get("launch_template", "LAUNCH_TEMPLATE_ID"),
+        "LAUNCH_TEMPLATE_VERSION": setup.get(
+            "launch_template", "LAUNCH_TEMPLATE_VERSION"
+        ),
+        # 记录实例承载的 Runner 数量与所属运行，供调度器和孤儿清理使用
+        "INSTANCE_TAGS": (
+            f"RunnerSlots={setup.runner_count},"
+            f"GithubRunId={os.environ.get('GITHUB_RUN_ID', '')}"
+        ),
+    }
+    launched_type = []
+
+    def capture(line: str) -> None:
+        if line.startswith("Instance Type: "):
+            launched_type.append(line.split(": ", 1)[1].strip())
+
+    output = run_python("create", "create-spot-instance.py", env, on_line=capture)
+
+    # 脚本只在标准输出的最后一行输出实例 ID
+    lines = output.strip().splitlines()
+    if not lines:
+        raise NodeError("Failed to extract instance ID")
+
+    # 实际启动规格的 CPU 核数从候选文件读取（格式：INSTANCE_TYPE|...|CPU_CORES）
+    cpu_cores = ""
+    candidates_file = env["CANDIDATES_FILE"]
+    if launched_type and candidates_file and os.path.isfile(candidates_file):
+        with open(candidates_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip().split("|")
+                if parts[0] == launched_type[-1] and len(parts) > 4:
+                    cpu_cores = parts[4]
+                    break
+    return {
+        "INSTANCE_ID": lines[-1].strip(),
+        # 实际启动的实例规格，供 Spot 中断重新排队时排除
+        "INSTANCE_TYPE": launched_type[-1] if launched_type else "",
+        "CPU_CORES": cpu_cores,
+    }
+
+
+def node_cache_disk(setup: Setup) -> Dict[str, str]:
+    """挂载构建缓存数据盘"""
+    return parse_output(
+        run_python(
+            "cache_disk",
+            "cache-disk.py",
+            {"INSTANCE_ID": setup.instance_id},
+            "attach",
+        )
+    )
+
+
+def node_wait(setup: Setup) -> Dict[str, str]:
+    """等待 Runner 上线（多 Runner 实例等待第一个）"""
+    runner_name = setup.runner_name
+    if setup.runner_count != "1":
+        runner_name = f"{runner_name}-1"
+    return parse_output(
+        run_python(
+            "wait",
+            "wait-for-runner.py",
+            {
+                "GITHUB_TOKEN": setup.pat,
+                "RUNNER_NAME": runner_name,
+                "INSTANCE_ID": setup.instance_id,
+                "TIMEOUT": os.environ.get("RUNNER_WAIT_TIMEOUT", "300"),
+            },
+        )
+    )
+
+
+def node_reuse(setup: Setup) -> Dict[str, str]:
+    """由空闲 Runner 或其它运行启动的多 Runner 实例承接本次构建"""
+    return parse_output(
+        run_python(
+            "reuse",
+            "schedule-runners.py",
+            {"GITHUB_TOKEN": setup.pat, "TIMEOUT": "600", "INTERVAL": "10"},
+            "wait",
+        )
+    )
+
+
+def build_graph() -> Dict[str, Node]:
+    """构建依赖图"""
+
+    def launching(setup: Setup) -> bool:
+        return setup.launch
+
+    def env_enabled(name: str, default: str = "") -> bool:
+        return os.environ.get(name, default) == "true"
+
+    nodes = [
+        Node(
+            "schedule",
+            [],
+            node_schedule,
+            enabled=lambda s: env_enabled("RUNNER_SCHEDULER"),
+            optional=True,
+        ),
+        Node("token", ["schedule"], node_token, enabled=launching),
+        Node(
+            "jit",
+            ["schedule"],
+            node_jit,
+            enabled=lambda s: s.launch and os.environ.get("USE_JIT_CONFIG") != "false",
+            optional=True,
+        ),
+        Node("advisor", ["schedule"], node_advisor, enabled=launching),
+        Node("select", ["advisor"], node_select, enabled=launching),
+        Node("plan", ["select"], node_plan, enabled=launching),
+        Node("image", ["schedule"], node_image, enabled=launching, optional=True),
+        Node(
+            "launch_template",
+            ["image"],
+            node_launch_template,
+            enabled=lambda s: s.launch and env_enabled("USE_LAUNCH_TEMPLATE"),
+            optional=True,
+        ),
+        Node("user_data", ["token", "jit"], node_user_data, enabled=launching),
+        Node(
+            "warm_pool",
+            ["user_data"],
+            node_warm_pool,
+            # 预热池实例规格固定，多 Runner 实例需要按需选择规格
+            enabled=lambda s: s.launch
+            and os.environ.get("WARM_POOL_SIZE", "0") not in ("", "0")
+            and s.runner_count == "1",
+            optional=True,
+        ),
+        Node(
+            "create",
+            ["plan", "image", "launch_template", "user_data", "warm_pool"],
+            node_create,
+            enabled=launching,
+        ),
+        Node(
+            "cache_disk",
+            ["create"],
+            node_cache_disk,
+            enabled=lambda s: s.launch and env_enabled("BUILD_CACHE_DISK"),
+            optional=True,
+        ),
+        Node("wait", ["create"], node_wait, enabled=launching),
+        Node("reuse", ["schedule"], node_reuse, enabled=lambda s: not s.launch),
+    ]
+    return {node.name: node for node in nodes}
+
+
+def run_graph(setup: Setup, nodes: Dict[str, Node], start_time: float) -> bool:
+    """并发执行依赖图，返回是否全部必需节点成功"""
+    failed = False
+    running = {}
+
+    def ready(node: Node) -> bool:
+        return node.status == "pending" and all(
+            nodes[dep].status not in ("pending", "running") for dep in node.deps
+        )
+
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        while True:
+            if not failed:
+                for node in nodes.values():
+                    if not ready(node):
+                        continue
+                    if not node.enabled(setup):
+                        node.status = "skipped"
+                        continue
+                    node.status = "running"
+                    node.start = time.time() - start_time
+                    log(node.name, "started")
+                    running[executor.submit(node.func, setup)] = node
+
+            if not running:
+                # 跳过节点可能让其它节点变为可执行，重新检查一次
+                if not failed and any(ready(n) for n in nodes.values()):
+                    continue
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                node.end = time.time() - start_time
+                try:
+                    setup.outputs[node.name] = future.result() or {}
+                    node.status = "done"
+                    log(node.name, f"finished in {node.end - node.start:.1f}s")
+                except Exception as e:  # noqa: BLE001 - 节点异常统一按失败处理
+                    node.status = "failed"
+                    log(node.name, f"failed after {node.end - node.start:.1f}s: {e}")
+                    if not node.optional:
+                        failed = True
+
+    return not failed
+
+
+def critical_path(nodes: Dict[str, Node]) -> List[str]:
+    """从最晚结束的节点沿最晚结束的依赖回溯，得到关键路径"""
+    finished = [n for n in nodes.values() if n.end is not None]
+    if not finished:
+        return []
+    current = max(finished, key=lambda n: n.end)
+    path = [current.name]
+    while True:
+        deps = [nodes[d] for d in current.deps if nodes[d].end is not None]
+        if not deps:
+            break
+        current = max(deps, key=lambda n: n.end)
+        path.append(current.name)
+    return list(reversed(path))
+
+
+def write_summary(nodes: Dict[str, Node], total: float) -> None:
+    """输出节点耗时与关键路径"""
+    path = critical_path(nodes)
+    lines = [
+        "## Runner Setup",
+        "",
+        f"Total: **{total:.1f}s**, critical path: `{' → '.join(path)}`",
+        "",
+        "| Node | Status | Start (s) | Duration (s) | Critical |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for node in sorted(nodes.values(), key=lambda n: (n.start is None, n.start or 0)):
+        start = f"{node.start:.1f}" if node.start is not None else ""
+        duration = (
+            f"{node.end - node.start:.1f}"
+            if node.start is not None and node.end is not None
+            else ""
+        )
+        critical = "yes" if node.name in path else ""
+        lines.append(
+            f"| {node.name} | {node.status} | {start} | {duration} | {critical} |"
+        )
+    summary = "\n".join(lines) + "\n"
+
+    print(summary, file=sys.stderr)
+    summary_file = os.environ.get("GITHUB_STEP_SUMMARY")
+    if summary_file:
+        with open(summary_file, "a", encoding="utf-8") as f:
+            f.write(summary)
+
+
+def main():
+    """主函数"""
+    setup = Setup()
+    nodes = build_graph()
+    start_time = time.time()
+    success = run_graph(setup, nodes, start_time)
+    write_summary(nodes, time.time() - start_time)
+
+    # 失败时也输出实例 ID，供 Cleanup on Failure 清理
+    outputs = {
+        "instance_id": setup.instance_id,
+        "runner_name": setup.runner_name,
+        "runner_online": setup.get("wait", "runner_online")
+        or setup.get("reuse", "runner_online"),
+        "launched_instance_type": setup.launched_instance_type,
+        "runner_count": setup.get("schedule", "RUNNER_COUNT"),
+        "instance_type": setup.get("select", "INSTANCE_TYPE"),
+        "zone_id": setup.get("select", "ZONE_ID"),
+        "vswitch_id": setup.get("select", "VSWITCH_ID"),
+        "spot_price_limit": setup.get("select", "SPOT_PRICE_LIMIT"),
+        "cpu_cores": setup.cpu_cores,
+        "launch_template_id": setup.get("launch_template", "LAUNCH_TEMPLATE_ID"),
+        "launch_template_version": setup.get(
+            "launch_template", "LAUNCH_TEMPLATE_VERSION"
+        ),
+    }
+    for key, value in outputs.items():
+        if value:
+            print(f"{key}={value}")
+
+    if not success:
+        delete_jit_runners(setup)
+        failed = [n.name for n in nodes.values() if n.status == "failed"]
+        error_exit(f"Runner setup failed at: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
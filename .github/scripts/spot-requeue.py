@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Spot 中断后重新排队构建
+build job 失败时检查 Runner 实例是否收到过 Spot 回收通知（系统事件
+Instance:PreemptibleInstanceInterruption，实例释放后仍可查询），
+是则排除被回收的实例规格后重新触发 workflow
+
+输出：
+    INTERRUPTED=true|false
+    REQUEUED=true|false
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import List, Optional
+
+INTERRUPTION_EVENT_TYPE = "Instance:PreemptibleInstanceInterruption"
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def was_interrupted(region_id: str, instance_id: str) -> bool:
+    """查询实例是否收到过 Spot 回收通知"""
+    cmd = [
+        "aliyun",
+        "ecs",
+        "DescribeInstanceHistoryEvents",
+        "--RegionId",
+        region_id,
+        "--InstanceId",
+        instance_id,
+        "--EventType",
+        INTERRUPTION_EVENT_TYPE,
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=30
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: Failed to query instance events: {e}", file=sys.stderr)
+        return False
+
+    if result.returncode != 0:
+        print(
+            f"Warning: Failed to query instance events: {result.stderr[:300]}",
+            file=sys.stderr,
+        )
+        return False
+
+    try:
+        data = json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return False
+
+    # 查询已按事件类型过滤，有记录即表示收到过回收通知
+    events = data.get("InstanceSystemEventSet", {}).get("InstanceSystemEventType", [])
+    if events:
+        print(
+            f"Spot interruption event found for {instance_id}: "
+            f"{events[0].get('EventPublishTime', '')}",
+            file=sys.stderr,
+        )
+        return True
+    return False
+
+
+def merge_exclusions(existing: str, instance_type: Optional[str]) -> str:
+    """合并已排除的实例规格"""
+    excluded: List[str] = [t for t in existing.split(",") if t.strip()]
+    if instance_type and instance_type not in excluded:
+        excluded.append(instance_type)
+    return ",".join(excluded)
+
+
+def dispatch_workflow(workflow_file: str, ref: str, inputs: dict) -> bool:
+    """重新触发 workflow（workflow_dispatch）"""
+    cmd = ["gh", "workflow", "run", workflow_file, "--ref", ref]
+    for key, value in inputs.items():
+        if value != "":
+            cmd.extend(["-f", f"{key}={value}"])
+
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=60
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: Failed to dispatch workflow: {e}", file=sys.stderr)
+        return False
+
+    if result.returncode != 0:
+        print(
+            f"Warning: Failed to dispatch workflow: {result.stderr[:300]}",
+            file=sys.stderr,
+        )
+        return False
+    return True
+
+
+def main():
+    """主函数"""
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    instance_id = get_env_var("INSTANCE_ID")
+    instance_type = os.environ.get("INSTANCE_TYPE")
+    workflow_file = get_env_var("WORKFLOW_FILE")
+    ref = get_env_var("REF")
+    requeue_count = int(os.environ.get("REQUEUE_COUNT") or 0)
+    max_requeue = int(os.environ.get("MAX_SPOT_REQUEUE") or 2)
+    exclude_instance_types = os.environ.get("EXCLUDE_INSTANCE_TYPES", "")
+    min_cpu = os.environ.get("MIN_CPU", "")
+
+    if not was_interrupted(region_id, instance_id):
+        print(
+            f"No spot interruption recorded for {instance_id}, not requeuing",
+            file=sys.stderr,
+        )
+        print("INTERRUPTED=false")
+        print("REQUEUED=false")
+        return
+
+    print("INTERRUPTED=true")
+    if requeue_count >= max_requeue:
+        print(
+            f"Requeue limit reached ({requeue_count}/{max_requeue}), giving up",
+            file=sys.stderr,
+        )
+        print("REQUEUED=false")
+        return
+
+    excluded = merge_exclusions(exclude_instance_types, instance_type)
+    print(
+        f"Requeuing {workflow_file} on {ref} "
+        f"(attempt {requeue_count + 1}/{max_requeue}, excluding: {excluded})",
+        file=sys.stderr,
+    )
+    requeued = dispatch_workflow(
+        workflow_file,
+        ref,
+        {
+            "min_cpu": min_cpu,
+            "exclude_instance_types": excluded,
+            "requeue_count": str(requeue_count + 1),
+        },
+    )
+    print(f"REQUEUED={'true' if requeued else 'false'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+清理孤儿实例与镜像（兜底机制）
+自毁和 Cleanup on Failure 都未能释放的实例会持续计费，这里一次分页遍历
+带 GITHUB_RUNNER_TYPE 标签的实例（Runner 实例和镜像构建实例），
+与 GitHub 上仍在运行的 workflow 和在线 Runner 交叉核对后批量释放：
+
+- 创建未满 ORPHAN_MIN_AGE_MINUTES 的实例不处理（仍在启动或注册中）
+- 预热池中的实例（WarmPool=<arch>）不处理，由 warm-pool.py 回收
+- GithubRunId 标签对应的运行仍在排队或执行中，或实例上有在线的 Runner，视为在用；
+  超过 ORPHAN_MAX_AGE_HOURS 的实例无论如何都会释放
+- 没有 GithubRunId 标签的实例只按 ORPHAN_MAX_AGE_HOURS 判断
+
+同时删除 IMAGE_NAME_PREFIX 前缀下创建失败（CreateFailed/UnAvailable）的镜像
+
+输出：
+    ORPHAN_INSTANCES=<释放的实例数>
+    ORPHAN_IMAGES=<删除的镜像数>
+"""
+
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+GITHUB_API_URL = "https://api.github.com"
+
+# 预热池标签
+POOL_TAG_KEY = "WarmPool"
+
+# 实例所属 workflow 运行的标签
+RUN_ID_TAG_KEY = "GithubRunId"
+
+# DeleteInstances 单次最多 100 个实例
+DELETE_BATCH_SIZE = 100
+
+# 视为失败的镜像状态
+FAILED_IMAGE_STATUSES = "CreateFailed,UnAvailable"
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 30) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return None
+
+
+def github_get(path: str, token: str) -> Optional[dict]:
+    """调用 GitHub REST API（GET）"""
+    request = urllib.request.Request(
+        f"{GITHUB_API_URL}{path}",
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+        print(f"Warning: GET {path} failed: {e}", file=sys.stderr)
+        return None
+
+
+def list_runner_instances(region_id: str) -> List[dict]:
+    """列出带 GITHUB_RUNNER_TYPE 标签的实例（分页）"""
+    instances = []
+    page_number = 1
+    while True:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--Tag.1.Key",
+                "GITHUB_RUNNER_TYPE",
+                "--Tag.1.Value",
+                "aliyun-ecs-spot",
+                "--PageSize",
+                "100",
+                "--PageNumber",
+                str(page_number),
+            ]
+        )
+        if data is None:
+            error_exit("Failed to list runner instances")
+
+        page = data.get("Instances", {}).get("Instance", [])
+        instances.extend(page)
+        if len(page) < 100:
+            break
+        page_number += 1
+    return instances
+
+
+def list_active_run_ids(repository: str, token: str) -> Optional[set]:
+    """列出仓库中排队或执行中的 workflow 运行 ID，查询失败时返回 None"""
+    run_ids = set()
+    for status in ("queued", "in_progress"):
+        page = 1
+        while True:
+            data = github_get(
+                f"/repos/{repository}/actions/runs"
+                f"?status={status}&per_page=100&page={page}",
+                token,
+            )
+            if data is None:
+                return None
+            runs = data.get("workflow_runs", [])
+            run_ids.update(str(run["id"]) for run in runs)
+            if len(runs) < 100:
+                break
+            page += 1
+    return run_ids
+
+
+def list_online_runner_names(repository: str, token: str) -> Optional[List[str]]:
+    """列出在线的自托管 Runner 名称（分页），查询失败时返回 None"""
+    names = []
+    page = 1
+    while True:
+        data = github_get(
+            f"/repos/{repository}/actions/runners?per_page=100&page={page}", token
+        )
+        if data is None:
+            return None
+        runners = data.get("runners", [])
+        names.extend(r.get("name", "") for r in runners if r.get("status") == "online")
+        if len(runners) < 100:
+            break
+        page += 1
+    return names
+
+
+def get_tags(instance: dict) -> Dict[str, str]:
+    """实例标签字典"""
+    return {
+        tag.get("TagKey", ""): tag.get("TagValue", "")
+        for tag in instance.get("Tags", {}).get("Tag", [])
+    }
+
+
+def get_age_hours(instance: dict, now: datetime) -> Optional[float]:
+    """实例创建至今的小时数（CreationTime 例如：2024-01-01T00:00Z）"""
+    creation_time = instance.get("CreationTime", "")
+    for fmt in ("%Y-%m-%dT%H:%MZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            created = datetime.strptime(creation_time, fmt).replace(tzinfo=timezone.utc)
+            return (now - created).total_seconds() / 3600
+        except ValueError:
+            continue
+    return None
+
+
+def find_orphans(
+    instances: List[dict],
+    active_run_ids: Optional[set],
+    online_runners: Optional[List[str]],
+    min_age_hours: float,
+    max_age_hours: float,
+) -> List[dict]:
+    """筛选孤儿实例"""
+    now = datetime.now(timezone.utc)
+    orphans = []
+    for instance in instances:
+        instance_id = instance.get("InstanceId", "")
+        name = instance.get("InstanceName", "")
+        tags = get_tags(instance)
+
+        age = get_age_hours(instance, now)
+        if age is None or age < min_age_hours:
+            continue
+        # 池内实例（值为架构）由预热池回收，取出后标签值为 in-use
+        if tags.get(POOL_TAG_KEY) not in (None, "in-use"):
+            continue
+
+        if age < max_age_hours:
+            run_id = tags.get(RUN_ID_TAG_KEY)
+            # 无法确认运行状态时保守处理
+            if not run_id or active_run_ids is None or run_id in active_run_ids:
+                continue
+            if online_runners is None or any(
+                n == name or n.startswith(f"{name}-") for n in online_runners
+            ):
+                continue
+            reason = f"run {run_id} is no longer active"
+        else:
+            reason = f"older than {max_age_hours:g}h"
+
+        print(
+            f"Orphan instance {instance_id} ({name}, {instance.get('Status')}, "
+            f"{age:.1f}h old): {reason}",
+            file=sys.stderr,
+        )
+        orphans.append(instance)
+    return orphans
+
+
+def delete_instances(region_id: str, instance_ids: List[str]) -> int:
+    """批量释放实例（每次最多 100 个），返回成功提交的数量"""
+    deleted = 0
+    for i in range(0, len(instance_ids), DELETE_BATCH_SIZE):
+        batch = instance_ids[i : i + DELETE_BATCH_SIZE]
+        args = ["DeleteInstances", "--RegionId", region_id, "--Force", "true"]
+        for index, instance_id in enumerate(batch, 1):
+            args.extend([f"--InstanceId.{index}", instance_id])
+        if run_aliyun(args, timeout=60) is not None:
+            deleted += len(batch)
+        else:
+            print(
+                f"Warning: Failed to delete {len(batch)} instances: {', '.join(batch)}",
+                file=sys.stderr,
+            )
+    return deleted
+
+
+def sweep_failed_images(region_id: str, image_name_prefix: str, dry_run: bool) -> int:
+    """删除指定前缀下创建失败的镜像，返回删除数量"""
+    data = run_aliyun(
+        [
+            "DescribeImages",
+            "--RegionId",
+            region_id,
+            "--ImageOwnerAlias",
+            "self",
+            "--Status",
+            FAILED_IMAGE_STATUSES,
+            "--PageSize",
+            "100",
+        ]
+    )
+    images = [
+        image
+        for image in (data or {}).get("Images", {}).get("Image", [])
+        if image.get("ImageName", "").startswith(image_name_prefix)
+    ]
+
+    deleted = 0
+    for image in images:
+        image_id = image.get("ImageId", "")
+        print(
+            f"Orphan image {image_id} ({image.get('ImageName')}, "
+            f"{image.get('Status')})",
+            file=sys.stderr,
+        )
+        if dry_run:
+            continue
+        if (
+            run_aliyun(
+                [
+                    "DeleteImage",
+                    "--RegionId",
+                    region_id,
+                    "--ImageId",
+                    image_id,
+                    "--Force",
+                    "true",
+                ]
+            )
+            is not None
+        ):
+            deleted += 1
+    return deleted
+
+
+def main():
+    """主函数"""
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    repository = get_env_var("GITHUB_REPOSITORY")
+    token = get_env_var("GITHUB_TOKEN")
+    # 查询 Runner 列表需要仓库管理权限（与注册 Runner 的 PAT 相同）
+    runners_token = os.environ.get("RUNNERS_TOKEN") or token
+    image_name_prefix = os.environ.get("IMAGE_NAME_PREFIX", "github-runner-ubuntu24")
+    min_age_hours = float(os.environ.get("ORPHAN_MIN_AGE_MINUTES") or 10) / 60
+    max_age_hours = float(os.environ.get("ORPHAN_MAX_AGE_HOURS") or 6)
+    dry_run = os.environ.get("DRY_RUN", "false").lower() == "true"
+
+    instances = list_runner_instances(region_id)
+    active_run_ids = list_active_run_ids(repository, token)
+    online_runners = list_online_runner_names(repository, runners_token)
+    print(
+        f"Found {len(instances)} runner instances, "
+        f"{len(active_run_ids) if active_run_ids is not None else '?'} active runs, "
+        f"{len(online_runners) if online_runners is not None else '?'} online runners",
+        file=sys.stderr,
+    )
+
+    orphans = find_orphans(
+        instances, active_run_ids, online_runners, min_age_hours, max_age_hours
+    )
+    deleted_instances = 0
+    if orphans and not dry_run:
+        deleted_instances = delete_instances(
+            region_id, [instance["InstanceId"] for instance in orphans]
+        )
+
+    deleted_images = sweep_failed_images(region_id, image_name_prefix, dry_run)
+
+    print(
+        f"Sweep finished: {deleted_instances}/{len(orphans)} orphan instances "
+        f"released, {deleted_images} failed images deleted"
+        f"{' (dry run)' if dry_run else ''}",
+        file=sys.stderr,
+    )
+    print(f"ORPHAN_INSTANCES={deleted_instances}")
+    print(f"ORPHAN_IMAGES={deleted_images}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+验证 Runner 实例释放并统计释放耗时
+实例在 Job 完成 hook 中自行释放，这里在 build job 结束后查询实例，
+以 build job 的完成时间为起点统计到实例不可查询（已释放）为止的耗时；
+超过 TEARDOWN_TIMEOUT 仍未释放时作为兜底删除实例
+
+输出：
+    TEARDOWN_LATENCY=<秒数>
+    TEARDOWN_FALLBACK=true|false
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import List, Optional
+
+GITHUB_API_URL = "https://api.github.com"
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 15) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return None
+
+
+def get_job_completed_at(
+    repository: str, token: str, run_id: str, job_name: str
+) -> Optional[float]:
+    """查询本次运行中指定 job 的完成时间（Unix 时间戳）"""
+    request = urllib.request.Request(
+        f"{GITHUB_API_URL}/repos/{repository}/actions/runs/{run_id}/jobs?per_page=100",
+        headers={
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=15) as response:
+            data = json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Failed to query jobs: {e}", file=sys.stderr)
+        return None
+
+    for job in data.get("jobs", []):
+        if job.get("name") == job_name and job.get("completed_at"):
+            completed_at = job["completed_at"].replace("Z", "+00:00")
+            return datetime.fromisoformat(completed_at).timestamp()
+    return None
+
+
+def get_instance_status(region_id: str, instance_id: str) -> Optional[str]:
+    """查询实例状态，实例已释放时返回空字符串，查询失败返回 None"""
+    data = run_aliyun(
+        [
+            "DescribeInstances",
+            "--RegionId",
+            region_id,
+            "--InstanceIds",
+            json.dumps([instance_id]),
+        ]
+    )
+    if data is None:
+        return None
+    instances = data.get("Instances", {}).get("Instance", [])
+    return instances[0].get("Status", "") if instances else ""
+
+
+def main():
+    """主函数"""
+    token = get_env_var("GITHUB_TOKEN")
+    repository = get_env_var("GITHUB_REPOSITORY")
+    run_id = get_env_var("GITHUB_RUN_ID")
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    instance_id = get_env_var("INSTANCE_ID")
+    job_name = os.environ.get("BUILD_JOB_NAME", "Build and Push")
+    timeout = int(os.environ.get("TEARDOWN_TIMEOUT") or 120)
+    interval = float(os.environ.get("INTERVAL") or 2)
+
+    completed_at = get_job_completed_at(repository, token, run_id, job_name)
+    start_time = time.time()
+    released_at = None
+    first_poll = True
+    while time.time() - start_time < timeout:
+        status = get_instance_status(region_id, instance_id)
+        if status == "":
+            released_at = time.time()
+            break
+        if status is not None:
+            print(f"Instance {instance_id} status: {status}", file=sys.stderr)
+            first_poll = False
+        time.sleep(interval)
+
+    fallback = released_at is None
+    if fallback:
+        print(
+            f"Warning: Instance {instance_id} still exists {timeout}s after the "
+            "build job, deleting it",
+            file=sys.stderr,
+        )
+        if (
+            run_aliyun(
+                [
+                    "DeleteInstance",
+                    "--RegionId",
+                    region_id,
+                    "--InstanceId",
+                    instance_id,
+                    "--Force",
+                    "true",
+                ],
+                timeout=60,
+            )
+            is None
+        ):
+            error_exit(f"Failed to delete instance {instance_id}")
+        released_at = time.time()
+
+    latency = ""
+    if completed_at:
+        latency = f"{max(0.0, released_at - completed_at):.0f}"
+        # 首次查询时已释放，实际耗时不超过该值
+        bound = "<= " if first_poll and not fallback else ""
+        print(
+            f"Instance {instance_id} released {bound}{latency}s after the build "
+            f"job completed{' (fallback delete)' if fallback else ''}",
+            file=sys.stderr,
+        )
+        summary_file = os.environ.get("GITHUB_STEP_SUMMARY")
+        if summary_file:
+            with open(summary_file, "a", encoding="utf-8") as f:
+                f.write(
+                    f"Runner instance `{instance_id}` released {bound}{latency}s "
+                    f"after the build job completed"
+                    f"{' (fallback delete)' if fallback else ''}\n"
+                )
+
+    print(f"TEARDOWN_LATENCY={latency}")
+    print(f"TEARDOWN_FALLBACK={'true' if fallback else 'false'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+等待 Runner 上线
+实例在 Runner 开始监听 Job 后通过实例 RAM 角色为自身打上 RunnerReady=<Runner 名称>
+标签，这里以短间隔查询实例标签（单次 DescribeInstances，不依赖 Runner 数量）；
+GitHub Runner 列表查询仅作为兜底（按名称过滤、分页、间隔逐步拉长），
+用于实例无法打标签的情况（例如未安装 aliyun CLI 或角色缺少权限）
+
+输出：
+    runner_online=true
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import List, Optional
+
+GITHUB_API_URL = "https://api.github.com"
+
+# 实例就绪标签
+READY_TAG_KEY = "RunnerReady"
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(args: List[str], timeout: int = 15) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return None
+
+
+def is_instance_ready(region_id: str, instance_id: str, runner_name: str) -> bool:
+    """实例是否已为本次的 Runner 打上就绪标签"""
+    data = run_aliyun(
+        [
+            "DescribeInstances",
+            "--RegionId",
+            region_id,
+            "--InstanceIds",
+            json.dumps([instance_id]),
+        ]
+    )
+    instances = (data or {}).get("Instances", {}).get("Instance", [])
+    if not instances:
+        return False
+
+    for tag in instances[0].get("Tags", {}).get("Tag", []):
+        if tag.get("TagKey") == READY_TAG_KEY:
+            # 标签值为 Runner 名称，多 Runner 实例的名称带序号后缀
+            value = tag.get("TagValue", "")
+            return value == runner_name or runner_name.startswith(f"{value}-")
+    return False
+
+
+def find_runner(repository: str, token: str, runner_name: str) -> Optional[dict]:
+    """按名称查询 Runner（分页）"""
+    page = 1
+    while True:
+        query = urllib.parse.urlencode(
+            {"name": runner_name, "per_page": 100, "page": page}
+        )
+        request = urllib.request.Request(
+            f"{GITHUB_API_URL}/repos/{repository}/actions/runners?{query}",
+            headers={
+                "Accept": "application/vnd.github+json",
+                "Authorization": f"Bearer {token}",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=15) as response:
+                data = json.loads(response.read().decode("utf-8"))
+        except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Failed to query runners: {e}", file=sys.stderr)
+            return None
+
+        runners = data.get("runners", [])
+        for runner in runners:
+            if runner.get("name") == runner_name:
+                return runner
+        if len(runners) < 100:
+            return None
+        page += 1
+
+
+def main():
+    """主函数"""
+    token = get_env_var("GITHUB_TOKEN")
+    repository = get_env_var("GITHUB_REPOSITORY")
+    runner_name = get_env_var("RUNNER_NAME")
+    region_id = os.environ.get("ALIYUN_REGION_ID")
+    instance_id = os.environ.get("INSTANCE_ID")
+    timeout = int(os.environ.get("TIMEOUT") or 300)
+    # 标签查询间隔（秒）
+    tag_interval = float(os.environ.get("TAG_INTERVAL") or 2)
+    # GitHub 兜底查询间隔：从 MIN 开始逐步拉长到 MAX
+    fallback_interval = float(os.environ.get("MIN_INTERVAL") or 5)
+    max_interval = float(os.environ.get("MAX_INTERVAL") or 30)
+
+    use_tag = bool(region_id and instance_id)
+    print(
+        f"Waiting for runner {runner_name} (timeout: {timeout}s, "
+        f"instance tag: {'on' if use_tag else 'off'})",
+        file=sys.stderr,
+    )
+
+    start_time = time.time()
+    next_fallback = start_time + fallback_interval
+    while time.time() - start_time < timeout:
+        if use_tag and is_instance_ready(region_id, instance_id, runner_name):
+            print(
+                f"Runner {runner_name} signalled ready via instance tag "
+                f"after {time.time() - start_time:.0f}s",
+                file=sys.stderr,
+            )
+            print("runner_online=true")
+            return
+
+        if not use_tag or time.time() >= next_fallback:
+            runner = find_runner(repository, token, runner_name)
+            if runner and runner.get("status") == "online":
+                print(
+                    f"Runner {runner_name} (ID {runner.get('id')}) is online "
+                    f"after {time.time() - start_time:.0f}s",
+                    file=sys.stderr,
+                )
+                print("runner_online=true")
+                return
+            if runner:
+                print(
+                    f"Runner is registered but not online yet "
+                    f"(status: {runner.get('status')})",
+                    file=sys.stderr,
+                )
+            fallback_interval = min(fallback_interval * 1.5, max_interval)
+            next_fallback = time.time() + fallback_interval
+
+        time.sleep(tag_interval if use_tag else fallback_interval)
+
+    error_exit(f"Runner did not come online within {timeout} seconds")
+
+
+if __name__ == "__main__":
+    main()
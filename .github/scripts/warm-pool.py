@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""
+Runner 预热池管理
+维护按架构划分的已停机（节省停机模式，不收取计算资源费用）Spot 实例，
+构建时直接启动并通过云助手下发 User Data，后台补充池容量
+
+用法：
+    warm-pool.py acquire    启动一台池内实例并下发 User Data，输出 INSTANCE_ID
+    warm-pool.py replenish  回收过期实例后补足池容量
+    warm-pool.py recycle    删除超过最大存活时间或镜像已非 -latest 的池内实例
+"""
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+# 池内实例标签
+POOL_TAG_KEY = "WarmPool"
+
+# 云助手 RunCommand 的 CommandContent 上限（Base64 编码后）
+COMMAND_CONTENT_LIMIT = 18 * 1024
+
+# 云助手 SendFile 的文件内容上限（Base64 编码后），超过 RunCommand 上限时使用
+SEND_FILE_LIMIT = 32 * 1024
+
+# SendFile 下发的 User Data 在实例上的路径
+WARM_USER_DATA_PATH = "/var/tmp/warm-pool-user-data.sh"
+
+# 重试也不会成功的 RunCommand 错误（参数或内容本身不合法）
+PERMANENT_RUN_COMMAND_ERRORS = (
+    "InvalidParameter",
+    "MissingParameter",
+    "CommandContent",
+)
+
+
+def error_exit(message: str) -> None:
+    """输出错误信息并退出"""
+    print(f"Error: {message}", file=sys.stderr)
+    sys.exit(1)
+
+
+def get_env_var(name: str, default: Optional[str] = None) -> str:
+    """获取环境变量"""
+    value = os.environ.get(name, default)
+    if value is None:
+        error_exit(f"{name} is required")
+    return value
+
+
+def run_aliyun(
+    args: List[str], timeout: int = 60, errors: Optional[List[str]] = None
+) -> Optional[dict]:
+    """执行 aliyun ecs 命令，成功时返回解析后的 JSON（失败输出追加到 errors）"""
+    cmd = ["aliyun", "ecs"] + args
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, check=False, timeout=timeout
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Warning: {args[0]} failed: {e}", file=sys.stderr)
+        return None
+
+    if result.returncode != 0:
+        print(
+            f"Warning: {args[0]} failed: {(result.stdout + result.stderr)[:300]}",
+            file=sys.stderr,
+        )
+        if errors is not None:
+            errors.append(result.stdout + result.stderr)
+        return None
+
+    try:
+        return json.loads(result.stdout) if result.stdout.strip() else {}
+    except json.JSONDecodeError:
+        return {}
+
+
+def get_image_id_by_name(region_id: str, image_name: str) -> Optional[str]:
+    """通过镜像名称查找当前镜像 ID（用于判断池内实例是否使用 -latest 镜像）"""
+    data = run_aliyun(
+        [
+            "DescribeImages",
+            "--RegionId",
+            region_id,
+            "--ImageOwnerAlias",
+            "self",
+            "--ImageName",
+            image_name,
+        ],
+        timeout=30,
+    )
+    if not data:
+        return None
+
+    images = data.get("Images", {}).get("Image", [])
+    if not images:
+        return None
+    images.sort(key=lambda x: x.get("CreationTime", ""), reverse=True)
+    return images[0].get("ImageId") or None
+
+
+def list_pool_instances(region_id: str, arch: str) -> List[dict]:
+    """列出指定架构的池内实例（分页）"""
+    instances = []
+    page_number = 1
+    while True:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--Tag.1.Key",
+                POOL_TAG_KEY,
+                "--Tag.1.Value",
+                arch,
+                "--PageSize",
+                "100",
+                "--PageNumber",
+                str(page_number),
+            ],
+            timeout=30,
+        )
+        if not data:
+            break
+
+        page = data.get("Instances", {}).get("Instance", [])
+        instances.extend(page)
+        if len(page) < 100:
+            break
+        page_number += 1
+
+    return instances
+
+
+def parse_creation_time(creation_time: str) -> Optional[datetime]:
+    """解析实例创建时间（例如：2024-01-01T00:00Z）"""
+    for fmt in ("%Y-%m-%dT%H:%MZ", "%Y-%m-%dT%H:%M:%SZ"):
+        try:
+            return datetime.strptime(creation_time, fmt).replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_expired(
+    instance: dict, max_age_hours: float, current_image_id: Optional[str]
+) -> Optional[str]:
+    """判断池内实例是否需要回收，返回回收原因或 None"""
+    if current_image_id and instance.get("ImageId") != current_image_id:
+        return f"image {instance.get('ImageId')} is no longer {current_image_id}"
+
+    created = parse_creation_time(instance.get("CreationTime", ""))
+    if created:
+        age_hours = (datetime.now(timezone.utc) - created).total_seconds() / 3600
+        if age_hours > max_age_hours:
+            return f"age {age_hours:.1f}h exceeds {max_age_hours}h"
+
+    return None
+
+
+def wait_for_status(
+    region_id: str, instance_id: str, target_status: str, timeout: int = 300
+) -> bool:
+    """等待实例进入目标状态"""
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        data = run_aliyun(
+            [
+                "DescribeInstances",
+                "--RegionId",
+                region_id,
+                "--InstanceIds",
+                json.dumps([instance_id]),
+            ],
+            timeout=30,
+        )
+        instances = (data or {}).get("Instances", {}).get("Instance", [])
+        if instances and instances[0].get("Status") == target_status:
+            return True
+        if data is not None and not instances:
+            return False
+        time.sleep(5)
+    return False
+
+
+def delete_instance(instance_id: str) -> bool:
+    """强制删除实例"""
+    data = run_aliyun(
+        [
+            "DeleteInstance",
+            "--InstanceId",
+            instance_id,
+            "--Force",
+            "true",
+        ]
+    )
+    return data is not None
+
+
+def tag_instance(region_id: str, instance_id: str, tags: dict) -> bool:
+    """为实例打标签"""
+    args = [
+        "TagResources",
+        "--RegionId",
+        region_id,
+        "--ResourceType",
+        "instance",
+        "--ResourceId.1",
+        instance_id,
+    ]
+    for index, (key, value) in enumerate(tags.items(), 1):
+        args.extend([f"--Tag.{index}.Key", key, f"--Tag.{index}.Value", value])
+    return run_aliyun(args) is not None
+
+
+def load_user_data(user_data_file: str) -> Optional[bytes]:
+    """读取 User Data，无法通过云助手下发时返回 None"""
+    with open(user_data_file, "rb") as f:
+        content = f.read()
+
+    # 云助手只能执行脚本，gzip multipart 仅 cloud-init 可解析
+    if content[:2] == b"\x1f\x8b":
+        print(
+            "Error: gzip User Data cannot run via Cloud Assistant, "
+            "render it with USER_DATA_COMPRESSION=stub",
+            file=sys.stderr,
+        )
+        return None
+    encoded_size = len(base64.b64encode(content))
+    if encoded_size > SEND_FILE_LIMIT:
+        print(
+            f"Error: User Data is {encoded_size} bytes after Base64, exceeding "
+            f"the Cloud Assistant limit of {SEND_FILE_LIMIT} bytes",
+            file=sys.stderr,
+        )
+        return None
+    return content
+
+
+def invoke_cloud_assistant(
+    args: List[str], timeout: int = 120
+) -> Tuple[Optional[dict], bool]:
+    """
+    调用云助手 API（RunCommand / SendFile），实例刚启动时云助手可能尚未上线，短暂重试
+
+    返回 (响应, 失败是否可重试)；参数类错误不重试，其他实例也会同样失败
+    """
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        errors: List[str] = []
+        data = run_aliyun(args, errors=errors)
+        if data and data.get("InvokeId"):
+            return data, True
+        if any(code in e for e in errors for code in PERMANENT_RUN_COMMAND_ERRORS):
+            return None, False
+        time.sleep(5)
+    return None, True
+
+
+def run_user_data(
+    region_id: str, instance_id: str, content: bytes
+) -> Tuple[bool, bool]:
+    """
+    通过云助手在已启动的池内实例上执行 User Data，返回 (是否已下发, 失败是否可重试)
+
+    RunCommand 的命令内容不超过 COMMAND_CONTENT_LIMIT 时直接下发；更大的脚本
+    （例如包含 JIT 配置的自解压脚本）先用 SendFile 写入实例，再下发一条等待文件
+    写完后执行它的短命令
+    """
+    content_b64 = base64.b64encode(content).decode("ascii")
+    if len(content_b64) <= COMMAND_CONTENT_LIMIT:
+        command, encoding = content_b64, "Base64"
+    else:
+        data, retryable = invoke_cloud_assistant(
+            [
+                "SendFile",
+                "--RegionId",
+                region_id,
+                "--Name",
+                os.path.basename(WARM_USER_DATA_PATH),
+                "--TargetDir",
+                os.path.dirname(WARM_USER_DATA_PATH),
+                "--ContentType",
+                "Base64",
+                "--Content",
+                content_b64,
+                "--FileMode",
+                "0700",
+                "--Overwrite",
+                "true",
+                "--InstanceId.1",
+                instance_id,
+            ]
+        )
+        if not data:
+            return False, retryable
+        print(
+            f"User Data sent via Cloud Assistant (InvokeId: {data['InvokeId']})",
+            file=sys.stderr,
+        )
+        command = (
+            f"F={WARM_USER_DATA_PATH}\n"
+            "for i in $(seq 1 60); do\n"
+            f'  [[ "$(stat -c %s "$F" 2>/dev/null)" == "{len(content)}" ]] && break\n'
+            "  sleep 2\n"
+            "done\n"
+            'exec 3< "$F"\n'
+            'rm -f "$F"\n'
+            "exec /bin/bash /dev/fd/3\n"
+        )
+        encoding = "PlainText"
+
+    data, retryable = invoke_cloud_assistant(
+        [
+            "RunCommand",
+            "--RegionId",
+            region_id,
+            "--Type",
+            "RunShellScript",
+            "--ContentEncoding",
+            encoding,
+            "--CommandContent",
+            command,
+            "--InstanceId.1",
+            instance_id,
+            "--Timeout",
+            "3600",
+            "--Name",
+            "warm-pool-user-data",
+        ]
+    )
+    if not data:
+        return False, retryable
+    print(
+        f"User Data dispatched via Cloud Assistant (InvokeId: {data['InvokeId']})",
+        file=sys.stderr,
+    )
+    return True, True
+
+
+def acquire(region_id: str, arch: str) -> None:
+    """启动一台池内实例，成功时输出 INSTANCE_ID、INSTANCE_TYPE 和 CPU_CORES"""
+    instance_name = get_env_var("INSTANCE_NAME")
+    user_data_file = get_env_var("USER_DATA_FILE")
+    # 先检查 User Data 能否通过云助手下发，否则启动池内实例只会白白消耗预热池
+    content = load_user_data(user_data_file)
+    if content is None:
+        print("Skipping warm pool, falling back to a cold launch", file=sys.stderr)
+        return
+    image_name = os.environ.get("IMAGE_NAME")
+    current_image_id = (
+        get_image_id_by_name(region_id, image_name) if image_name else None
+    )
+
+    candidates = [
+        i
+        for i in list_pool_instances(region_id, arch)
+        if i.get("Status") == "Stopped"
+        and (not current_image_id or i.get("ImageId") == current_image_id)
+    ]
+    # 最新创建的实例优先（镜像和软件最新）
+    candidates.sort(key=lambda x: x.get("CreationTime", ""), reverse=True)
+    print(f"Warm pool has {len(candidates)} stopped {arch} instances", file=sys.stderr)
+
+    for instance in candidates:
+        instance_id = instance["InstanceId"]
+        # StartInstance 对非 Stopped 状态的实例会失败，可作为并发构建之间的互斥
+        if run_aliyun(["StartInstance", "--InstanceId", instance_id]) is None:
+            print(f"Failed to start {instance_id}, trying next", file=sys.stderr)
+            continue
+
+        # 立即移出池，避免被补充/回收逻辑计数
+        # 记录使用该实例的运行，供孤儿实例清理交叉核对
+        tag_instance(
+            region_id,
+            instance_id,
+            {
+                POOL_TAG_KEY: "in-use",
+                "GithubRunId": os.environ.get("GITHUB_RUN_ID", ""),
+            },
+        )
+        run_aliyun(
+            [
+                "ModifyInstanceAttribute",
+                "--InstanceId",
+                instance_id,
+                "--InstanceName",
+                instance_name,
+            ]
+        )
+
+        if not wait_for_status(region_id, instance_id, "Running", timeout=180):
+            print(
+                f"Instance {instance_id} did not reach Running (spot capacity may be "
+                "unavailable), releasing",
+                file=sys.stderr,
+            )
+            delete_instance(instance_id)
+            continue
+
+        dispatched, retryable = run_user_data(region_id, instance_id, content)
+        if not dispatched:
+            print(
+                f"Failed to dispatch User Data to {instance_id}, releasing",
+                file=sys.stderr,
+            )
+            delete_instance(instance_id)
+            if not retryable:
+                print(
+                    "RunCommand rejected the User Data, not trying other pool instances",
+                    file=sys.stderr,
+                )
+                return
+            continue
+
+        print(f"Acquired warm instance {instance_id}", file=sys.stderr)
+        print(f"INSTANCE_ID={instance_id}")
+        # 池内实例的规格与本次选型可能不同，输出实际规格和 CPU 核数
+        print(f"INSTANCE_TYPE={instance.get('InstanceType', '')}")
+        print(f"CPU_CORES={instance.get('Cpu', '')}")
+        return
+
+    print("No warm instance available", file=sys.stderr)
+
+
+def recycle(region_id: str, arch: str) -> None:
+    """回收过期或镜像已过时的池内实例"""
+    max_age_hours = float(os.environ.get("WARM_POOL_MAX_AGE_HOURS", "24"))
+    image_name = os.environ.get("IMAGE_NAME")
+    current_image_id = (
+        get_image_id_by_name(region_id, image_name) if image_name else None
+    )
+    if image_name and not current_image_id:
+        print(
+            f"Warning: Image {image_name} not found, skipping image check",
+            file=sys.stderr,
+        )
+
+    recycled = 0
+    for instance in list_pool_instances(region_id, arch):
+        if instance.get("Status") not in ("Stopped", "Running"):
+            continue
+        reason = is_expired(instance, max_age_hours, current_image_id)
+        if reason:
+            instance_id = instance["InstanceId"]
+            print(f"Recycling {instance_id}: {reason}", file=sys.stderr)
+            if delete_instance(instance_id):
+                recycled += 1
+
+    print(f"RECYCLED={recycled}")
+
+
+def launch_pool_instance(region_id: str, arch: str, image_id: str) -> Optional[str]:
+    """通过 create-spot-instance.py 创建池内实例（不带 User Data）"""
+    env = os.environ.copy()
+    env["INSTANCE_NAME"] = f"warm-pool-{arch}-{int(time.time())}"
+    env["ALIYUN_IMAGE_ID"] = image_id
+    env.pop("ALIYUN_IMAGE_FAMILY", None)
+    env.pop("USER_DATA", None)
+    env.pop("USER_DATA_FILE", None)
+
+    script = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "create-spot-instance.py"
+    )
+    result = subprocess.run(
+        [sys.executable, script], capture_output=True, text=True, check=False, env=env
+    )
+    sys.stderr.write(result.stderr)
+    if result.returncode != 0:
+        return None
+
+    lines = result.stdout.strip().splitlines()
+    return lines[-1] if lines else None
+
+
+def replenish(region_id: str, arch: str) -> None:
+    """回收过期实例后补足池容量"""
+    pool_size = int(os.environ.get("WARM_POOL_SIZE", "0") or 0)
+    image_name = get_env_var("IMAGE_NAME")
+
+    recycle(region_id, arch)
+
+    if pool_size <= 0:
+        print("WARM_POOL_SIZE is 0, nothing to replenish", file=sys.stderr)
+        return
+
+    image_id = get_image_id_by_name(region_id, image_name)
+    if not image_id:
+        error_exit(f"Image {image_name} not found, cannot replenish warm pool")
+
+    pooled = [
+        i
+        for i in list_pool_instances(region_id, arch)
+        if i.get("Status") in ("Pending", "Starting", "Running", "Stopping", "Stopped")
+    ]
+    missing = pool_size - len(pooled)
+    print(
+        f"Warm pool {arch}: {len(pooled)}/{pool_size} instances, "
+        f"launching {max(missing, 0)}",
+        file=sys.stderr,
+    )
+
+    launched = 0
+    for _ in range(max(missing, 0)):
+        instance_id = launch_pool_instance(region_id, arch, image_id)
+        if not instance_id:
+            print("Warning: Failed to launch warm pool instance", file=sys.stderr)
+            break
+
+        tag_instance(region_id, instance_id, {POOL_TAG_KEY: arch})
+        if not wait_for_status(region_id, instance_id, "Running"):
+            print(f"Instance {instance_id} did not start, releasing", file=sys.stderr)
+            delete_instance(instance_id)
+            continue
+
+        # 节省停机模式：停机后不收取计算资源费用
+        stopped = run_aliyun(
+            [
+                "StopInstance",
+                "--InstanceId",
+                instance_id,
+                "--StoppedMode",
+                "StopCharging",
+            ]
+        )
+        if stopped is None or not wait_for_status(region_id, instance_id, "Stopped"):
+            print(f"Failed to stop {instance_id}, releasing", file=sys.stderr)
+            delete_instance(instance_id)
+            continue
+
+        print(f"Added {instance_id} to warm pool", file=sys.stderr)
+        launched += 1
+
+    print(f"LAUNCHED={launched}")
+
+
+def main():
+    """主函数"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("acquire", "replenish", "recycle"):
+        error_exit("Usage: warm-pool.py acquire|replenish|recycle")
+
+    command = sys.argv[1]
+    region_id = get_env_var("ALIYUN_REGION_ID")
+    arch = os.environ.get("ARCH", "amd64")
+
+    if command == "acquire":
+        acquire(region_id, arch)
+    elif command == "replenish":
+        replenish(region_id, arch)
+    else:
+        recycle(region_id, arch)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,13 @@ exec 2>&1
 echo "=== User Data Script Started ==="
 echo "Timestamp: $(date -u +%Y-%m-%dT%H:%M:%SZ)"
 
+# 启动阶段计时：记录各阶段结束的时间点，Runner 就绪后汇总为 /var/log/boot-report.json
+BOOT_PHASES_FILE="/var/log/boot-phases.tsv"
+mark_phase() {
+  printf '%s\t%s\n' "$1" "$(date +%s.%N)" >> "${BOOT_PHASES_FILE}"
+}
+mark_phase user_data_start
+
 # 变量定义（通过环境变量或参数传递）
 RUNNER_REGISTRATION_TOKEN="${RUNNER_REGISTRATION_TOKEN:-}"
 GITHUB_REPOSITORY="${GITHUB_REPOSITORY:-}"
@@ -21,6 +28,15 @@ RUNNER_NAME="${RUNNER_NAME:-}"
 RUNNER_LABELS="${RUNNER_LABELS:-}"
 RUNNER_VERSION="${RUNNER_VERSION:-2.311.0}"  # 可配置的 Runner 版本，默认使用稳定版本
 
+# 同一实例承载的 Ephemeral Runner 数量（由调度器决定，默认 1）
+# 多于 1 个时 Runner 名称为 ${RUNNER_NAME}-<序号>，全部空闲超过 RUNNER_IDLE_TIMEOUT 秒后实例自毁
+RUNNER_COUNT="${RUNNER_COUNT:-1}"
+RUNNER_IDLE_TIMEOUT="${RUNNER_IDLE_TIMEOUT:-600}"
+
+# JIT Runner 配置（可选，由 setup job 通过 generate-jitconfig API 生成，多个时以逗号分隔）
+# 设置后跳过 config.sh 注册，Runner 直接以 run.sh --jitconfig 启动
+RUNNER_JIT_CONFIG="${RUNNER_JIT_CONFIG:-}"
+
 # 代理配置（可选）
 HTTP_PROXY="${HTTP_PROXY:-}"
 HTTPS_PROXY="${HTTPS_PROXY:-}"
@@ -30,6 +46,11 @@ NO_PROXY="${NO_PROXY:-localhost,127.0.0.1,::1,100.100.100.200,192.168.0.0/16,10.
 # 使用实例角色（ECS Self-Destruct Role Name）获取权限进行实例自毁
 ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME="${ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME:-}"
 
+# 构建缓存数据盘（可选）
+# 由 workflow 在实例创建后挂载，保存 /var/lib/docker 和 BuildKit 状态
+CACHE_DISK_ENABLED="${CACHE_DISK_ENABLED:-}"
+CACHE_KEEP_STORAGE="${CACHE_KEEP_STORAGE:-40GB}"
+
 # 验证必需参数
 if [[ -z "${RUNNER_REGISTRATION_TOKEN}" ]]; then
   echo "Error: RUNNER_REGISTRATION_TOKEN is required" >&2
@@ -48,6 +69,7 @@ fi
 
 echo "Repository: ${GITHUB_REPOSITORY}"
 echo "Runner Name: ${RUNNER_NAME}"
+echo "Runner Count: ${RUNNER_COUNT}"
 echo "Runner Labels: ${RUNNER_LABELS:-default}"
 
 # 配置代理（必须在 Runner 注册之前完成）
@@ -86,25 +108,7 @@ else
   echo "Proxy configuration not provided, using direct connection"
 fi
 
-# 更新系统
-echo "=== Updating system ==="
-if command -v yum &> /dev/null; then
-  # Alibaba Cloud Linux / CentOS / RHEL
-  yum update -y
-  yum install -y curl wget git
-elif command -v apt-get &> /dev/null; then
-  # Ubuntu / Debian
-  apt-get update -y
-  apt-get install -y curl wget git
-else
-  echo "Error: Unsupported package manager" >&2
-  exit 1
-fi
-
-# 安装 GitHub Actions Runner
-echo "=== Installing GitHub Actions Runner ==="
 RUNNER_DIR="/opt/actions-runner"
-mkdir -p "${RUNNER_DIR}"
 
 # 检测架构
 ARCH=$(uname -m)
@@ -117,63 +121,286 @@ else
   exit 1
 fi
 
-# 下载 Runner
-echo "Using Runner version: ${RUNNER_VERSION}"
-RUNNER_URL="https://github.com/actions/runner/releases/download/v${RUNNER_VERSION}/actions-runner-linux-${RUNNER_ARCH}-${RUNNER_VERSION}.tar.gz"
+# 自定义镜像快速路径
+# 自定义镜像（build-custom-image.py）已预装 Runner 及其依赖、Docker 和 Aliyun CLI，
+# Runner 版本一致时跳过系统更新、Runner 下载和依赖安装，直接进入 Runner 配置
+IMAGE_VERSION_FILE="/opt/image-version.json"
+PREINSTALLED_RUNNER=false
+if [[ -f "${IMAGE_VERSION_FILE}" && -x "${RUNNER_DIR}/config.sh" && -x "${RUNNER_DIR}/run.sh" ]]; then
+  IMAGE_RUNNER_VERSION=$(grep -o '"runner_version": *"[^"]*"' "${IMAGE_VERSION_FILE}" | cut -d'"' -f4 || true)
+  # 早期镜像的版本文件中变量未展开，回退到 Runner 自身报告的版本
+  if [[ ! "${IMAGE_RUNNER_VERSION}" =~ ^[0-9.]+$ ]]; then
+    IMAGE_RUNNER_VERSION=$("${RUNNER_DIR}/bin/Runner.Listener" --version 2>/dev/null || true)
+  fi
+  if [[ "${IMAGE_RUNNER_VERSION}" == "${RUNNER_VERSION}" ]]; then
+    PREINSTALLED_RUNNER=true
+    echo "=== Using preinstalled runner ${IMAGE_RUNNER_VERSION} from custom image ==="
+  else
+    echo "Preinstalled runner version (${IMAGE_RUNNER_VERSION:-unknown}) does not match ${RUNNER_VERSION}, reinstalling"
+  fi
+fi
 
-cd "${RUNNER_DIR}"
-echo "Downloading runner from: ${RUNNER_URL}"
-# 增加重试与超时，提升在代理/弱网环境的鲁棒性
-curl -o runner.tar.gz -L \
-  --retry 5 --retry-all-errors \
-  --connect-timeout 10 --max-time 300 \
-  "${RUNNER_URL}"
-tar xzf runner.tar.gz
-rm runner.tar.gz
-
-echo "=== Installing runner dependencies ==="
-# 安装 GitHub Actions Runner 依赖（.NET 运行时依赖等）
-# 注意：脚本会自动根据系统选择 apt/yum 安装 libicu 等依赖
-./bin/installdependencies.sh
+if [[ "${PREINSTALLED_RUNNER}" != "true" ]]; then
+  # 更新系统
+  echo "=== Updating system ==="
+  if command -v yum &> /dev/null; then
+    # Alibaba Cloud Linux / CentOS / RHEL
+    yum update -y
+    yum install -y curl wget git
+  elif command -v apt-get &> /dev/null; then
+    # Ubuntu / Debian
+    apt-get update -y
+    apt-get install -y curl wget git
+  else
+    echo "Error: Unsupported package manager" >&2
+    exit 1
+  fi
+  mark_phase system_update
+
+  # 安装 GitHub Actions Runner
+  echo "=== Installing GitHub Actions Runner ==="
+  mkdir -p "${RUNNER_DIR}"
+
+  # 下载 Runner
+  echo "Using Runner version: ${RUNNER_VERSION}"
+  RUNNER_URL="https://github.com/actions/runner/releases/download/v${RUNNER_VERSION}/actions-runner-linux-${RUNNER_ARCH}-${RUNNER_VERSION}.tar.gz"
+
+  cd "${RUNNER_DIR}"
+  echo "Downloading runner from: ${RUNNER_URL}"
+  # 增加重试与超时，提升在代理/弱网环境的鲁棒性
+  curl -o runner.tar.gz -L \
+    --retry 5 --retry-all-errors \
+    --connect-timeout 10 --max-time 300 \
+    "${RUNNER_URL}"
+  tar xzf runner.tar.gz
+  rm runner.tar.gz
+  mark_phase runner_download
+
+  echo "=== Installing runner dependencies ==="
+  # 安装 GitHub Actions Runner 依赖（.NET 运行时依赖等）
+  # 注意：脚本会自动根据系统选择 apt/yum 安装 libicu 等依赖
+  ./bin/installdependencies.sh
+  mark_phase runner_dependencies
+elif ! grep -q '"runner_dependencies": *"installed"' "${IMAGE_VERSION_FILE}"; then
+  # 早期镜像未预装 Runner 依赖
+  echo "=== Installing runner dependencies ==="
+  "${RUNNER_DIR}/bin/installdependencies.sh"
+  mark_phase runner_dependencies
+fi
+
+# 挂载构建缓存数据盘（必须在 Runner 注册之前完成，避免 Job 使用本地盘）
+if [[ "${CACHE_DISK_ENABLED}" == "true" ]]; then
+  echo "=== Mounting build cache disk ==="
+  ROOT_DISK="/dev/$(lsblk -no PKNAME "$(findmnt -no SOURCE /)" | head -1)"
+  CACHE_DEVICE=""
+  # 数据盘在实例创建后才挂载，最多等待 180 秒；挂载失败时编排脚本通过云助手写入
+  # /run/no-cache-disk，此时立即放弃等待
+  for _ in $(seq 1 36); do
+    CACHE_DEVICE=$(lsblk -dpno NAME,TYPE | awk -v root="${ROOT_DISK}" '$2 == "disk" && $1 != root {print $1; exit}')
+    if [[ -n "${CACHE_DEVICE}" || -f /run/no-cache-disk ]]; then
+      break
+    fi
+    sleep 5
+  done
+
+  if [[ -z "${CACHE_DEVICE}" ]]; then
+    echo "Warning: Build cache disk not attached, using local disk"
+  else
+    echo "Build cache device: ${CACHE_DEVICE}"
+    systemctl stop docker.socket docker 2>/dev/null || true
+    mkdir -p /var/lib/docker
+    if ! blkid "${CACHE_DEVICE}" &> /dev/null; then
+      # 新的空盘：格式化并复制镜像中已有的 Docker 数据（如 buildx builder）
+      echo "Formatting new build cache disk"
+      mkfs.ext4 -q -L buildcache "${CACHE_DEVICE}"
+      if [[ -n "$(ls -A /var/lib/docker 2>/dev/null)" ]]; then
+        mount "${CACHE_DEVICE}" /mnt
+        cp -a /var/lib/docker/. /mnt/
+        umount /mnt
+      fi
+    fi
+    mount -o noatime "${CACHE_DEVICE}" /var/lib/docker
+    systemctl start docker 2>/dev/null || true
+
+    # 按容量回收构建缓存，限制数据盘增长
+    if command -v docker &> /dev/null; then
+      docker buildx prune --builder builder --force --keep-storage "${CACHE_KEEP_STORAGE}" || true
+      docker builder prune --force --keep-storage "${CACHE_KEEP_STORAGE}" || true
+      df -h /var/lib/docker || true
+    fi
+  fi
+  mark_phase cache_disk_mount
+fi
 
 # 配置 Runner（Ephemeral 模式）
-echo "=== Configuring Runner ==="
-# 允许以 root 身份运行 runner 配置
-export RUNNER_ALLOW_RUNASROOT=1
-./config.sh \
-  --url "https://github.com/${GITHUB_REPOSITORY}" \
-  --token "${RUNNER_REGISTRATION_TOKEN}" \
-  --name "${RUNNER_NAME}" \
-  --labels "${RUNNER_LABELS:-self-hosted,Linux,${RUNNER_ARCH}}" \
-  --ephemeral \
-  --unattended \
-  --replace
-
-# 安装 Runner 服务（使用 root 用户）
-echo "=== Installing Runner service ==="
-echo "Writing runner environment file: ${RUNNER_DIR}/.env"
-{
-  echo "HTTP_PROXY=${HTTP_PROXY}"
-  echo "HTTPS_PROXY=${HTTPS_PROXY}"
-  echo "NO_PROXY=${NO_PROXY}"
-  # Lowercase variants for tools that rely on them under systemd service
-  echo "http_proxy=${HTTP_PROXY}"
-  echo "https_proxy=${HTTPS_PROXY}"
-  echo "no_proxy=${NO_PROXY}"
-  # 配置 post-job hook（必须在服务启动前配置）
-  echo "export ACTIONS_RUNNER_HOOK_POST_JOB=\"${RUNNER_DIR}/post-job-hook.sh\""
-} > "${RUNNER_DIR}/.env"
-chmod 600 "${RUNNER_DIR}/.env" || true
-./svc.sh install root
-
-# 启动 Runner 服务
-echo "=== Starting Runner service ==="
-./svc.sh start
+# 参数：Runner 目录、Runner 名称、JIT 配置（可选）
+# 有 JIT 配置时 Runner 已由 setup job 注册，直接以 run.sh --jitconfig 启动，
+# 省去 config.sh 注册和 svc.sh 安装的网络往返
+configure_runner() {
+  local runner_dir="$1"
+  local runner_name="$2"
+  local jit_config="${3:-}"
+
+  echo "=== Configuring Runner: ${runner_name} ==="
+  cd "${runner_dir}"
+  # 允许以 root 身份运行 runner 配置
+  export RUNNER_ALLOW_RUNASROOT=1
+
+  echo "Writing runner environment file: ${runner_dir}/.env"
+  {
+    echo "HTTP_PROXY=${HTTP_PROXY}"
+    echo "HTTPS_PROXY=${HTTPS_PROXY}"
+    echo "NO_PROXY=${NO_PROXY}"
+    # Lowercase variants for tools that rely on them under systemd service
+    echo "http_proxy=${HTTP_PROXY}"
+    echo "https_proxy=${HTTPS_PROXY}"
+    echo "no_proxy=${NO_PROXY}"
+    # 配置 Job 完成 hook（必须在服务启动前配置），所有 Runner 共用同一个 hook
+    echo "ACTIONS_RUNNER_HOOK_JOB_COMPLETED=${RUNNER_DIR}/post-job-hook.sh"
+  } > "${runner_dir}/.env"
+  chmod 600 "${runner_dir}/.env" || true
+
+  if [[ -n "${jit_config}" ]]; then
+    echo "=== Starting JIT Runner service ==="
+    # JIT 配置包含 Runner 凭据，写入仅 root 可读的环境文件
+    (umask 077 && echo "RUNNER_JIT_CONFIG=${jit_config}" > "${runner_dir}/.jitconfig")
+    # 服务名沿用 svc.sh 的 actions.runner.* 格式，自毁和空闲监听按此匹配
+    local service_name="actions.runner.${GITHUB_REPOSITORY//\//-}.${runner_name}.service"
+    cat > "/etc/systemd/system/${service_name}" << JIT_SERVICE_EOF
+[Unit]
+Description=GitHub Actions Runner (${runner_name})
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+WorkingDirectory=${runner_dir}
+Environment=RUNNER_ALLOW_RUNASROOT=1
+EnvironmentFile=${runner_dir}/.jitconfig
+ExecStart=${runner_dir}/run.sh --jitconfig \${RUNNER_JIT_CONFIG}
+KillMode=process
+KillSignal=SIGTERM
+TimeoutStopSec=5min
+
+[Install]
+WantedBy=multi-user.target
+JIT_SERVICE_EOF
+    systemctl daemon-reload
+    systemctl start "${service_name}"
+    return
+  fi
+
+  ./config.sh \
+    --url "https://github.com/${GITHUB_REPOSITORY}" \
+    --token "${RUNNER_REGISTRATION_TOKEN}" \
+    --name "${runner_name}" \
+    --labels "${RUNNER_LABELS:-self-hosted,Linux,${RUNNER_ARCH}}" \
+    --ephemeral \
+    --unattended \
+    --replace
+
+  # 安装 Runner 服务（使用 root 用户）
+  echo "=== Installing Runner service ==="
+  ./svc.sh install root
+
+  # 启动 Runner 服务
+  echo "=== Starting Runner service ==="
+  ./svc.sh start
+}
 
 # 设置实例自毁机制
 echo "=== Setting up instance self-destruct mechanism ==="
 SELF_DESTRUCT_SCRIPT="/usr/local/bin/self-destruct.sh"
 
+# 释放脚本：直接使用元数据服务的 STS 临时凭据签名调用 DeleteInstance，
+# 不依赖 aliyun CLI 的安装与 configure，调用耗时在 1 秒以内
+cat > /usr/local/bin/release-instance.py << 'RELEASE_EOF'
+#!/usr/bin/env python3
+"""使用实例 RAM 角色的 STS 凭据签名调用 DeleteInstance 释放当前实例"""
+
+import base64
+import hashlib
+import hmac
+import json
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+METADATA_URL = "http://100.100.100.200/latest/meta-data"
+
+
+def metadata(path):
+    with urllib.request.urlopen(f"{METADATA_URL}/{path}", timeout=5) as response:
+        return response.read().decode("utf-8").strip()
+
+
+def percent_encode(value):
+    return urllib.parse.quote(str(value), safe="~")
+
+
+def call_ecs(endpoint, params, secret):
+    """RPC 风格签名（HMAC-SHA1）"""
+    canonical = "&".join(
+        f"{percent_encode(k)}={percent_encode(v)}" for k, v in sorted(params.items())
+    )
+    string_to_sign = "GET&%2F&" + percent_encode(canonical)
+    digest = hmac.new(
+        f"{secret}&".encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1
+    ).digest()
+    signature = percent_encode(base64.b64encode(digest).decode("utf-8"))
+    url = f"https://{endpoint}/?{canonical}&Signature={signature}"
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def main():
+    instance_id = metadata("instance-id")
+    region_id = metadata("region-id")
+    role_name = metadata("ram/security-credentials/")
+    credentials = json.loads(metadata(f"ram/security-credentials/{role_name}"))
+
+    # 优先使用 VPC 内网 Endpoint
+    endpoints = [f"ecs-vpc.{region_id}.aliyuncs.com", f"ecs.{region_id}.aliyuncs.com"]
+    for attempt in range(3):
+        for endpoint in endpoints:
+            params = {
+                "Action": "DeleteInstance",
+                "InstanceId": instance_id,
+                "Force": "true",
+                "RegionId": region_id,
+                "Format": "JSON",
+                "Version": "2014-05-26",
+                "AccessKeyId": credentials["AccessKeyId"],
+                "SecurityToken": credentials["SecurityToken"],
+                "SignatureMethod": "HMAC-SHA1",
+                "SignatureVersion": "1.0",
+                "SignatureNonce": uuid.uuid4().hex,
+                "Timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            try:
+                data = call_ecs(endpoint, params, credentials["AccessKeySecret"])
+                print(f"DeleteInstance accepted via {endpoint}: {data.get('RequestId')}")
+                return 0
+            except urllib.error.HTTPError as e:
+                body = e.read().decode("utf-8", "replace")
+                if "NotFound" in body:
+                    print(f"Instance {instance_id} already released")
+                    return 0
+                print(f"DeleteInstance via {endpoint} failed: {body[:300]}", file=sys.stderr)
+            except (urllib.error.URLError, OSError) as e:
+                print(f"DeleteInstance via {endpoint} failed: {e}", file=sys.stderr)
+        time.sleep(attempt + 1)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+RELEASE_EOF
+chmod +x /usr/local/bin/release-instance.py
+
 # 创建自毁脚本
 cat > "${SELF_DESTRUCT_SCRIPT}" << 'SELF_DESTRUCT_EOF'
 #!/bin/bash
@@ -189,11 +416,42 @@ LOG_FILE="/var/log/self-destruct.log"
 
 # 记录日志函数
 log() {
-    echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] $*" | tee -a "${LOG_FILE}"
+    echo "[$(date -u +%Y-%m-%dT%H:%M:%S.%3NZ)] $*" | tee -a "${LOG_FILE}"
 }
 
+# Job 完成 hook、备用服务和空闲监听可能同时触发，只执行一次
+exec 9> /run/self-destruct.lock
+if ! flock -n 9; then
+    exit 0
+fi
+
 log "=== Instance Self-Destruct Script Started ==="
 
+# 等待 Runner 上报 Job 结果并退出（由 Job 完成 hook 触发时 Runner 仍在运行）
+for _ in $(seq 1 300); do
+    pgrep -f Runner.Listener > /dev/null || break
+    sleep 0.2
+done
+if [[ -f /run/job-completed-at ]]; then
+    log "Runner exited $(( $(date +%s) - $(cat /run/job-completed-at) ))s after the job completed hook"
+fi
+
+# 卸载构建缓存数据盘，确保文件系统干净（数据盘不随实例释放，释放后保留）
+if mountpoint -q /var/lib/docker; then
+    log "Unmounting build cache disk"
+    systemctl stop docker.socket docker 2>/dev/null || true
+    sync
+    umount /var/lib/docker || log "Warning: Failed to unmount build cache disk"
+fi
+
+# 直接签名调用 DeleteInstance
+log "Releasing instance via metadata STS credentials"
+if python3 /usr/local/bin/release-instance.py >> "${LOG_FILE}" 2>&1; then
+    log "=== Instance Self-Destruct Script Completed ==="
+    exit 0
+fi
+log "Warning: Signed DeleteInstance failed, falling back to Aliyun CLI"
+
 # 获取实例 ID（通过阿里云元数据服务）
 METADATA_URL="http://100.100.100.200/latest/meta-data"
 INSTANCE_ID=$(curl -s --connect-timeout 5 --max-time 10 "${METADATA_URL}/instance-id" || echo "")
@@ -218,7 +476,6 @@ if ! command -v aliyun &> /dev/null; then
     exit 1
 fi
 
-# 配置 Aliyun CLI 使用实例角色认证
 # 获取实例角色名称（从元数据服务）
 RAM_ROLE_NAME=$(curl -s --connect-timeout 5 --max-time 10 "${METADATA_URL}/ram/security-credentials/" || echo "")
 
@@ -229,32 +486,17 @@ if [[ -z "${RAM_ROLE_NAME}" ]]; then
 fi
 
 log "RAM Role Name: ${RAM_ROLE_NAME}"
-log "Configuring Aliyun CLI to use instance role authentication"
-
-# 配置 aliyun cli 使用实例角色认证
-# 使用非交互式方式配置
-aliyun configure set \
-    --mode EcsRamRole \
-    --ram-role-name "${RAM_ROLE_NAME}" \
-    --region "${REGION_ID}" 2>&1 | tee -a "${LOG_FILE}" || {
-    log "Error: Failed to configure Aliyun CLI"
-    exit 1
-}
-
-log "Aliyun CLI configured successfully"
 
-# 等待一段时间，确保 Runner 完全退出
-log "Waiting 10 seconds before self-destruct..."
-sleep 10
-
-# 删除实例
+# 删除实例（命令行参数指定实例角色认证，无需 configure）
 log "Deleting instance: ${INSTANCE_ID}"
+EXIT_CODE=0
 RESPONSE=$(aliyun ecs DeleteInstance \
+    --mode EcsRamRole \
+    --ram-role-name "${RAM_ROLE_NAME}" \
+    --region "${REGION_ID}" \
     --RegionId "${REGION_ID}" \
     --InstanceId "${INSTANCE_ID}" \
-    --Force true 2>&1)
-
-EXIT_CODE=$?
+    --Force true 2>&1) || EXIT_CODE=$?
 
 if [[ ${EXIT_CODE} -ne 0 ]]; then
     log "Error: Failed to delete instance (exit code: ${EXIT_CODE})"
@@ -279,17 +521,86 @@ fi
 # 创建 systemd service，在 Runner 服务停止后执行自毁脚本
 echo "=== Creating self-destruct systemd service ==="
 # 使用 Runner 的 post-job hook 更可靠
-# 创建 post-job hook 脚本（必须在 Runner 服务启动前创建）
-cat > "${RUNNER_DIR}/post-job-hook.sh" << 'HOOK_EOF'
+# post-job hook 与释放服务必须在 Runner 服务启动前创建：自定义镜像快速路径下
+# Runner 几秒内即可接到 Job，短 Job 结束时 hook 必须已经存在
+if [[ "${RUNNER_COUNT}" -le 1 ]]; then
+  cat > "${RUNNER_DIR}/post-job-hook.sh" << 'HOOK_EOF'
 #!/bin/bash
-# Runner post-job hook
-# 在 Job 完成后执行实例自毁
-/usr/local/bin/self-destruct.sh
+# Runner Job 完成 hook
+# hook 是 Job 的最后一步，Runner 在其结束后才上报结果，因此交给 systemd
+# 在 Job 进程树之外执行自毁（等待 Runner 退出后立即释放实例）
+date +%s > /run/job-completed-at
+systemctl start --no-block instance-release.service
+echo "Instance release scheduled"
+HOOK_EOF
+else
+  # 多 Runner 实例：单个 Job 完成时其它 Runner 可能仍在构建或等待 Job，
+  # 由空闲监听在全部 Runner 空闲后自毁
+  cat > "${RUNNER_DIR}/post-job-hook.sh" << 'HOOK_EOF'
+#!/bin/bash
+# Runner Job 完成 hook（多 Runner 实例，自毁由 runner-idle-watchdog 负责）
+exit 0
 HOOK_EOF
 
+  cat > /usr/local/bin/runner-idle-watchdog.sh << 'WATCHDOG_EOF'
+#!/bin/bash
+
+# 多 Runner 实例空闲监听
+# 所有 Runner 服务退出（Ephemeral Runner 完成 Job 后退出），
+# 或没有 Job 在执行（无 Runner.Worker 进程）超过空闲时间时执行实例自毁
+
+IDLE_TIMEOUT="${1:-600}"
+IDLE=0
+
+while true; do
+  sleep 15
+  if ! systemctl list-units --type=service --state=active --no-legend 'actions.runner.*' | grep -q .; then
+    echo "All runners exited"
+    break
+  fi
+  if pgrep -f Runner.Worker > /dev/null; then
+    IDLE=0
+    continue
+  fi
+  IDLE=$((IDLE + 15))
+  if [[ ${IDLE} -ge ${IDLE_TIMEOUT} ]]; then
+    echo "Runners idle for ${IDLE}s, stopping remaining runners"
+    systemctl stop 'actions.runner.*' || true
+    break
+  fi
+done
+
+/usr/local/bin/self-destruct.sh
+WATCHDOG_EOF
+  chmod +x /usr/local/bin/runner-idle-watchdog.sh
+
+  cat > /etc/systemd/system/runner-idle-watchdog.service << SERVICE_EOF
+[Unit]
+Description=Runner Idle Watchdog
+After=network-online.target
+
+[Service]
+Type=simple
+ExecStart=/usr/local/bin/runner-idle-watchdog.sh ${RUNNER_IDLE_TIMEOUT}
+
+[Install]
+WantedBy=multi-user.target
+SERVICE_EOF
+fi
+
 chmod +x "${RUNNER_DIR}/post-job-hook.sh"
 
-# 注意：post-job hook 的环境变量已经在 .env 文件中配置（在 Runner 服务启动前）
+# Job 完成 hook 触发的释放服务
+cat > /etc/systemd/system/instance-release.service << 'SERVICE_EOF'
+[Unit]
+Description=Instance Release On Job Completion
+
+[Service]
+Type=oneshot
+ExecStart=/usr/local/bin/self-destruct.sh
+StandardOutput=journal
+StandardError=journal
+SERVICE_EOF
 
 # 同时创建 systemd service 作为备用机制
 cat > /etc/systemd/system/self-destruct.service << 'SERVICE_EOF'
@@ -310,13 +621,246 @@ EnvironmentFile=/etc/environment
 WantedBy=multi-user.target
 SERVICE_EOF
 
-# 启用并启动服务（作为备用机制）
 systemctl daemon-reload
+
+# JIT 配置按 Runner 顺序以逗号分隔，数量不匹配时回退到注册令牌
+JIT_CONFIGS=()
+if [[ -n "${RUNNER_JIT_CONFIG}" ]]; then
+  IFS=',' read -ra JIT_CONFIGS <<< "${RUNNER_JIT_CONFIG}"
+  if [[ ${#JIT_CONFIGS[@]} -ne $(( RUNNER_COUNT > 1 ? RUNNER_COUNT : 1 )) ]]; then
+    echo "Warning: Got ${#JIT_CONFIGS[@]} JIT configs for ${RUNNER_COUNT} runners, using registration token"
+    JIT_CONFIGS=()
+  fi
+fi
+
+if [[ "${RUNNER_COUNT}" -le 1 ]]; then
+  configure_runner "${RUNNER_DIR}" "${RUNNER_NAME}" "${JIT_CONFIGS[0]:-}"
+else
+  # 每个 Runner 使用独立的目录（配置、工作目录和服务互不干扰）
+  for i in $(seq 1 "${RUNNER_COUNT}"); do
+    mkdir -p "${RUNNER_DIR}-${i}"
+    cp -a "${RUNNER_DIR}/." "${RUNNER_DIR}-${i}/"
+    configure_runner "${RUNNER_DIR}-${i}" "${RUNNER_NAME}-${i}" "${JIT_CONFIGS[$((i - 1))]:-}"
+  done
+fi
+cd "${RUNNER_DIR}"
+mark_phase runner_registration
+
+# 后台等待 Runner 开始监听 Job，不阻塞后续初始化：
+# 1. 通知 workflow Runner 已就绪：实例通过 RAM 角色为自身打上 RunnerReady=<Runner 名称>
+#    标签，workflow 查询实例标签即可，无需轮询 Runner 列表（失败时 workflow 回退到查询 GitHub）
+# 2. 汇总启动阶段计时和 systemd-analyze 结果，写入 /var/log/boot-report.json，
+#    由 build job 上传为 artifact
+# 多 Runner 实例需要全部 Runner 都在监听才算就绪，超时则不打就绪标签
+(
+  if [[ "${RUNNER_COUNT}" -le 1 ]]; then
+    LISTEN_DIRS=("${RUNNER_DIR}")
+  else
+    LISTEN_DIRS=()
+    for i in $(seq 1 "${RUNNER_COUNT}"); do
+      LISTEN_DIRS+=("${RUNNER_DIR}-${i}")
+    done
+  fi
+
+  RUNNERS_LISTENING=false
+  for _ in $(seq 1 120); do
+    LISTENING=0
+    for dir in "${LISTEN_DIRS[@]}"; do
+      if grep -qs "Listening for Jobs" "${dir}"/_diag/Runner_*.log; then
+        LISTENING=$((LISTENING + 1))
+      fi
+    done
+    if [[ ${LISTENING} -eq ${#LISTEN_DIRS[@]} ]]; then
+      RUNNERS_LISTENING=true
+      break
+    fi
+    sleep 1
+  done
+
+  if [[ "${RUNNERS_LISTENING}" == "true" ]]; then
+    mark_phase runner_listening
+  else
+    echo "Warning: Runners not listening for jobs after 120s, skipping readiness tag"
+  fi
+
+  if [[ "${RUNNERS_LISTENING}" == "true" ]] && command -v aliyun &> /dev/null && [[ -n "${ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME}" ]]; then
+    READY_INSTANCE_ID=$(curl -s --connect-timeout 5 --max-time 10 http://100.100.100.200/latest/meta-data/instance-id)
+    READY_REGION_ID=$(curl -s --connect-timeout 5 --max-time 10 http://100.100.100.200/latest/meta-data/region-id)
+    aliyun ecs TagResources \
+      --mode EcsRamRole \
+      --ram-role-name "${ALIYUN_ECS_SELF_DESTRUCT_ROLE_NAME}" \
+      --region "${READY_REGION_ID}" \
+      --RegionId "${READY_REGION_ID}" \
+      --ResourceType instance \
+      --ResourceId.1 "${READY_INSTANCE_ID}" \
+      --Tag.1.Key RunnerReady \
+      --Tag.1.Value "${RUNNER_NAME}" > /dev/null \
+      && echo "Runner readiness signalled via instance tag" \
+      || echo "Warning: Failed to tag instance as ready"
+  fi
+
+  # User Data 执行期间 cloud-final 尚未结束，systemd-analyze 需要等待启动完成
+  for _ in $(seq 1 60); do
+    if systemd-analyze time &> /dev/null; then
+      break
+    fi
+    sleep 2
+  done
+
+  python3 - "${BOOT_PHASES_FILE}" /var/log/boot-report.json "${RUNNER_NAME}" "${PREINSTALLED_RUNNER}" << 'REPORT_EOF' \
+    || echo "Warning: Failed to write boot report"
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+phases_file, report_file, runner_name, preinstalled = sys.argv[1:5]
+
+
+def metadata(path):
+    try:
+        url = f"http://100.100.100.200/latest/meta-data/{path}"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.read().decode("utf-8").strip()
+    except OSError:
+        return ""
+
+
+def command_output(args):
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=30)
+        return result.stdout.strip() if result.returncode == 0 else ""
+    except (subprocess.SubprocessError, OSError):
+        return ""
+
+
+def load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+with open("/proc/uptime", "r", encoding="utf-8") as f:
+    boot_epoch = time.time() - float(f.read().split()[0])
+
+# 各阶段相对内核启动的时间点和耗时（秒）
+phases = []
+previous = 0.0
+with open(phases_file, "r", encoding="utf-8") as f:
+    for line in f:
+        name, _, timestamp = line.strip().partition("\t")
+        if not timestamp:
+            continue
+        at = round(float(timestamp) - boot_epoch, 2)
+        phases.append({"name": name, "at": at, "duration": round(at - previous, 2)})
+        previous = at
+
+blame = []
+for line in command_output(["systemd-analyze", "blame", "--no-pager"]).splitlines()[:15]:
+    parts = line.split()
+    if len(parts) >= 2:
+        blame.append({"unit": parts[-1], "time": " ".join(parts[:-1])})
+
+image_version = load_json("/opt/image-version.json") or {}
+report = {
+    "instance_id": metadata("instance-id"),
+    "instance_type": metadata("instance/instance-type"),
+    "image_id": metadata("image-id"),
+    "zone_id": metadata("zone-id"),
+    "base_image_name": image_version.get("base_image_name", ""),
+    "runner_name": runner_name,
+    "preinstalled_runner": preinstalled == "true",
+    "boot_time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(boot_epoch)),
+    "phases": phases,
+    "time_to_listening": next(
+        (p["at"] for p in phases if p["name"] == "runner_listening"), None
+    ),
+    "systemd_analyze_time": command_output(["systemd-analyze", "time", "--no-pager"]),
+    "systemd_blame": blame,
+    "image_build": load_json("/opt/image-build-report.json"),
+}
+with open(report_file, "w", encoding="utf-8") as f:
+    json.dump(report, f, indent=2)
+os.chmod(report_file, 0o644)
+print(f"Boot report written to {report_file}")
+REPORT_EOF
+) &
+
+# 安装 Spot 中断监听
+# 轮询元数据服务的回收通知；收到通知后停止 BuildKit 和 Docker，让已完成的层缓存落盘
+# （启用构建缓存数据盘时数据盘随实例释放保留），workflow 的 requeue job 会换候选重新排队
+echo "=== Installing spot interruption watcher ==="
+cat > /usr/local/bin/spot-interruption-watcher.sh << 'WATCHER_EOF'
+#!/bin/bash
+
+# Spot 中断监听脚本
+
+METADATA_URL="http://100.100.100.200/latest/meta-data"
+LOG_FILE="/var/log/spot-interruption.log"
+
+log() {
+    echo "[$(date -u +%Y-%m-%dT%H:%M:%SZ)] $*" | tee -a "${LOG_FILE}"
+}
+
+log "Spot interruption watcher started"
+
+while true; do
+    # 未收到回收通知时返回 404
+    TERMINATION_TIME=$(curl -sf --connect-timeout 2 --max-time 5 "${METADATA_URL}/instance/spot/termination-time" || true)
+    if [[ -n "${TERMINATION_TIME}" ]]; then
+        log "Spot interruption notice received, termination time: ${TERMINATION_TIME}"
+        touch /run/spot-interrupted
+
+        # 检查点：停止 BuildKit 与 Docker，确保缓存数据盘上的层缓存一致
+        docker buildx stop builder 2>/dev/null || true
+        systemctl stop docker.socket docker 2>/dev/null || true
+        sync
+        if mountpoint -q /var/lib/docker; then
+            umount /var/lib/docker || log "Warning: Failed to unmount build cache disk"
+        fi
+
+        log "Build cache checkpointed, waiting for reclaim"
+        exit 0
+    fi
+    sleep 5
+done
+WATCHER_EOF
+chmod +x /usr/local/bin/spot-interruption-watcher.sh
+
+cat > /etc/systemd/system/spot-interruption-watcher.service << 'WATCHER_SERVICE_EOF'
+[Unit]
+Description=Spot Instance Interruption Watcher
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=simple
+ExecStart=/usr/local/bin/spot-interruption-watcher.sh
+Restart=on-failure
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+WATCHER_SERVICE_EOF
+
+systemctl daemon-reload
+systemctl enable --now spot-interruption-watcher.service
+
+# Runner 服务启动后再启用备用自毁服务和空闲监听：
+# 二者在没有运行中的 Runner 服务时会立即执行自毁
+# oneshot 服务会一直等到 Runner 退出，不阻塞 User Data
 systemctl enable self-destruct.service
-systemctl start self-destruct.service
+systemctl start --no-block self-destruct.service
+if [[ "${RUNNER_COUNT}" -gt 1 ]]; then
+  systemctl enable --now runner-idle-watchdog.service
+fi
 
 echo "Self-destruct service created, enabled and started"
-echo "Post-job hook configured at ${RUNNER_DIR}/post-job-hook.sh"
+echo "Job completed hook configured at ${RUNNER_DIR}/post-job-hook.sh"
 echo "Instance will be automatically deleted when Runner service stops or job completes"
 
 echo "=== User Data Script Completed ==="